@@ -0,0 +1,112 @@
+"""
+Shared helpers for the benchmark and load-testing tools
+Latency statistics, a concurrent runner and an in-process ASGI driver
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """Throughput and latency percentiles (milliseconds) for one scenario"""
+    ordered = sorted(latencies)
+    total = len(ordered) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+async def run_concurrent(operation: Callable[[int], Awaitable[Any]], total: int, concurrency: int,
+                         is_error: Optional[Callable[[Any], bool]] = None) -> Dict[str, Any]:
+    """Run ``operation(i)`` ``total`` times with at most ``concurrency`` in flight"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                result = await operation(i)
+                failed = bool(is_error and is_error(result))
+            except Exception:
+                failed = True
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def asgi_request(app, method: str, path: str, body: Any = None,
+                       headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+    """Drive a single request through an ASGI app without a server or socket"""
+    raw_path, _, query = path.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+    header_list = [(b"host", b"benchmark")]
+    if body is not None:
+        header_list.append((b"content-type", b"application/json"))
+    header_list.append((b"content-length", str(len(payload)).encode()))
+    for key, value in (headers or {}).items():
+        header_list.append((key.lower().encode(), value.encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": raw_path,
+        "raw_path": raw_path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": header_list,
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # Block like a client that keeps the connection open
+        await asyncio.Event().wait()
+
+    status = 500
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Smart Sonic API
+Drives /api/chat, /api/balance, /api/transactions and /api/generate-qr with a
+weighted request mix at a fixed concurrency (closed loop) or arrival rate (open loop)
+
+By default it starts the RPC simulator and one uvicorn worker as subprocesses,
+so the whole run stays on loopback with no external network.
+
+Usage (from backend/):
+    python -m benchmarks.load_test --app main_demo --sweep 1,4,16,64 --duration 15
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --rate 200 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from benchmarks.harness import summarize
+from benchmarks.rpc_simulator import account_address, transaction_hash
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = {"chat": 60, "balance": 15, "transactions": 15, "qr": 10}
+
+# Weighted chat messages roughly matching what users type into the demo
+CHAT_MESSAGES: List[Tuple[int, str]] = [
+    (25, "show my recent transactions"),
+    (15, "what's my balance?"),
+    (10, "current gas fees"),
+    (10, "show me defi yields"),
+    (10, "generate a payment link"),
+    (10, "hello"),
+    (8, "send 5 S tokens to {peer}"),
+    (6, "{address}"),
+    (6, "{tx_hash}"),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _weighted(choices: List[Tuple[int, Any]], rng: random.Random) -> Any:
+    return rng.choices([value for _, value in choices], weights=[weight for weight, _ in choices])[0]
+
+
+class RequestMix:
+    """Builds (endpoint, method, path, body) tuples from the configured weights"""
+
+    def __init__(self, weights: Dict[str, int], seed: int, blocks: int, txs_per_block: int, accounts: int = 50):
+        self.weights = dict(weights)
+        self.rng = random.Random(seed)
+        self.addresses = [account_address(seed, i) for i in range(accounts)]
+        # Hashes from the most recent blocks so detail lookups hit real transactions
+        self.tx_hashes = [
+            transaction_hash(seed, block, index)
+            for block in range(max(0, blocks - 50), blocks)
+            for index in range(txs_per_block)
+        ] or ["0x" + "00" * 32]
+
+    def drop(self, endpoint: str):
+        self.weights.pop(endpoint, None)
+
+    def next(self) -> Tuple[str, str, str, Optional[Dict[str, Any]]]:
+        endpoint = self.rng.choices(list(self.weights), weights=list(self.weights.values()))[0]
+        return self.build(endpoint)
+
+    def build(self, endpoint: str) -> Tuple[str, str, str, Optional[Dict[str, Any]]]:
+        address = self.rng.choice(self.addresses)
+        if endpoint == "chat":
+            template = _weighted(CHAT_MESSAGES, self.rng)
+            message = template.format(
+                address=address, peer=self.rng.choice(self.addresses), tx_hash=self.rng.choice(self.tx_hashes)
+            )
+            return endpoint, "POST", "/api/chat", {"message": message, "address": address}
+        if endpoint == "balance":
+            return endpoint, "GET", f"/api/balance/{address}", None
+        if endpoint == "transactions":
+            return endpoint, "GET", f"/api/transactions/{address}?limit=10", None
+        amount = self.rng.choice(["", "&amount=1", "&amount=5", "&amount=25"])
+        return endpoint, "POST", f"/api/generate-qr?address={address}{amount}", None
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, mix: RequestMix, timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.mix = mix
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._latencies: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+        self._statuses: Dict[str, Dict[str, int]] = {}
+
+    def _reset(self):
+        self._latencies = {name: [] for name in self.mix.weights}
+        self._errors = {name: 0 for name in self.mix.weights}
+        self._statuses = {name: {} for name in self.mix.weights}
+
+    async def probe(self, session: aiohttp.ClientSession):
+        """Drop endpoints the target app does not serve (main.py and main_demo.py differ)"""
+        for endpoint in list(self.mix.weights):
+            _, method, path, body = self.mix.build(endpoint)
+            async with session.request(method, self.base_url + path, json=body) as response:
+                await response.read()
+                if response.status in (404, 405):
+                    print(f"  target does not serve {endpoint} ({method} {path.split('?')[0]}), skipping it")
+                    self.mix.drop(endpoint)
+        if not self.mix.weights:
+            raise SystemExit("Target serves none of the load-tested endpoints")
+
+    async def _one(self, session: aiohttp.ClientSession, scheduled: Optional[float] = None):
+        endpoint, method, path, body = self.mix.next()
+        # In open-loop mode latency counts from the scheduled send time, so a
+        # backed-up client does not hide server queueing (coordinated omission)
+        started = scheduled if scheduled is not None else time.perf_counter()
+        status = "exception"
+        try:
+            async with session.request(method, self.base_url + path, json=body) as response:
+                await response.read()
+                status = str(response.status)
+                ok = response.status < 400
+        except Exception as e:
+            status = type(e).__name__
+            ok = False
+        self._statuses[endpoint][status] = self._statuses[endpoint].get(status, 0) + 1
+        if ok:
+            self._latencies[endpoint].append(time.perf_counter() - started)
+        else:
+            self._errors[endpoint] += 1
+
+    async def run_closed(self, concurrency: int, duration: float) -> Dict[str, Any]:
+        """``concurrency`` virtual users each sending back-to-back requests"""
+        self._reset()
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+            deadline = time.perf_counter() + duration
+
+            async def user():
+                while time.perf_counter() < deadline:
+                    await self._one(session)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        return self._report(elapsed, {"mode": "concurrency", "concurrency": concurrency})
+
+    async def run_open(self, rate: float, duration: float, max_outstanding: int = 10000) -> Dict[str, Any]:
+        """Poisson arrivals at ``rate`` requests per second regardless of response times"""
+        self._reset()
+        rng = random.Random(0)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+            tasks = set()
+            started = time.perf_counter()
+            next_send = started
+            dropped = 0
+            while next_send - started < duration:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if len(tasks) >= max_outstanding:
+                    dropped += 1
+                else:
+                    task = asyncio.ensure_future(self._one(session, next_send))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                next_send += rng.expovariate(rate)
+            if tasks:
+                await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+        return self._report(elapsed, {"mode": "rate", "target_rps": rate, "client_dropped": dropped})
+
+    def _report(self, elapsed: float, meta: Dict[str, Any]) -> Dict[str, Any]:
+        endpoints = {}
+        all_latencies: List[float] = []
+        all_errors = 0
+        for name in self.mix.weights:
+            endpoints[name] = summarize(self._latencies[name], elapsed, self._errors[name])
+            endpoints[name]["statuses"] = self._statuses[name]
+            all_latencies.extend(self._latencies[name])
+            all_errors += self._errors[name]
+        return dict(meta, overall=summarize(all_latencies, elapsed, all_errors), endpoints=endpoints)
+
+
+def _print_report(report: Dict[str, Any]):
+    label = f"c={report['concurrency']}" if report["mode"] == "concurrency" else f"rate={report['target_rps']}/s"
+    overall = report["overall"]
+    print(f"\n[{label}] {overall['throughput_rps']} rps, p50 {overall['p50_ms']} ms, "
+          f"p99 {overall['p99_ms']} ms, errors {overall['error_rate'] * 100:.2f}%")
+    for name, summary in report["endpoints"].items():
+        print(f"  {name:>12}: {summary['requests']:>6} req  {summary['throughput_rps']:>8} rps  "
+              f"p50 {summary['p50_ms']:>9}  p90 {summary['p90_ms']:>9}  p99 {summary['p99_ms']:>9} ms  "
+              f"err {summary['error_rate'] * 100:.2f}%")
+
+
+class LocalStack:
+    """RPC simulator and a single uvicorn worker running as subprocesses"""
+
+    def __init__(self, app: str, blocks: int, txs_per_block: int, seed: int, latency_ms: float, jitter_ms: float):
+        self.app = app
+        self.blocks = blocks
+        self.txs_per_block = txs_per_block
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.processes: List[subprocess.Popen] = []
+        self.url = ""
+
+    async def __aenter__(self):
+        rpc_port, app_port = _free_port(), _free_port()
+        python = sys.executable
+        self.processes.append(subprocess.Popen(
+            [python, "-m", "benchmarks.rpc_simulator", "--port", str(rpc_port), "--blocks", str(self.blocks),
+             "--txs-per-block", str(self.txs_per_block), "--seed", str(self.seed),
+             "--latency-ms", str(self.latency_ms), "--jitter-ms", str(self.jitter_ms)],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL,
+        ))
+        env = dict(os.environ, SONIC_TESTNET_RPC_URL=f"http://127.0.0.1:{rpc_port}")
+        self.processes.append(subprocess.Popen(
+            [python, "-m", "uvicorn", f"{self.app}:app", "--host", "127.0.0.1", "--port", str(app_port),
+             "--workers", "1", "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=env,
+        ))
+        self.url = f"http://127.0.0.1:{app_port}"
+        await self._wait_ready(f"http://127.0.0.1:{rpc_port}", method="POST")
+        await self._wait_ready(self.url + "/")
+        return self
+
+    async def _wait_ready(self, url: str, method: str = "GET", timeout: float = 60.0):
+        deadline = time.perf_counter() + timeout
+        body = {"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 1} if method == "POST" else None
+        async with aiohttp.ClientSession() as session:
+            while time.perf_counter() < deadline:
+                try:
+                    async with session.request(method, url, json=body) as response:
+                        if response.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"{url} did not become ready")
+
+    async def __aexit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _parse_mix(value: Optional[str]) -> Dict[str, int]:
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown endpoint in --mix: {name} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    mix = RequestMix(_parse_mix(args.mix), args.seed, args.blocks, args.txs_per_block)
+
+    async def drive(url: str) -> List[Dict[str, Any]]:
+        generator = LoadGenerator(url, mix, timeout=args.timeout)
+        async with aiohttp.ClientSession() as session:
+            await generator.probe(session)
+
+        reports = []
+        if args.rate:
+            reports.append(await generator.run_open(args.rate, args.duration))
+            _print_report(reports[-1])
+            return reports
+        levels = [int(level) for level in args.sweep.split(",")] if args.sweep else [args.concurrency]
+        for level in levels:
+            reports.append(await generator.run_closed(level, args.duration))
+            _print_report(reports[-1])
+        return reports
+
+    if args.url:
+        return await drive(args.url)
+    async with LocalStack(args.app, args.blocks, args.txs_per_block, args.seed, args.rpc_latency_ms,
+                          args.rpc_jitter_ms) as stack:
+        print(f"Started {args.app} at {stack.url} against the local RPC simulator")
+        return await drive(stack.url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Smart Sonic API")
+    target = parser.add_argument_group("target")
+    target.add_argument("--url", help="existing server to drive; omit to spawn a local stack")
+    target.add_argument("--app", default="main_demo", choices=["main", "main_demo"], help="app to spawn")
+    target.add_argument("--blocks", type=int, default=500)
+    target.add_argument("--txs-per-block", type=int, default=10)
+    target.add_argument("--seed", type=int, default=1)
+    target.add_argument("--rpc-latency-ms", type=float, default=20.0)
+    target.add_argument("--rpc-jitter-ms", type=float, default=5.0)
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--concurrency", type=int, default=10)
+    load.add_argument("--sweep", help="comma separated concurrency levels, e.g. 1,4,16,64")
+    load.add_argument("--rate", type=float, help="open-loop arrival rate in requests/s (overrides concurrency)")
+    load.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    load.add_argument("--timeout", type=float, default=30.0)
+    load.add_argument("--mix", help="endpoint weights, e.g. chat=6,balance=2,transactions=1,qr=1")
+    load.add_argument("--json", help="write the reports to this file")
+    args = parser.parse_args()
+
+    reports = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
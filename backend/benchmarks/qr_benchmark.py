@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+QR rendering benchmark
+Measures renders per second through QRService at a given concurrency
+
+Usage (from backend/):
+    python -m benchmarks.qr_benchmark --concurrency 32 --requests 2000 --unique 200
+"""
+
+import argparse
+import asyncio
+import time
+
+from services.qr_service import QRService
+
+
+async def run(concurrency: int, total: int, unique: int, image_format: str, cache_size: int) -> dict:
+    service = QRService(max_entries=cache_size)
+    uris = [f"sonic:0x{i:040x}?amount={i % 100}" for i in range(unique)]
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(uris[i % unique])
+
+    latencies = []
+
+    async def worker():
+        while not queue.empty():
+            uri = queue.get_nowait()
+            started = time.perf_counter()
+            await service.generate(uri, image_format=image_format)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    service.shutdown()
+
+    latencies.sort()
+    return {
+        "format": image_format,
+        "concurrency": concurrency,
+        "requests": total,
+        "unique_uris": unique,
+        "elapsed_s": round(elapsed, 3),
+        "renders_per_s": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+        "cache": service.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QR code rendering")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--unique", type=int, default=100, help="distinct payment URIs in the mix")
+    parser.add_argument("--format", choices=["png", "svg"], default="png")
+    parser.add_argument("--cache-size", type=int, default=512, help="use 1 to measure uncached renders")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.concurrency, args.requests, args.unique, args.format, args.cache_size))
+    for key, value in result.items():
+        print(f"{key:>14}: {value}")
+
+
+if __name__ == "__main__":
+    main()
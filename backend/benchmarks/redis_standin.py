@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Local Redis-protocol stand-in
+Speaks enough RESP2 (PING, GET, MGET, SET with EX/PX, DEL, SELECT, AUTH,
+FLUSHDB, DBSIZE) to exercise CACHE_BACKEND=redis without a Redis server
+
+Usage (from backend/):
+    python -m benchmarks.redis_standin --port 6390
+    CACHE_BACKEND=redis CACHE_URL=redis://127.0.0.1:6390/0 uvicorn main:app --workers 4
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RedisStandIn:
+    """In-memory key/value store with expiry behind a RESP2 server"""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, float]] = {}
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _live(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires and expires < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, parts: List[bytes]) -> Any:
+        self.commands += 1
+        command = parts[0].upper()
+        args = parts[1:]
+        if command == b"PING":
+            return b"PONG"
+        if command in (b"SELECT", b"AUTH"):
+            return b"OK"
+        if command == b"GET":
+            return self._live(args[0])
+        if command == b"MGET":
+            return [self._live(key) for key in args]
+        if command == b"SET":
+            expires = 0.0
+            options = [option.upper() for option in args[2:]]
+            if b"EX" in options:
+                expires = time.monotonic() + float(args[2 + options.index(b"EX") + 1])
+            elif b"PX" in options:
+                expires = time.monotonic() + float(args[2 + options.index(b"PX") + 1]) / 1000
+            self.data[args[0]] = (args[1], expires)
+            return b"OK"
+        if command == b"DEL":
+            return sum(1 for key in args if self.data.pop(key, None) is not None)
+        if command == b"FLUSHDB":
+            self.data.clear()
+            return b"OK"
+        if command == b"DBSIZE":
+            return len(self.data)
+        return RuntimeError(f"ERR unknown command '{command.decode()}'")
+
+    @staticmethod
+    def _encode(reply: Any, simple: bool = False) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, Exception):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(RedisStandIn._encode(item) for item in reply)
+        if simple:
+            return b"+%s\r\n" % reply
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                count = int(line[1:-2])
+                parts = []
+                for _ in range(count):
+                    length = int((await reader.readline())[1:-2])
+                    parts.append((await reader.readexactly(length + 2))[:-2])
+                reply = self.execute(parts)
+                writer.write(self._encode(reply, simple=reply in (b"OK", b"PONG")))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 6390):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Redis-protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    async def run():
+        await RedisStandIn().start(args.host, args.port)
+        print(f"Redis stand-in on redis://{args.host}:{args.port}/0")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
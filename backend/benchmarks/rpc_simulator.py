@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Local Sonic JSON-RPC simulator
+Deterministic synthetic chain served in-process (as a SonicRPCClient transport)
+or over HTTP, with configurable latency and jitter
+
+Usage (from backend/):
+    python -m benchmarks.rpc_simulator --blocks 2000 --txs-per-block 20 --port 8545
+    SONIC_TESTNET_RPC_URL=http://127.0.0.1:8545 python main_demo.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from services.log_bloom import logs_bloom
+
+GENESIS_TIMESTAMP = 1_735_689_600  # 2025-01-01T00:00:00Z
+BLOCK_TIME = 0.4
+BASE_GAS_PRICE = 1_000_000_000  # 1 gwei
+CHAIN_ID = 14601
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+TOKEN_DECIMALS = 18
+
+
+def _hash(*parts: Any) -> str:
+    return "0x" + hashlib.sha256(":".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def account_address(seed: int, index: int) -> str:
+    """Address of the ``index``-th simulated account for a seed"""
+    return "0x" + hashlib.sha256(f"account:{seed}:{index}".encode()).hexdigest()[:40]
+
+
+def transaction_hash(seed: int, block: int, index: int) -> str:
+    """Hash of the ``index``-th transaction in a simulated block"""
+    return _hash("tx", seed, block, index)
+
+
+def token_address(seed: int, index: int) -> str:
+    """Address of the ``index``-th simulated ERC-20 contract"""
+    return "0x" + hashlib.sha256(f"token:{seed}:{index}".encode()).hexdigest()[:40]
+
+
+def decode_raw_transaction(raw: str) -> Dict[str, Any]:
+    """Sender, nonce, gas and call fields of a signed legacy, EIP-2930 or EIP-1559 transaction"""
+    import rlp
+    from eth_account import Account
+    from web3 import Web3
+
+    data = bytes.fromhex(raw[2:] if raw.startswith("0x") else raw)
+    if data[0] >= 0xc0:
+        nonce, gas_price, gas, to, value, payload = rlp.decode(data)[:6]
+    elif data[0] == 1:
+        _, nonce, gas_price, gas, to, value, payload = rlp.decode(data[1:])[:7]
+    else:
+        _, nonce, _, gas_price, gas, to, value, payload = rlp.decode(data[1:])[:8]
+    number = lambda b: int.from_bytes(b, "big")
+    return {
+        "hash": "0x" + bytes(Web3.keccak(data)).hex(),
+        "from": Account.recover_transaction(data).lower(),
+        "nonce": number(nonce),
+        "gasPrice": number(gas_price),
+        "gas": number(gas),
+        "to": "0x" + to.hex() if to else None,
+        "value": number(value),
+        "input": "0x" + payload.hex(),
+    }
+
+
+def _word(value: Any) -> str:
+    """32-byte ABI word for an address or integer, without 0x"""
+    if isinstance(value, str):
+        return value[2:].rjust(64, "0")
+    return f"{value:064x}"
+
+
+class SonicChainSimulator:
+    """Deterministic synthetic chain answering the JSON-RPC methods the backend uses.
+
+    The same ``seed`` always produces the same accounts, blocks, transactions and
+    receipts, so benchmark runs on different commits see identical workloads.
+    ``latency_ms``/``jitter_ms`` are applied per HTTP round trip (a batch pays once).
+
+    Chain objects are stored pre-serialized and decoded on every request, so callers
+    get fresh objects they may mutate and pay the same JSON decode cost as over HTTP.
+    """
+
+    def __init__(self, blocks: int = 1000, txs_per_block: int = 10, accounts: int = 50,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 1,
+                 failure_rate: float = 0.0, tokens: int = 4, max_log_range: int = 0, max_logs: int = 0,
+                 get_logs: bool = True, max_batch: int = 0, block_receipts: bool = True):
+        self.blocks = blocks
+        self.txs_per_block = txs_per_block
+        self.seed = seed
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.failure_rate = failure_rate
+        # eth_getLogs limits like public endpoints enforce (0 = unlimited)
+        self.max_log_range = max_log_range
+        self.max_logs = max_logs
+        # Some public nodes disable eth_getLogs entirely
+        self.get_logs = get_logs
+        # Batch size cap (0 = unlimited); larger batches get one error object back
+        self.max_batch = max_batch
+        self.block_receipts = block_receipts
+        self.accounts = [account_address(seed, i) for i in range(accounts)]
+        self.tokens = [token_address(seed, i) for i in range(tokens)]
+
+        self._rng = random.Random(seed)
+        self._blocks: List[str] = []
+        self._blocks_light: List[str] = []
+        self._block_tx_hashes: List[List[str]] = []
+        self._block_logs: List[List[Dict[str, Any]]] = []
+        self._transactions: Dict[str, str] = {}
+        self._receipts: Dict[str, str] = {}
+        self._balances: Dict[str, int] = {}
+        self._nonces: Counter = Counter()
+        self._pool: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self.calls: Counter = Counter()
+        self.round_trips = 0
+        self._generate()
+
+    # Chain generation
+
+    def _generate(self):
+        rng = random.Random(self.seed)
+        for address in self.accounts:
+            self._balances[address] = rng.randrange(10**18, 10**22)
+
+        for number in range(self.blocks):
+            block_hash = _hash("block", self.seed, number)
+            txs = []
+            logs = []
+            gas_used = 0
+            for index in range(self.txs_per_block):
+                sender = rng.choice(self.accounts)
+                recipient = rng.choice(self.accounts)
+                is_transfer = rng.random() < 0.8
+                tx_hash = transaction_hash(self.seed, number, index)
+                gas_price = BASE_GAS_PRICE + rng.randrange(0, BASE_GAS_PRICE)
+                # Contract calls are ERC-20 transfer(recipient, amount) on a token derived from the hash
+                token = self.tokens[int(tx_hash[-4:], 16) % len(self.tokens)] if self.tokens else recipient
+                amount = int(tx_hash[2:18], 16) % 10**21
+                tx = {
+                    "hash": tx_hash,
+                    "blockHash": block_hash,
+                    "blockNumber": hex(number),
+                    "transactionIndex": hex(index),
+                    "from": sender,
+                    "to": recipient if is_transfer else token,
+                    "value": hex(rng.randrange(10**15, 10**19) if is_transfer else 0),
+                    "gas": hex(21000 if is_transfer else 120000),
+                    "gasPrice": hex(gas_price),
+                    "nonce": hex(number * self.txs_per_block + index),
+                    "input": "0x" if is_transfer else "0xa9059cbb" + _word(recipient) + _word(amount),
+                }
+                receipt_gas = 21000 if is_transfer else rng.randrange(40000, 120000)
+                gas_used += receipt_gas
+                succeeded = rng.random() > 0.02
+                tx_logs = []
+                if not is_transfer and succeeded and self.tokens:
+                    tx_logs.append({
+                        "address": token,
+                        "topics": [TRANSFER_TOPIC, "0x" + _word(sender), "0x" + _word(recipient)],
+                        "data": "0x" + _word(amount),
+                        "blockNumber": hex(number),
+                        "blockHash": block_hash,
+                        "transactionHash": tx_hash,
+                        "transactionIndex": hex(index),
+                        "logIndex": hex(len(logs)),
+                        "removed": False,
+                    })
+                    logs.extend(tx_logs)
+                self._transactions[tx_hash] = json.dumps(tx)
+                self._receipts[tx_hash] = json.dumps({
+                    "transactionHash": tx_hash,
+                    "blockHash": block_hash,
+                    "blockNumber": hex(number),
+                    "transactionIndex": hex(index),
+                    "from": sender,
+                    "to": tx["to"],
+                    "gasUsed": hex(receipt_gas),
+                    "effectiveGasPrice": hex(gas_price),
+                    "status": "0x1" if succeeded else "0x0",
+                    "logs": tx_logs,
+                })
+                txs.append(tx)
+            self._seal(number, txs, logs, gas_used)
+
+    def _seal(self, number: int, txs: List[Dict[str, Any]], logs: List[Dict[str, Any]], gas_used: int):
+        block = {
+            "number": hex(number),
+            "hash": _hash("block", self.seed, number),
+            "parentHash": _hash("block", self.seed, number - 1) if number else "0x" + "00" * 32,
+            "timestamp": hex(int(GENESIS_TIMESTAMP + number * BLOCK_TIME)),
+            "gasLimit": hex(30_000_000),
+            "gasUsed": hex(gas_used),
+            "baseFeePerGas": hex(BASE_GAS_PRICE),
+            "miner": self.accounts[number % len(self.accounts)],
+            "logsBloom": logs_bloom(logs),
+            "transactions": txs,
+        }
+        tx_hashes = [tx["hash"] for tx in txs]
+        self._block_tx_hashes.append(tx_hashes)
+        self._block_logs.append(logs)
+        self._blocks.append(json.dumps(block))
+        self._blocks_light.append(json.dumps(dict(block, transactions=tx_hashes)))
+
+    # Mempool and mining, for clients that send signed transactions
+
+    def pending_nonce(self, sender: str) -> int:
+        nonce = self._nonces[sender]
+        while nonce in self._pool.get(sender, {}):
+            nonce += 1
+        return nonce
+
+    def mine(self, max_txs: int = 1000) -> int:
+        """Seal a block from executable pool transactions (consecutive nonces per sender)"""
+        number = self.blocks
+        block_hash = _hash("block", self.seed, number)
+        txs = []
+        gas_used = 0
+        for sender in list(self._pool):
+            queued = self._pool[sender]
+            while self._nonces[sender] in queued and len(txs) < max_txs:
+                pending = queued.pop(self._nonces[sender])
+                self._nonces[sender] += 1
+                gas = 21000 if pending["input"] in ("0x", "") else min(pending["gas"], 65000)
+                cost = pending["value"] + gas * pending["gasPrice"]
+                succeeded = self._balances.get(sender, 0) >= cost
+                if succeeded:
+                    self._balances[sender] -= cost
+                    self._balances[pending["to"]] = self._balances.get(pending["to"], 0) + pending["value"]
+                tx = {
+                    "hash": pending["hash"],
+                    "blockHash": block_hash,
+                    "blockNumber": hex(number),
+                    "transactionIndex": hex(len(txs)),
+                    "from": sender,
+                    "to": pending["to"],
+                    "value": hex(pending["value"]),
+                    "gas": hex(pending["gas"]),
+                    "gasPrice": hex(pending["gasPrice"]),
+                    "nonce": hex(pending["nonce"]),
+                    "input": pending["input"],
+                }
+                self._transactions[tx["hash"]] = json.dumps(tx)
+                self._receipts[tx["hash"]] = json.dumps({
+                    "transactionHash": tx["hash"],
+                    "blockHash": block_hash,
+                    "blockNumber": hex(number),
+                    "transactionIndex": tx["transactionIndex"],
+                    "from": sender,
+                    "to": tx["to"],
+                    "gasUsed": hex(gas),
+                    "effectiveGasPrice": tx["gasPrice"],
+                    "status": "0x1" if succeeded else "0x0",
+                    "logs": [],
+                })
+                self._pending.pop(tx["hash"], None)
+                gas_used += gas
+                txs.append(tx)
+            if not queued:
+                del self._pool[sender]
+        self._seal(number, txs, [], gas_used)
+        self.blocks += 1
+        return number
+
+    async def mine_every(self, interval: float):
+        """Produce a block every ``interval`` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            self.mine()
+
+    @property
+    def head(self) -> int:
+        return self.blocks - 1
+
+    def sample_address(self, index: int = 0) -> str:
+        return self.accounts[index % len(self.accounts)]
+
+    def sample_tx_hash(self, index: int = 0) -> str:
+        txs = self._block_tx_hashes[self.head - (index % self.blocks)]
+        return txs[index % len(txs)] if txs else _hash("missing", index)
+
+    # JSON-RPC handling
+
+    async def __call__(self, payload: Any) -> Any:
+        """Transport entry point: one simulated round trip per payload"""
+        self.round_trips += 1
+        delay = self.latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if isinstance(payload, list):
+            if self.max_batch and len(payload) > self.max_batch:
+                self.calls["rejected_batch"] += 1
+                return {"jsonrpc": "2.0", "id": None,
+                        "error": {"code": -32600, "message": f"batch exceeds {self.max_batch} requests"}}
+            return [self._handle(item) for item in payload]
+        return self._handle(payload)
+
+    def _handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        method = request.get("method")
+        params = request.get("params") or []
+        self.calls[method] += 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            response["error"] = {"code": -32603, "message": "simulated failure"}
+            return response
+
+        handler = getattr(self, "_rpc_" + str(method), None)
+        if (method == "eth_getLogs" and not self.get_logs) or (
+                method == "eth_getBlockReceipts" and not self.block_receipts):
+            handler = None
+        if handler is None:
+            response["error"] = {"code": -32601, "message": f"method {method} not supported by simulator"}
+            return response
+        try:
+            response["result"] = handler(*params)
+        except Exception as e:
+            response["error"] = {"code": -32602, "message": str(e)}
+        return response
+
+    def _block_number(self, tag: Any) -> Optional[int]:
+        if tag in ("latest", "pending", "safe", "finalized", None):
+            return self.head
+        if tag == "earliest":
+            return 0
+        number = int(tag, 16)
+        return number if 0 <= number <= self.head else None
+
+    def _rpc_eth_chainId(self):
+        return hex(CHAIN_ID)
+
+    def _rpc_net_version(self):
+        return str(CHAIN_ID)
+
+    def _rpc_eth_blockNumber(self):
+        return hex(self.head)
+
+    def _rpc_eth_gasPrice(self):
+        return hex(BASE_GAS_PRICE)
+
+    def _rpc_eth_getBalance(self, address: str, tag: Any = "latest"):
+        return hex(self._balances.get(address.lower(), 0))
+
+    def _rpc_eth_getTransactionCount(self, address: str, tag: Any = "latest"):
+        address = address.lower()
+        return hex(self.pending_nonce(address) if tag == "pending" else self._nonces[address])
+
+    def _rpc_eth_sendRawTransaction(self, raw: str):
+        tx = decode_raw_transaction(raw)
+        sender, nonce = tx["from"], tx["nonce"]
+        if tx["hash"] in self._pending or tx["hash"] in self._transactions:
+            raise ValueError("already known")
+        if nonce < self._nonces[sender]:
+            raise ValueError(f"nonce too low: next nonce {self._nonces[sender]}, tx nonce {nonce}")
+        queued = self._pool.setdefault(sender, {})
+        replaced = queued.get(nonce)
+        if replaced is not None:
+            if tx["gasPrice"] * 10 < replaced["gasPrice"] * 11:
+                raise ValueError("replacement transaction underpriced")
+            self._pending.pop(replaced["hash"], None)
+        if self._balances.get(sender, 0) < tx["value"] + tx["gas"] * tx["gasPrice"]:
+            raise ValueError("insufficient funds for gas * price + value")
+        queued[nonce] = tx
+        self._pending[tx["hash"]] = tx
+        return tx["hash"]
+
+    def fund(self, address: str, amount: int = 10**24):
+        """Give a (signer) address a balance so its transactions are accepted"""
+        self._balances[address.lower()] = self._balances.get(address.lower(), 0) + amount
+
+    def _rpc_eth_getBlockByNumber(self, tag: Any, full: bool = False):
+        number = self._block_number(tag)
+        if number is None:
+            return None
+        return json.loads(self._blocks[number] if full else self._blocks_light[number])
+
+    def _rpc_eth_getTransactionByHash(self, tx_hash: str):
+        raw = self._transactions.get(tx_hash.lower())
+        if raw:
+            return json.loads(raw)
+        pending = self._pending.get(tx_hash.lower())
+        if pending is None:
+            return None
+        return {
+            "hash": pending["hash"], "blockHash": None, "blockNumber": None, "transactionIndex": None,
+            "from": pending["from"], "to": pending["to"], "value": hex(pending["value"]),
+            "gas": hex(pending["gas"]), "gasPrice": hex(pending["gasPrice"]), "nonce": hex(pending["nonce"]),
+            "input": pending["input"],
+        }
+
+    def _rpc_eth_getTransactionReceipt(self, tx_hash: str):
+        raw = self._receipts.get(tx_hash.lower())
+        return json.loads(raw) if raw else None
+
+    def _rpc_eth_getBlockReceipts(self, tag: Any):
+        number = self._block_number(tag)
+        if number is None:
+            return None
+        return [json.loads(self._receipts[tx_hash]) for tx_hash in self._block_tx_hashes[number]]
+
+    def _rpc_eth_estimateGas(self, tx: Dict[str, Any], *args):
+        data = tx.get("data") or tx.get("input") or "0x"
+        return hex(21000 if data in ("0x", "") else 65000)
+
+    def _rpc_eth_getCode(self, address: str, tag: Any = "latest"):
+        # Tokens are the only contracts; a stand-in body is enough for code checks
+        return "0x6080604052" if address.lower() in self.tokens else "0x"
+
+    def _rpc_eth_call(self, tx: Dict[str, Any], *args):
+        data = tx.get("data") or tx.get("input") or "0x"
+        to = (tx.get("to") or "").lower()
+        if to in self.tokens:
+            if data.startswith("0x313ce567"):  # decimals()
+                return "0x" + _word(TOKEN_DECIMALS)
+            if data.startswith("0x95d89b41"):  # symbol()
+                symbol = f"TK{self.tokens.index(to)}".encode()
+                return "0x" + _word(32) + _word(len(symbol)) + symbol.hex().ljust(64, "0")
+        # Every other view returns an ABI-encoded zero (false / 0 / address(0))
+        return "0x" + "00" * 32
+
+    def _rpc_eth_getLogs(self, criteria: Dict[str, Any]):
+        start = self._block_number(criteria.get("fromBlock", "latest"))
+        end = self._block_number(criteria.get("toBlock", "latest"))
+        if start is None or end is None:
+            return []
+        if self.max_log_range and end - start + 1 > self.max_log_range:
+            raise ValueError(f"block range too large, maximum is {self.max_log_range} blocks")
+        addresses = criteria.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {a.lower() for a in addresses} if addresses else None
+        topics = criteria.get("topics") or []
+        matched = []
+        for number in range(start, end + 1):
+            for log in self._block_logs[number]:
+                if addresses is not None and log["address"] not in addresses:
+                    continue
+                if any(
+                    wanted is not None and (i >= len(log["topics"]) or
+                                            log["topics"][i] not in (wanted if isinstance(wanted, list) else [wanted]))
+                    for i, wanted in enumerate(topics)
+                ):
+                    continue
+                matched.append(dict(log))
+                if self.max_logs and len(matched) > self.max_logs:
+                    raise ValueError(f"query returned more than {self.max_logs} results")
+        return matched
+
+    def reset_counters(self):
+        self.calls.clear()
+        self.round_trips = 0
+
+
+async def serve(simulator: SonicChainSimulator, host: str = "127.0.0.1", port: int = 8545):
+    """Serve the simulator over HTTP so sync Web3 clients and other processes can use it"""
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        payload = await request.json()
+        return web.json_response(await simulator(payload))
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Sonic JSON-RPC simulator")
+    parser.add_argument("--blocks", type=int, default=1000)
+    parser.add_argument("--txs-per-block", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-log-range", type=int, default=0, help="reject wider eth_getLogs ranges")
+    parser.add_argument("--max-logs", type=int, default=0, help="reject eth_getLogs with more results")
+    parser.add_argument("--no-get-logs", action="store_true", help="answer eth_getLogs with method not found")
+    parser.add_argument("--no-block-receipts", action="store_true",
+                        help="answer eth_getBlockReceipts with method not found")
+    parser.add_argument("--max-batch", type=int, default=0, help="reject JSON-RPC batches with more requests")
+    parser.add_argument("--block-time", type=float, default=0.0,
+                        help="mine sent transactions into a new block every N seconds (0 = never)")
+    parser.add_argument("--fund", action="append", default=[], help="address to give a balance for sending")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    args = parser.parse_args()
+
+    simulator = SonicChainSimulator(args.blocks, args.txs_per_block, args.accounts,
+                                    args.latency_ms, args.jitter_ms, args.seed,
+                                    max_log_range=args.max_log_range, max_logs=args.max_logs,
+                                    get_logs=not args.no_get_logs, max_batch=args.max_batch,
+                                    block_receipts=not args.no_block_receipts)
+    for address in args.fund:
+        simulator.fund(address)
+
+    async def run():
+        await serve(simulator, args.host, args.port)
+        if args.block_time > 0:
+            asyncio.ensure_future(simulator.mine_every(args.block_time))
+        print(f"Sonic RPC simulator on http://{args.host}:{args.port} "
+              f"({args.blocks} blocks, sample address {simulator.sample_address()})")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
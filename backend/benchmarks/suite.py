@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Offline performance suite
+Runs the transaction service and the FastAPI endpoints against the local
+JSON-RPC simulator and stores throughput/latency percentiles as JSON
+
+Usage (from backend/):
+    python -m benchmarks.suite --latency-ms 20 --jitter-ms 5
+    python -m benchmarks.suite --compare benchmarks/results/<older-commit>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+from benchmarks.harness import asgi_request, run_concurrent
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.rpc_client import get_rpc_client
+from services.transaction_service import TransactionService
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+COMPARED_FIELDS = ("throughput_rps", "p50_ms", "p90_ms", "p99_ms", "rpc_calls_per_op")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+def build_scenarios(simulator: SonicChainSimulator) -> Dict[str, Callable[[int], Any]]:
+    """Map scenario name to an operation taking the iteration index"""
+    import main
+    import main_demo
+
+    service = TransactionService()
+
+    async def history(i):
+        result = await service.get_transaction_history(simulator.sample_address(i), 10)
+        return result["success"]
+
+    async def details(i):
+        result = await service.get_transaction_details(simulator.sample_tx_hash(i))
+        return result["success"]
+
+    async def balance(i):
+        status, _ = await asgi_request(main.app, "GET", f"/api/balance/{simulator.sample_address(i)}")
+        return status == 200
+
+    async def chat(i):
+        body = {"message": "show my recent transactions", "address": simulator.sample_address(i)}
+        status, _ = await asgi_request(main_demo.app, "POST", "/api/chat", body)
+        return status == 200
+
+    return {
+        "transaction_history": history,
+        "transaction_details": details,
+        "api_balance": balance,
+        "api_chat": chat,
+    }
+
+
+async def run_suite(args) -> Dict[str, Any]:
+    simulator = SonicChainSimulator(
+        blocks=args.blocks, txs_per_block=args.txs_per_block, accounts=args.accounts,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed,
+    )
+    client = get_rpc_client("testnet")
+    client.transport = simulator
+
+    scenarios = build_scenarios(simulator)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+
+    results = {}
+    for name in selected:
+        operation = scenarios[name]
+        # Warm imports, pools and caches so the first timed request is not an outlier
+        await run_concurrent(operation, min(args.warmup, args.requests), args.concurrency)
+        simulator.reset_counters()
+        summary = await run_concurrent(operation, args.requests, args.concurrency, is_error=lambda ok: not ok)
+        summary["rpc_calls_per_op"] = round(sum(simulator.calls.values()) / args.requests, 2)
+        summary["round_trips_per_op"] = round(simulator.round_trips / args.requests, 2)
+        summary["rpc_calls"] = dict(simulator.calls)
+        results[name] = summary
+        print(f"{name:>22}: {summary['throughput_rps']:>9} rps  p50 {summary['p50_ms']:>9} ms  "
+              f"p99 {summary['p99_ms']:>9} ms  rpc/op {summary['rpc_calls_per_op']}")
+
+    return {
+        "commit": _git_commit(),
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "blocks": args.blocks, "txs_per_block": args.txs_per_block, "accounts": args.accounts,
+            "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "seed": args.seed,
+            "requests": args.requests, "concurrency": args.concurrency,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    print(f"\nComparison against {baseline.get('commit', '?')} ({baseline.get('created', '?')})")
+    for name, summary in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        deltas = []
+        for field in COMPARED_FIELDS:
+            old, new = previous.get(field), summary.get(field)
+            if old:
+                deltas.append(f"{field} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+        print(f"  {name}: " + "; ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite against the RPC simulator")
+    parser.add_argument("--blocks", type=int, default=500)
+    parser.add_argument("--txs-per-block", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--scenarios", help="comma separated subset, e.g. api_balance,api_chat")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_suite(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
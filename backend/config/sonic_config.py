@@ -4,7 +4,7 @@ Official network details and RPC endpoints
 """
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Sequence
 
 # Sonic Testnet Configuration
 SONIC_TESTNET = {
@@ -12,6 +12,8 @@ SONIC_TESTNET = {
     "name": "Sonic Testnet Network",
     "network": "sonic-testnet",
     "rpc_url": os.getenv("SONIC_TESTNET_RPC_URL", "https://rpc.testnet.soniclabs.com"),
+    # Optional comma separated pool; the first entry defaults to rpc_url
+    "rpc_urls": os.getenv("SONIC_TESTNET_RPC_URLS", ""),
     "ws_url": os.getenv("SONIC_TESTNET_WS_URL", "wss://rpc.testnet.soniclabs.com"),
     "explorer_url": "https://testnet.sonicscan.org",
     "explorer_api": "https://testnet.sonicscan.org/api",
@@ -40,6 +42,8 @@ SONIC_MAINNET = {
     "name": "Sonic Mainnet",
     "network": "sonic-mainnet",
     "rpc_url": os.getenv("SONIC_MAINNET_RPC_URL", "https://rpc.soniclabs.com"),
+    # Optional comma separated pool; the first entry defaults to rpc_url
+    "rpc_urls": os.getenv("SONIC_MAINNET_RPC_URLS", ""),
     "ws_url": os.getenv("SONIC_MAINNET_WS_URL", "wss://rpc.soniclabs.com"),
     "explorer_url": "https://soniclabs.com",
     "explorer_api": "https://soniclabs.com/api",
@@ -81,11 +85,42 @@ def get_network_config(network: str = "testnet") -> Dict[str, Any]:
     else:
         raise ValueError(f"Unknown network: {network}")
 
+# Canonical names accepted by the networks= query parameter
+SUPPORTED_NETWORKS = ["testnet", "mainnet"]
+
+def parse_networks(networks: Optional[Sequence[str]] = None, default: str = "testnet") -> List[str]:
+    """
+    Canonical network names from a networks= query parameter
+
+    Args:
+        networks: Repeated and/or comma separated values ("testnet,mainnet")
+        default: Network used when none are given
+
+    Returns:
+        De-duplicated canonical names in request order (ValueError for unknown ones)
+    """
+    names = [name.strip() for value in (networks or []) for name in value.split(",") if name.strip()] or [default]
+    canonical: List[str] = []
+    for name in names:
+        network = "testnet" if get_network_config(name) is SONIC_TESTNET else "mainnet"
+        if network not in canonical:
+            canonical.append(network)
+    return canonical
+
+# Networks whose background pipelines (head follower, indexers) run; the rest are read on demand
+INDEXED_NETWORKS = parse_networks([os.getenv("INDEXED_NETWORKS", "")])
+
 def get_rpc_url(network: str = "testnet") -> str:
     """Get RPC URL for specified network"""
     config = get_network_config(network)
     return config["rpc_url"]
 
+def get_rpc_urls(network: str = "testnet") -> List[str]:
+    """Get every configured RPC endpoint for a network (at least the primary rpc_url)"""
+    config = get_network_config(network)
+    urls = [url.strip() for url in config.get("rpc_urls", "").split(",") if url.strip()]
+    return urls or [config["rpc_url"]]
+
 def get_ws_url(network: str = "testnet") -> str:
     """Get WebSocket URL for specified network"""
     config = get_network_config(network)
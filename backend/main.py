@@ -1,27 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
 import json
 import asyncio
-import aiohttp
+import os
 from datetime import datetime
 import hashlib
-import qrcode
-import io
-import base64
-from PIL import Image
+from services.qr_service import QRService, SUPPORTED_FORMATS, MIN_BOX_SIZE, MAX_BOX_SIZE
+from services.tracing import tracer, TracingMiddleware
+from services.loop_monitor import loop_monitor, loop_monitor_enabled
+from services.metrics import registry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from services.rpc_client import RPCError, get_rpc_client, start_background_tasks as start_rpc_background_tasks, close_clients as close_rpc_clients
+from services.circuit_breaker import CircuitOpenError, circuit_status, stale_reader
+from services.admission import AdmissionController, AdmissionMiddleware
+from services.cache import get_cache, cache_status, close_cache
+from services.leader import leader
+from services.chain_head import get_head_follower
+from services.multi_network import gather_networks
+from config.sonic_config import INDEXED_NETWORKS, parse_networks
 
 app = FastAPI(title="Astra AI - Sonic Blockchain Agent", version="1.0.0")
 
-# CORS middleware
+# Chat fans out into many RPC calls and an LLM call; bound it and shed overload early
+chat_admission = AdmissionController("chat")
+app.add_middleware(AdmissionMiddleware, controllers={"/api/chat": chat_admission})
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+# CORS middleware (added last, so it is outermost and shed 503s carry CORS headers too)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend back off on shed chat requests
+    expose_headers=["Retry-After"],
 )
 
 class ChatRequest(BaseModel):
@@ -47,46 +63,133 @@ class NFTRequest(BaseModel):
 SONIC_TESTNET_RPC = "https://rpc.testnet.soniclabs.com"
 SONIC_EXPLORER = "https://testnet.sonicscan.org"
 
+rpc_client = get_rpc_client("testnet")
+
+# Display names the balance endpoint has always returned
+NETWORK_NAMES = {"testnet": "Sonic Testnet", "mainnet": "Sonic Mainnet"}
+
+async def fetch_balance(address: str, network: str = "testnet") -> Dict[str, Any]:
+    """Balance on one network through that network's pooled client, breaker and cache namespace"""
+    client = get_rpc_client(network)
+    # Last known good balances, served marked stale while the RPC is failing
+    reader = stale_reader(network, "eth_getBalance")
+    # Balances shared across workers for a couple of seconds (about a few blocks)
+    cache = get_cache(f"balances:{network}", default_ttl=float(os.getenv("BALANCE_CACHE_TTL", "2")))
+    result, stale_age = await reader.get(
+        address, lambda: cache.get_or_fetch(address.lower(), lambda: client.call("eth_getBalance", [address, "latest"]))
+    )
+
+    # Convert hex to decimal and then to ether
+    balance_wei = int(result, 16)
+    balance_ether = balance_wei / 10**18
+
+    response = {
+        "address": address,
+        "balance": str(balance_ether),
+        "balance_wei": str(balance_wei),
+        "network": NETWORK_NAMES[network],
+        "timestamp": datetime.now().isoformat(),
+        "stale": stale_age is not None,
+    }
+    if stale_age is not None:
+        response["stale_age_seconds"] = round(stale_age, 1)
+    return response
+
+# QR rendering runs in a worker pool with an LRU cache in front of it
+qr_service = QRService()
+
+@app.on_event("startup")
+async def start_background_monitors():
+    if loop_monitor_enabled():
+        loop_monitor.start()
+    start_rpc_background_tasks()
+    # Pipelines below run in one worker only; the rest read their output from the cache
+    for network in INDEXED_NETWORKS:
+        leader.register(f"chain_head:{network}", get_head_follower(network).run)
+    leader.start()
+
+@app.on_event("shutdown")
+async def stop_background_monitors():
+    await loop_monitor.stop()
+    await leader.stop()
+    await close_rpc_clients()
+    await close_cache()
+
 @app.get("/")
 async def root():
     return {"message": "Astra AI Backend - Sonic Blockchain Agent is running! 🚀"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/admission", include_in_schema=False)
+async def admission_status():
+    """In-flight, queued and shed counts for admission-controlled routes"""
+    return {"/api/chat": chat_admission.status()}
+
+@app.get("/debug/leader", include_in_schema=False)
+async def leader_status():
+    """Which worker runs the background jobs"""
+    return leader.status()
+
+@app.get("/debug/rpc-pool", include_in_schema=False)
+async def rpc_pool_status():
+    """Per-endpoint health, EWMA latency and traffic for pooled RPC clients"""
+    client = get_rpc_client("testnet")
+    if client.pool:
+        return client.pool.status()
+    return {"endpoints": [{"url": client.rpc_url, "pooled": False, "limiter": client.limiter.status()}]}
+
+@app.get("/debug/cache", include_in_schema=False)
+async def cache_info():
+    """Active cache backend and namespaces (hit rates are in /metrics)"""
+    return cache_status()
+
+@app.get("/debug/circuits", include_in_schema=False)
+async def circuits():
+    """Circuit breaker state and known good values per RPC endpoint/method"""
+    return circuit_status()
+
+@app.get("/debug/traces", include_in_schema=False)
+async def slowest_traces(limit: int = 10):
+    """Span trees of the slowest recently sampled requests"""
+    return {"sample_rate": tracer.sample_rate, "traces": tracer.slowest(limit)}
+
 @app.get("/api/balance/{address}")
-async def get_balance(address: str):
-    """Get real balance from Sonic Testnet"""
+async def get_balance(address: str, networks: Optional[List[str]] = Query(None)):
+    """Get real balance from Sonic Testnet, or from every network in networks= concurrently"""
     try:
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "eth_getBalance",
-                "params": [address, "latest"],
-                "id": 1
-            }
-            
-            async with session.post(SONIC_TESTNET_RPC, json=payload) as response:
-                data = await response.json()
-                
-                if "result" in data:
-                    # Convert hex to decimal and then to ether
-                    balance_wei = int(data["result"], 16)
-                    balance_ether = balance_wei / 10**18
-                    
-                    return {
-                        "address": address,
-                        "balance": str(balance_ether),
-                        "balance_wei": str(balance_wei),
-                        "network": "Sonic Testnet",
-                        "timestamp": datetime.now().isoformat()
-                    }
-                else:
-                    raise HTTPException(status_code=400, detail="Failed to fetch balance")
-                    
+        selected = parse_networks(networks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(selected) > 1:
+        return {
+            "address": address,
+            "networks": selected,
+            "balances": await gather_networks(selected, lambda network: fetch_balance(address, network), "balance"),
+            "timestamp": datetime.now().isoformat(),
+        }
+
+    try:
+        return await fetch_balance(address, selected[0])
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail="Sonic RPC is unavailable, try again shortly",
+                            headers={"Retry-After": str(max(1, int(e.retry_after)))})
+    except RPCError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to fetch balance: {e.message}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching balance: {str(e)}")
 
 @app.post("/api/generate-qr")
-async def generate_qr_code(address: str, amount: Optional[str] = None):
-    """Generate QR code for payment"""
+async def generate_qr_code(address: str, amount: Optional[str] = None, size: int = 10, image_format: str = "png"):
+    """Generate QR code for payment (PNG by default, SVG with image_format=svg)"""
+    if image_format not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported image_format, use one of: {', '.join(SUPPORTED_FORMATS)}")
+    if not MIN_BOX_SIZE <= size <= MAX_BOX_SIZE:
+        raise HTTPException(status_code=400, detail=f"size must be between {MIN_BOX_SIZE} and {MAX_BOX_SIZE}")
+
     try:
         # Create payment URI
         if amount:
@@ -94,24 +197,15 @@ async def generate_qr_code(address: str, amount: Optional[str] = None):
         else:
             payment_uri = f"sonic:{address}"
         
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(payment_uri)
-        qr.make(fit=True)
-        
-        # Create QR code image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+        # Render (or reuse) the QR code without blocking the event loop
+        qr_code = await qr_service.generate(payment_uri, box_size=size, image_format=image_format)
         
         return {
-            "qr_code": f"data:image/png;base64,{img_str}",
+            "qr_code": qr_code,
             "payment_uri": payment_uri,
             "address": address,
-            "amount": amount
+            "amount": amount,
+            "format": image_format
         }
         
     except Exception as e:
@@ -121,35 +215,24 @@ async def generate_qr_code(address: str, amount: Optional[str] = None):
 async def get_transaction(tx_hash: str):
     """Get transaction details from Sonic Testnet"""
     try:
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "eth_getTransactionByHash",
-                "params": [tx_hash],
-                "id": 1
-            }
-            
-            async with session.post(SONIC_TESTNET_RPC, json=payload) as response:
-                data = await response.json()
-                
-                if "result" in data and data["result"]:
-                    tx = data["result"]
-                    return {
-                        "hash": tx["hash"],
-                        "from": tx["from"],
-                        "to": tx["to"],
-                        "value": str(int(tx["value"], 16) / 10**18),
-                        "gas": str(int(tx["gas"], 16)),
-                        "gasPrice": str(int(tx["gasPrice"], 16)),
-                        "blockNumber": tx.get("blockNumber"),
-                        "status": "confirmed" if tx.get("blockNumber") else "pending"
-                    }
-                else:
-                    raise HTTPException(status_code=404, detail="Transaction not found")
-                    
+        tx = await rpc_client.call("eth_getTransactionByHash", [tx_hash])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching transaction: {str(e)}")
 
+    if not tx:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+
+    return {
+        "hash": tx["hash"],
+        "from": tx["from"],
+        "to": tx["to"],
+        "value": str(int(tx["value"], 16) / 10**18),
+        "gas": str(int(tx["gas"], 16)),
+        "gasPrice": str(int(tx["gasPrice"], 16)),
+        "blockNumber": tx.get("blockNumber"),
+        "status": "confirmed" if tx.get("blockNumber") else "pending"
+    }
+
 @app.post("/api/nft/metadata")
 async def generate_nft_metadata(request: NFTRequest):
     """Generate NFT metadata"""
@@ -237,10 +320,14 @@ async def chat(request: ChatRequest):
                 )
             
             try:
-                balance_data = await get_balance(request.address)
+                balance_data = await get_balance(request.address, networks=None)
                 balance = float(balance_data["balance"])
                 
-                response = f"Your Sonic Testnet balance is {balance:.6f} S tokens. Thanks to Sonic's real-time RPC, this information is always current!"
+                if balance_data["stale"]:
+                    response = (f"Your last known Sonic Testnet balance is {balance:.6f} S tokens, "
+                                f"from {balance_data['stale_age_seconds']:.0f}s ago. The Sonic RPC is not responding right now.")
+                else:
+                    response = f"Your Sonic Testnet balance is {balance:.6f} S tokens. Thanks to Sonic's real-time RPC, this information is always current!"
                 
                 cards = [{
                     "type": "balance",
@@ -251,6 +338,7 @@ async def chat(request: ChatRequest):
                         "network": "Sonic Testnet",
                         "usdValue": f"{balance * 2.0:.2f}",  # Mock USD price
                         "lastUpdate": datetime.now().strftime("%H:%M:%S"),
+                        "stale": balance_data["stale"],
                         "explorer_url": f"{SONIC_EXPLORER}/address/{request.address}"
                     }
                 }]
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
@@ -12,27 +13,61 @@ import aiohttp
 from web3 import Web3
 import os
 from dotenv import load_dotenv
-from services.transaction_service import TransactionService
+from services.transaction_service import get_transaction_service
+from services.wallet_service import get_wallet_service
+from services.multi_network import gather_networks, merge_histories
+from config.sonic_config import INDEXED_NETWORKS, parse_networks
+from services.rpc_client import RPCError, get_rpc_client, start_background_tasks as start_rpc_background_tasks, close_clients as close_rpc_clients
+from services.tracing import tracer, traced, TracingMiddleware
+from services.loop_monitor import loop_monitor, loop_monitor_enabled
+from services.metrics import registry, MetricsMiddleware, OPERATION_ERRORS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from services.admission import AdmissionController, AdmissionMiddleware
+from services.cache import close_cache
+from services.leader import leader
+from services.chain_head import get_head_follower
+from services.address_stats import get_address_stats_indexer
+from services.token_transfers import get_token_transfer_indexer
+from services.payment_keeper import get_payment_keeper
+from services.broadcaster import get_broadcaster, nonce_taken
+from services.receipt_waiter import get_receipt_waiter, TransactionDropped
+from services.job_queue import get_job_queue, Job, LeaseLost, TERMINAL as JOB_TERMINAL
+from eth_abi import encode as abi_encode
+from decimal import Decimal
 
 load_dotenv()
 
 app = FastAPI(title="Smart Sonic - AI Blockchain Agent", version="3.0.0")
 
 # Initialize services
-transaction_service = TransactionService()
+transaction_service = get_transaction_service("testnet")
+address_stats = get_address_stats_indexer("testnet")
+payment_keeper = get_payment_keeper("testnet")
+# Signs the agent's own transactions (AGENT_PRIVATE_KEY); None keeps operations simulated
+agent_broadcaster = get_broadcaster("testnet")
+receipt_waiter = get_receipt_waiter("testnet")
+job_queue = get_job_queue()
 
-# CORS middleware
+# Chat fans out into many RPC calls and an LLM call; bound it and shed overload early
+chat_admission = AdmissionController("chat")
+app.add_middleware(AdmissionMiddleware, controllers={"/api/chat": chat_admission})
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+# CORS middleware (added last, so it is outermost and shed 503s carry CORS headers too)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend back off on shed chat requests
+    expose_headers=["Retry-After"],
 )
 
 class ChatRequest(BaseModel):
     message: str
     address: Optional[str] = None
+    # Resending a chat message with the same key returns the original job instead of queueing another
+    idempotency_key: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -69,6 +104,7 @@ SUBSCRIPTION_ABI = [
         "type": "function"
     }
 ]
+RECORD_OPERATION_SELECTOR = "0x" + bytes(Web3.keccak(text="recordOperation(address,string,uint256)")[:4]).hex()
 
 # Enhanced features for premium users
 SONIC_FEATURES = {
@@ -112,6 +148,7 @@ def get_current_feem():
     }
 
 # Check if user has active subscription
+@traced("check_subscription")
 async def check_subscription(address: str) -> bool:
     try:
         if not address or SUBSCRIPTION_CONTRACT_ADDRESS == "0x0000000000000000000000000000000000000000":
@@ -125,29 +162,101 @@ async def check_subscription(address: str) -> bool:
         is_active = contract.functions.isSubscriptionActive(address).call()
         return is_active
     except Exception as e:
+        OPERATION_ERRORS.labels("check_subscription").inc()
         print(f"Error checking subscription: {e}")
         return False
 
+async def broadcast_once(job: Optional[Job], key: str, to: str, data: str = "0x", value: int = 0) -> str:
+    """Send a transaction at most once across attempts of ``job``.
+
+    The signed transaction is stored in the job's progress before it is
+    submitted, and a retry resubmits those exact bytes instead of signing a
+    new one, so a crash, lease expiry or shutdown between the node accepting
+    it and the hash being recorded cannot broadcast it twice.
+    """
+    signed = job.progress.get(key) if job is not None else None
+    while True:
+        if signed is None:
+            signed = await agent_broadcaster.sign(to, data, value)
+            if job is not None:
+                await job.report(**{key: signed})
+        try:
+            return await agent_broadcaster.submit(signed)
+        except RPCError as e:
+            if not nonce_taken(e):
+                raise
+            # Another transaction used the stored one's nonce, so it can never be mined
+            signed = None
+
 # Record operation on blockchain
-async def record_operation(address: str, operation_type: str, gas_cost: int = 21000):
+@traced("record_operation")
+async def record_operation(address: str, operation_type: str, gas_cost: int = 21000,
+                           job: Optional[Job] = None) -> Optional[str]:
     try:
         if not address or SUBSCRIPTION_CONTRACT_ADDRESS == "0x0000000000000000000000000000000000000000":
-            return
-            
-        # This would require a private key to sign transactions
-        # For demo purposes, we'll just log the operation
-        print(f"Recording operation: {operation_type} for {address}, gas: {gas_cost}")
-        
+            return None
+
+        if agent_broadcaster is None:
+            # Without a signer key we can only log the operation
+            print(f"Recording operation: {operation_type} for {address}, gas: {gas_cost}")
+            return None
+
+        args = abi_encode(["address", "string", "uint256"], [Web3.to_checksum_address(address), operation_type, gas_cost])
+        return await broadcast_once(job, "record_tx", SUBSCRIPTION_CONTRACT_ADDRESS,
+                                    RECORD_OPERATION_SELECTOR + args.hex())
+
+    except LeaseLost:
+        raise
     except Exception as e:
+        OPERATION_ERRORS.labels("record_operation").inc()
         print(f"Error recording operation: {e}")
+        return None
 
 # Autonomous operation executor
-async def execute_autonomous_operation(operation_type: str, params: Dict[str, Any], user_address: str):
+async def execute_autonomous_operation(operation_type: str, params: Dict[str, Any], user_address: str,
+                                       job: Optional[Job] = None):
     """Execute blockchain operations autonomously based on AI commands"""
     
     try:
         print(f"🤖 Executing autonomous {operation_type} for {user_address}")
-        
+
+        if agent_broadcaster is not None and operation_type == "send_transaction" and params.get("token", "S") == "S":
+            # The transfer and its usage record are signed back to back with local nonces and go out in one batch
+            if job is not None and job.progress.get("tx_hash"):
+                # A retried job whose transfer already went out: only wait for it
+                tx_hash, record_hash = job.progress["tx_hash"], job.progress.get("record_tx_hash")
+            else:
+                value = Web3.to_wei(Decimal(str(params["amount"])), "ether")
+                tx_hash, record_hash = await asyncio.gather(
+                    broadcast_once(job, "transfer_tx", params["to"], value=value),
+                    record_operation(user_address, operation_type, job=job),
+                )
+                if job is not None:
+                    await job.report(status="submitted", tx_hash=tx_hash, record_tx_hash=record_hash)
+            result = {
+                "success": True,
+                "operation": operation_type,
+                "params": params,
+                "tx_hash": tx_hash,
+                "record_tx_hash": record_hash,
+                "status": "submitted",
+                "timestamp": datetime.now().isoformat()
+            }
+            # Resolved by the shared head-following loop, not a polling loop per transaction
+            try:
+                receipt = await receipt_waiter.wait(tx_hash)
+                result.update({
+                    "status": "confirmed" if receipt.get("status") != "0x0" else "failed",
+                    "success": receipt.get("status") != "0x0",
+                    "gas_used": int(receipt["gasUsed"], 16),
+                    "block_number": int(receipt["blockNumber"], 16),
+                })
+            except TransactionDropped:
+                result.update({"status": "dropped", "success": False})
+            except asyncio.TimeoutError:
+                result["status"] = "pending"
+            return result
+
         # Simulate operation execution
         await asyncio.sleep(1)  # Simulate processing time
         
@@ -165,7 +274,11 @@ async def execute_autonomous_operation(operation_type: str, params: Dict[str, An
             "timestamp": datetime.now().isoformat()
         }
         
+    except LeaseLost:
+        # Another worker runs this job now; it must not be recorded as this attempt's failure
+        raise
     except Exception as e:
+        OPERATION_ERRORS.labels("autonomous_operation").inc()
         print(f"Error executing operation: {e}")
         return {
             "success": False,
@@ -173,6 +286,18 @@ async def execute_autonomous_operation(operation_type: str, params: Dict[str, An
             "operation": operation_type
         }
 
+async def run_autonomous_job(job: Job) -> Dict[str, Any]:
+    payload = job.payload
+    await job.report(status="executing")
+    result = await execute_autonomous_operation(payload["operation"], payload["params"], payload["user_address"], job)
+    if not result["success"] and not result.get("tx_hash"):
+        # Nothing was sent, so another attempt is safe
+        raise RuntimeError(result.get("error", "operation failed"))
+    await job.report(status=result.get("status", "completed"))
+    return result
+
+job_queue.register("autonomous_operation", run_autonomous_job)
+
 # Check if operation requires subscription
 def requires_subscription(message: str) -> tuple[bool, str]:
     message_lower = message.lower()
@@ -183,30 +308,180 @@ def requires_subscription(message: str) -> tuple[bool, str]:
             
     return False, ""
 
+@app.on_event("startup")
+async def start_background_monitors():
+    if loop_monitor_enabled():
+        loop_monitor.start()
+    start_rpc_background_tasks()
+    # Pipelines below run in one worker only; the rest read their output from the cache
+    for network in INDEXED_NETWORKS:
+        leader.register(f"chain_head:{network}", get_head_follower(network).run)
+        leader.register(f"token_transfers:{network}", get_token_transfer_indexer(network).run)
+    leader.register("address_stats:testnet", address_stats.run)
+    if payment_keeper.enabled:
+        leader.register("payment_keeper:testnet", payment_keeper.run)
+    leader.start()
+    # Every worker runs jobs; claims are atomic in the shared SQLite file
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_background_monitors():
+    await loop_monitor.stop()
+    await leader.stop()
+    await job_queue.stop()
+    await close_rpc_clients()
+    await close_cache()
+
 @app.get("/")
 async def root():
     return {"message": "Smart Sonic Backend is running in Demo Mode! 🚀"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/admission", include_in_schema=False)
+async def admission_status():
+    """In-flight, queued and shed counts for admission-controlled routes"""
+    return {"/api/chat": chat_admission.status()}
+
+@app.get("/debug/leader", include_in_schema=False)
+async def leader_status():
+    """Which worker runs the background jobs"""
+    return leader.status()
+
+@app.get("/debug/rpc-pool", include_in_schema=False)
+async def rpc_pool_status():
+    """Per-endpoint health, EWMA latency and traffic for pooled RPC clients"""
+    client = get_rpc_client("testnet")
+    if client.pool:
+        return client.pool.status()
+    return {"endpoints": [{"url": client.rpc_url, "pooled": False, "limiter": client.limiter.status()}]}
+
+@app.get("/debug/traces", include_in_schema=False)
+async def slowest_traces(limit: int = 10):
+    """Span trees of the slowest recently sampled requests"""
+    return {"sample_rate": tracer.sample_rate, "traces": tracer.slowest(limit)}
+
+def _networks(networks: Optional[List[str]]) -> List[str]:
+    try:
+        return parse_networks(networks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _merged_history(address: str, limit: int, networks: List[str]) -> Dict[str, Any]:
+    histories = await gather_networks(
+        networks, lambda network: get_transaction_service(network).get_transaction_history(address, limit),
+        "transaction_history",
+    )
+    return dict(merge_histories(histories, limit), address=address)
+
 @app.get("/api/transactions/{address}")
-async def get_transaction_history(address: str, limit: int = 10):
-    """Get transaction history for an address"""
+async def get_transaction_history(address: str, limit: int = 10, networks: Optional[List[str]] = Query(None)):
+    """Get transaction history for an address, merged newest first across networks= when several are given"""
+    selected = _networks(networks)
     try:
-        result = await transaction_service.get_transaction_history(address, limit)
-        return result
+        if len(selected) == 1:
+            return await get_transaction_service(selected[0]).get_transaction_history(address, limit)
+        return await _merged_history(address, limit, selected)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/portfolio/{address}")
+async def get_portfolio(address: str, limit: int = 10, networks: Optional[List[str]] = Query(None)):
+    """Balances and merged history for an address on every requested network, fetched concurrently"""
+    selected = _networks(networks or ["testnet", "mainnet"])
+    balances, history = await asyncio.gather(
+        gather_networks(selected, lambda network: get_wallet_service(network).get_balance(address), "balance"),
+        _merged_history(address, limit, selected),
+    )
+    return {
+        "address": address,
+        "networks": selected,
+        "balances": balances,
+        "transactions": history["transactions"],
+        "total_found": history["total_found"],
+        "errors": history["errors"],
+        "timestamp": datetime.now().isoformat(),
+    }
+
+@app.get("/api/address/{address}/stats")
+async def get_address_stats(address: str, top: int = 10):
+    """Totals, fees, first/last seen and top counterparties from the incremental index"""
+    try:
+        return await address_stats.get_stats(address, top)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/automation/payments")
+async def get_automation_status():
+    """Recurring payments the keeper tracks and when the next one is due"""
+    return payment_keeper.status()
+
 @app.get("/api/transaction/{tx_hash}")
-async def get_transaction_details(tx_hash: str):
-    """Get detailed information about a specific transaction"""
+async def get_transaction_details(tx_hash: str, wait: float = 0):
+    """Get detailed information about a specific transaction.
+
+    With ``wait`` (seconds, up to 60) a pending or not yet visible transaction
+    is held until it is mined or dropped.
+    """
     try:
         result = await transaction_service.get_transaction_details(tx_hash)
+        if wait > 0 and (not result.get("success") or result.get("status") == "pending"):
+            try:
+                await receipt_waiter.wait(tx_hash, timeout=min(wait, 60))
+                result = await transaction_service.get_transaction_details(tx_hash)
+            except TransactionDropped:
+                result = {"success": False, "hash": tx_hash, "status": "dropped", "error": "Transaction was dropped"}
+            except asyncio.TimeoutError:
+                pass
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """What callers may see of a job; progress holds signed transactions, so it stays private"""
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "tx_hash": job["progress"].get("tx_hash"),
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status, transaction hash and result of a queued autonomous operation"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(job)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_status(job_id: str):
+    """Server-sent events with the job's state each time it changes, until it finishes"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        current, updated = job, None
+        while True:
+            if current["updated"] != updated:
+                updated = current["updated"]
+                yield f"data: {json.dumps(job_view(current))}\n\n"
+            if current["status"] in JOB_TERMINAL:
+                return
+            await asyncio.sleep(job_queue.poll_interval)
+            current = await job_queue.get(job_id)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
+async def chat(request: ChatRequest):
     try:
         message_lower = request.message.lower()
         user_address = request.address or "0x742d35Cc6634C0532925a3b8D4C9db96590c6C87"
@@ -434,21 +709,22 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
                     "to": "0x742d35Cc6634C0532925a3b8D4C9db96590c6C87"
                 }
                 
-                # Execute operation in background
-                background_tasks.add_task(
-                    execute_autonomous_operation, 
-                    "send_transaction", 
-                    operation_params, 
-                    user_address
+                # Persist the operation; a worker executes it even if this process restarts
+                job = await job_queue.enqueue(
+                    "autonomous_operation",
+                    {"operation": "send_transaction", "params": operation_params, "user_address": user_address},
+                    priority=1,
+                    idempotency_key=f"chat:{user_address}:{request.idempotency_key}" if request.idempotency_key else None,
                 )
-                
-                tx_hash = generate_tx_hash()
-                response = f"🤖 AI is executing your transaction autonomously! Hash: {tx_hash[:10]}... Thanks to your Premium subscription, I'm handling everything automatically!"
+                tx_hash = job["progress"].get("tx_hash")
+                response = f"🤖 AI is executing your transaction autonomously! Job: {job['id'][:10]}... Thanks to your Premium subscription, I'm handling everything automatically!"
                 
                 cards = [{
                     "type": "autonomous-transaction",
                     "data": {
-                        "hash": tx_hash,
+                        "hash": tx_hash or f"queued (job {job['id']})",
+                        "jobId": job["id"],
+                        "jobStatusUrl": f"/api/jobs/{job['id']}",
                         "type": "Autonomous Send",
                         "amount": "25.0 S",
                         "to": "0x742d35Cc6634C0532925a3b8D4C9db96590c6C87",
@@ -553,14 +829,23 @@ async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
         # AI & Automation
         elif any(word in message_lower for word in ["automate", "schedule", "recurring", "ai"]):
             response = "🤖 I can automate your blockchain operations! Set up recurring payments, DCA strategies, or yield optimization. What would you like to automate?"
+            automation = {
+                "activeStrategies": 3,
+                "totalSaved": "$127.50",
+                "nextExecution": "Tomorrow 9:00 AM",
+                "strategies": ["DCA S tokens", "Yield farming", "Gas optimization"]
+            }
+            if payment_keeper.enabled:
+                keeper_status = payment_keeper.status()
+                next_due = keeper_status["next_due"]
+                automation.update({
+                    "activeStrategies": keeper_status["active_payments"],
+                    "nextExecution": datetime.fromtimestamp(next_due).strftime("%Y-%m-%d %H:%M") if next_due else "None scheduled",
+                    "executionsSubmitted": keeper_status["executions_submitted"],
+                })
             cards = [{
                 "type": "automation",
-                "data": {
-                    "activeStrategies": 3,
-                    "totalSaved": "$127.50",
-                    "nextExecution": "Tomorrow 9:00 AM",
-                    "strategies": ["DCA S tokens", "Yield farming", "Gas optimization"]
-                }
+                "data": automation
             }]
         
         # Default responses
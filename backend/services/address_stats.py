@@ -0,0 +1,294 @@
+"""
+Address Statistics Indexer for Smart Sonic
+The leader worker folds every new block into per-address running totals
+(sent, received, fees, counts, first/last seen, top counterparties) kept in
+the durable state store, so /api/address/{address}/stats is one indexed read
+however active the address is
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.chain_head import HeadFollower, get_head_follower
+from services.columnar_store import TransactionColumns, get_transaction_store
+from services.durable_store import DurableStore, get_durable_store
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient, get_rpc_client
+
+WEI_PER_S = 10 ** 18
+
+INDEXED_BLOCK = registry.gauge("sonic_indexer_block", "Last block folded into address statistics", ["network"])
+INDEXED_TXS = registry.counter("sonic_indexer_transactions_total", "Transactions folded into address statistics", ["network"])
+INDEXER_LAG = registry.gauge("sonic_indexer_lag_blocks", "Blocks between the chain head and the indexer", ["network"])
+
+METHOD_NOT_FOUND = -32601
+
+
+class CheckpointMoved(RuntimeError):
+    """Another indexer committed blocks past the range being indexed"""
+
+
+def empty_stats() -> Dict[str, Any]:
+    return {
+        "sent_wei": 0,
+        "received_wei": 0,
+        "fees_wei": 0,
+        "transactions": 0,
+        "sent": 0,
+        "received": 0,
+        "failed": 0,
+        "first_seen": None,
+        "last_seen": None,
+        # Space-saving counters: address -> [count, overestimate]
+        "counterparties": {},
+        "through": -1,
+    }
+
+
+def count_counterparty(counters: Dict[str, List[int]], address: str, slots: int, weight: int = 1):
+    """Space-saving top-k update: at most ``slots`` counters, the smallest one is recycled.
+
+    A recycled counter inherits the evicted count as its overestimate, so any
+    address seen more often than total/slots is guaranteed to be tracked.
+    """
+    entry = counters.get(address)
+    if entry is not None:
+        entry[0] += weight
+        return
+    if len(counters) < slots:
+        counters[address] = [weight, 0]
+        return
+    smallest = min(counters, key=lambda a: counters[a][0])
+    floor = counters.pop(smallest)[0]
+    counters[address] = [floor + weight, floor]
+
+
+class AddressStatsIndexer:
+    """Incremental per-address aggregates for one network.
+
+    Blocks are read in batches of ``batch_blocks`` and their receipts with
+    eth_getBlockReceipts (per-hash lookups where the node lacks it), each in
+    JSON-RPC batches of at most ``rpc_batch`` requests; deltas are folded per address in
+    memory, and each touched address costs one read and one write of its
+    record. A batch's records and the checkpoint are committed in one
+    transaction that only applies if the checkpoint is still the one the
+    batch started from, so a crash, a retry from the checkpoint with a
+    different batch end, or two leaders overlapping never double counts.
+    Sonic blocks are final once produced, so there is no reorg handling.
+    """
+
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None,
+                 head: Optional[HeadFollower] = None, store: Optional[TransactionColumns] = None,
+                 state: Optional[DurableStore] = None,
+                 batch_blocks: Optional[int] = None, backfill_blocks: Optional[int] = None,
+                 counterparty_slots: Optional[int] = None, rpc_batch: Optional[int] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.head = head or (get_head_follower(network) if rpc_client is None else HeadFollower(network, rpc_client))
+        self.store = store
+        self.batch_blocks = batch_blocks or int(os.getenv("INDEXER_BATCH_BLOCKS", "20"))
+        self.backfill_blocks = backfill_blocks if backfill_blocks is not None else int(
+            os.getenv("INDEXER_BACKFILL_BLOCKS", "1000")
+        )
+        self.counterparty_slots = counterparty_slots or int(os.getenv("INDEXER_COUNTERPARTY_SLOTS", "32"))
+        # Providers cap how many requests one batch may carry
+        self.rpc_batch = rpc_batch or int(os.getenv("INDEXER_RPC_BATCH", "100"))
+        self._block_receipts = True
+        # Aggregates and checkpoint must not be evicted, so they live outside the cache
+        self.state = state or get_durable_store()
+        self.namespace = f"address_stats:{network}"
+
+    async def checkpoint(self) -> Optional[Dict[str, int]]:
+        """``{"from", "through"}``: the block range the statistics cover"""
+        return await self.state.get("indexer", self.namespace)
+
+    async def _batched(self, calls: List[Tuple[str, List[Any]]]) -> List[Any]:
+        chunks = [calls[i:i + self.rpc_batch] for i in range(0, len(calls), self.rpc_batch)]
+        replies = await asyncio.gather(*(self.rpc.batch(chunk) for chunk in chunks))
+        return [reply for chunk in replies for reply in chunk]
+
+    async def _receipts(self, blocks: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Receipts of every transaction in ``blocks`` by hash, per block where the node supports it"""
+        receipts: Dict[str, Dict[str, Any]] = {}
+        if self._block_receipts:
+            replies = await self._batched([("eth_getBlockReceipts", [block["number"]]) for block in blocks])
+            if not any(isinstance(r, RPCError) and r.code == METHOD_NOT_FOUND for r in replies):
+                for reply in replies:
+                    if isinstance(reply, RPCError):
+                        raise reply
+                    for receipt in reply or []:
+                        receipts[receipt["transactionHash"]] = receipt
+                return receipts
+            self._block_receipts = False
+        hashes = [tx["hash"] for block in blocks for tx in block.get("transactions", [])]
+        replies = await self._batched([("eth_getTransactionReceipt", [h]) for h in hashes])
+        for tx_hash, receipt in zip(hashes, replies):
+            if isinstance(receipt, RPCError):
+                raise receipt
+            if receipt is not None:
+                receipts[tx_hash] = receipt
+        return receipts
+
+    async def _fetch(self, start: int, end: int) -> List[Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]]:
+        blocks = await self._batched([("eth_getBlockByNumber", [hex(n), True]) for n in range(start, end + 1)])
+        for block in blocks:
+            if isinstance(block, RPCError):
+                raise block
+            if block is None:
+                raise RPCError("eth_getBlockByNumber", "block not available yet")
+        receipts = await self._receipts(blocks) if any(block.get("transactions") for block in blocks) else {}
+        return [(block, receipts) for block in blocks]
+
+    def _fold(self, blocks) -> Dict[str, Dict[str, Any]]:
+        """Per-address deltas for a batch of blocks, in block order"""
+        deltas: Dict[str, Dict[str, Any]] = {}
+
+        def delta(address: str) -> Dict[str, Any]:
+            entry = deltas.get(address)
+            if entry is None:
+                entry = deltas[address] = empty_stats()
+            return entry
+
+        for block, receipts in blocks:
+            seen = {"block": int(block["number"], 16), "timestamp": int(block.get("timestamp") or "0x0", 16)}
+            for tx in block.get("transactions", []):
+                sender = (tx.get("from") or "").lower()
+                recipient = (tx.get("to") or "").lower() or None
+                receipt = receipts.get(tx["hash"])
+                succeeded = receipt is None or receipt.get("status") != "0x0"
+                value = int(tx.get("value") or "0x0", 16) if succeeded else 0
+                fee = 0
+                if receipt is not None:
+                    gas_price = receipt.get("effectiveGasPrice") or tx.get("gasPrice") or "0x0"
+                    fee = int(receipt.get("gasUsed") or "0x0", 16) * int(gas_price, 16)
+
+                parties = [sender] if recipient in (None, sender) else [sender, recipient]
+                for address in parties:
+                    entry = delta(address)
+                    entry["transactions"] += 1
+                    entry["first_seen"] = entry["first_seen"] or seen
+                    entry["last_seen"] = seen
+                    if not succeeded:
+                        entry["failed"] += 1
+
+                out = delta(sender)
+                out["sent"] += 1
+                out["sent_wei"] += value
+                out["fees_wei"] += fee
+                if recipient is not None:
+                    incoming = delta(recipient)
+                    incoming["received"] += 1
+                    incoming["received_wei"] += value
+                    if recipient != sender:
+                        count_counterparty(out["counterparties"], recipient, self.counterparty_slots)
+                        count_counterparty(incoming["counterparties"], sender, self.counterparty_slots)
+        return deltas
+
+    def _merge(self, record: Dict[str, Any], delta: Dict[str, Any], through: int) -> Dict[str, Any]:
+        for field in ("sent_wei", "received_wei", "fees_wei", "transactions", "sent", "received", "failed"):
+            record[field] += delta[field]
+        record["first_seen"] = record["first_seen"] or delta["first_seen"]
+        record["last_seen"] = delta["last_seen"] or record["last_seen"]
+        counters = record["counterparties"]
+        for address, (count, _) in delta["counterparties"].items():
+            count_counterparty(counters, address, self.counterparty_slots, count)
+        record["through"] = through
+        return record
+
+    async def index_range(self, start: int, end: int) -> int:
+        """Fold blocks ``start..end`` into the statistics; returns transactions indexed.
+
+        Raises ``CheckpointMoved`` if the checkpoint no longer ends at ``start - 1``
+        (another leader got there first); nothing is written then.
+        """
+        checkpoint = await self.checkpoint()
+        if checkpoint is not None and checkpoint["through"] != start - 1:
+            raise CheckpointMoved(f"Address stats for {self.network} are indexed through {checkpoint['through']}, "
+                               f"not {start - 1}")
+        blocks = await self._fetch(start, end)
+        deltas = self._fold(blocks)
+        addresses = list(deltas)
+        records = await self.state.get_many(self.namespace, addresses)
+        entries = [
+            (self.namespace, address, self._merge(record or empty_stats(), deltas[address], end))
+            for address, record in zip(addresses, records)
+        ]
+        entries.append(("indexer", self.namespace, {
+            "from": checkpoint["from"] if checkpoint else start,
+            "through": end,
+        }))
+        if not await self.state.write(entries, expect=("indexer", self.namespace, checkpoint)):
+            raise CheckpointMoved(f"Address stats for {self.network} were advanced by another indexer")
+
+        if self.store is not None:
+            for block, receipts in blocks:
+                self.store.append_block(block, receipts)
+            self.store.flush()
+        indexed = sum(len(block.get("transactions", [])) for block, _ in blocks)
+        INDEXED_BLOCK.labels(self.network).set(end)
+        INDEXED_TXS.labels(self.network).inc(indexed)
+        return indexed
+
+    async def catch_up(self) -> int:
+        """Index everything up to the current head; returns blocks indexed"""
+        head = await self.head.block_number()
+        checkpoint = await self.checkpoint()
+        start = checkpoint["through"] + 1 if checkpoint else max(0, head - self.backfill_blocks)
+        indexed = 0
+        while start <= head:
+            end = min(head, start + self.batch_blocks - 1)
+            await self.index_range(start, end)
+            INDEXER_LAG.labels(self.network).set(head - end)
+            indexed += end - start + 1
+            start = end + 1
+        return indexed
+
+    async def run(self):
+        """Leader job: follow the head until cancelled"""
+        while True:
+            try:
+                if not await self.catch_up():
+                    await asyncio.sleep(self.head.interval)
+            except (RPCError, asyncio.TimeoutError, OSError, CheckpointMoved) as e:
+                print(f"Address stats indexing for {self.network} failed: {e}")
+                await asyncio.sleep(self.head.interval)
+
+    async def get_stats(self, address: str, top: int = 10) -> Dict[str, Any]:
+        """Statistics for one address, answered from a single indexed read"""
+        record, checkpoint = await asyncio.gather(self.state.get(self.namespace, address.lower()), self.checkpoint())
+        record = record or empty_stats()
+        counterparties = sorted(record["counterparties"].items(), key=lambda item: item[1][0], reverse=True)
+        return {
+            "address": address,
+            "network": self.network,
+            "transactions": record["transactions"],
+            "sent": {"count": record["sent"], "total_s": record["sent_wei"] / WEI_PER_S, "total_wei": str(record["sent_wei"])},
+            "received": {
+                "count": record["received"],
+                "total_s": record["received_wei"] / WEI_PER_S,
+                "total_wei": str(record["received_wei"]),
+            },
+            "fees": {"total_s": record["fees_wei"] / WEI_PER_S, "total_wei": str(record["fees_wei"])},
+            "failed": record["failed"],
+            "first_seen": record["first_seen"],
+            "last_seen": record["last_seen"],
+            "top_counterparties": [
+                {"address": counterparty, "transactions": count, "approximate": error > 0}
+                for counterparty, (count, error) in counterparties[:top]
+            ],
+            "indexed_from": checkpoint["from"] if checkpoint else None,
+            "indexed_through": checkpoint["through"] if checkpoint else None,
+        }
+
+
+_indexers: Dict[str, AddressStatsIndexer] = {}
+
+
+def get_address_stats_indexer(network: str = "testnet") -> AddressStatsIndexer:
+    indexer = _indexers.get(network)
+    if indexer is None:
+        # Without TX_STORE_DIR the columns would only grow in memory with nothing reading them back
+        store = get_transaction_store() if os.getenv("TX_STORE_DIR") else None
+        indexer = _indexers[network] = AddressStatsIndexer(network, store=store)
+    return indexer
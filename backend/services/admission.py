@@ -0,0 +1,264 @@
+"""
+Admission Control for Smart Sonic
+Bounds concurrent work per route, queues fairly per address and sheds load
+with a fast 503 once queueing delay stays above target (CoDel-style)
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from services.metrics import registry
+
+ADMISSION_REQUESTS = registry.counter(
+    "sonic_admission_requests_total",
+    "Requests by admission outcome (admitted, shed_queue_full, shed_address_limit, shed_overload, shed_queue_delay)",
+    ["route", "outcome"]
+)
+ADMISSION_QUEUE = registry.gauge(
+    "sonic_admission_queue_depth", "Requests waiting for admission", ["route"]
+)
+ADMISSION_INFLIGHT = registry.gauge(
+    "sonic_admission_inflight", "Admitted requests being handled", ["route"]
+)
+ADMISSION_DELAY = registry.histogram(
+    "sonic_admission_queue_delay_seconds", "Time admitted requests spent queued", ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+ADMISSION_OVERLOADED = registry.gauge(
+    "sonic_admission_overloaded", "1 while the queue has stayed above its delay target for a full interval", ["route"]
+)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; carries a Retry-After hint"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded in-flight work with a fair, delay-aware queue for one route.
+
+    Up to ``max_inflight`` requests run at once; the rest queue per key (the
+    caller's address) and are served round-robin across keys, so one busy
+    address cannot starve others. If the smallest queueing delay seen during an
+    ``interval`` exceeds ``target`` the queue is standing rather than absorbing
+    a burst: new arrivals then only wait up to ``target`` (not ``max_wait``)
+    and are rejected outright while a full round of work is already queued.
+    """
+
+    def __init__(self, name: str, max_inflight: Optional[int] = None, max_queue: Optional[int] = None,
+                 max_queue_per_key: Optional[int] = None, target: Optional[float] = None,
+                 interval: Optional[float] = None, max_wait: Optional[float] = None):
+        prefix = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        self.max_inflight = max_inflight or int(os.getenv(prefix + "MAX_INFLIGHT", "32"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv(prefix + "MAX_QUEUE", "128"))
+        self.max_queue_per_key = max_queue_per_key or int(os.getenv(prefix + "MAX_QUEUE_PER_ADDRESS", "4"))
+        self.target = target or float(os.getenv(prefix + "TARGET_DELAY_MS", "200")) / 1000
+        self.interval = interval or float(os.getenv(prefix + "INTERVAL_MS", "1000")) / 1000
+        self.max_wait = max_wait or float(os.getenv(prefix + "MAX_WAIT_S", "10"))
+        self.inflight = 0
+        self.queued = 0
+        self.overloaded = False
+        self.service_time = 0.0
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, float]]]" = OrderedDict()
+        self._interval_start = time.monotonic()
+        self._interval_min: Optional[float] = None
+        self.outcomes: Dict[str, int] = {}
+
+    # Bookkeeping
+
+    def _count(self, outcome: str):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        ADMISSION_REQUESTS.labels(self.name, outcome).inc()
+
+    def _observe_delay(self, delay: float):
+        ADMISSION_DELAY.labels(self.name).observe(delay)
+        now = time.monotonic()
+        if self._interval_min is None or delay < self._interval_min:
+            self._interval_min = delay
+        if now - self._interval_start >= self.interval:
+            self.overloaded = self._interval_min > self.target
+            ADMISSION_OVERLOADED.labels(self.name).set(1 if self.overloaded else 0)
+            self._interval_start = now
+            self._interval_min = None
+        elif delay <= self.target and self.overloaded:
+            # A request got through quickly: the standing queue has drained
+            self.overloaded = False
+            ADMISSION_OVERLOADED.labels(self.name).set(0)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained"""
+        rounds = self.queued / self.max_inflight + 1
+        return max(1, min(60, math.ceil(rounds * (self.service_time or 1.0))))
+
+    def _shed(self, reason: str) -> Overloaded:
+        self._count(reason)
+        return Overloaded(reason, self.retry_after())
+
+    # Admission
+
+    async def acquire(self, key: str):
+        """Wait for a slot; raises Overloaded when the request is shed"""
+        if self.inflight < self.max_inflight and not self.queued:
+            self.inflight += 1
+            ADMISSION_INFLIGHT.labels(self.name).set(self.inflight)
+            self._observe_delay(0.0)
+            self._count("admitted")
+            return
+
+        if self.queued >= self.max_queue:
+            raise self._shed("shed_queue_full")
+        if self.overloaded and self.queued >= self.max_inflight:
+            # A full round is already waiting behind a standing queue; fail fast
+            raise self._shed("shed_overload")
+        queue = self._queues.get(key)
+        if queue is not None and len(queue) >= self.max_queue_per_key:
+            raise self._shed("shed_address_limit")
+        if queue is None:
+            queue = self._queues[key] = deque()
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, time.monotonic())
+        queue.append(entry)
+        self.queued += 1
+        ADMISSION_QUEUE.labels(self.name).set(self.queued)
+        timeout = self.target if self.overloaded else self.max_wait
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self._remove(key, entry)
+            raise self._shed("shed_queue_delay")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as the client went away: hand it on
+                self.release(0.0)
+            else:
+                self._remove(key, entry)
+            raise
+        self._count("admitted")
+
+    def _remove(self, key: str, entry: Tuple[asyncio.Future, float]):
+        queue = self._queues.get(key)
+        if queue is not None and entry in queue:
+            queue.remove(entry)
+            self.queued -= 1
+            ADMISSION_QUEUE.labels(self.name).set(self.queued)
+            if not queue:
+                del self._queues[key]
+
+    def release(self, service_time: float):
+        self.inflight -= 1
+        if service_time:
+            self.service_time = service_time if not self.service_time else 0.2 * service_time + 0.8 * self.service_time
+        self._dispatch()
+        ADMISSION_INFLIGHT.labels(self.name).set(self.inflight)
+
+    def _dispatch(self):
+        """Hand free slots to queued requests, one address at a time"""
+        now = time.monotonic()
+        while self.inflight < self.max_inflight and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            waiter, enqueued = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if waiter.done():
+                continue
+            self.inflight += 1
+            self._observe_delay(now - enqueued)
+            waiter.set_result(None)
+        ADMISSION_QUEUE.labels(self.name).set(self.queued)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "addresses_queued": len(self._queues),
+            "overloaded": self.overloaded,
+            "target_ms": round(self.target * 1000, 1),
+            "service_time_ms": round(self.service_time * 1000, 1),
+            "outcomes": dict(self.outcomes),
+        }
+
+
+def _address_from_body(body: bytes) -> Optional[str]:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    address = data.get("address") if isinstance(data, dict) else None
+    return address.lower() if isinstance(address, str) and address else None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to selected POST routes.
+
+    The fairness key is the JSON body's ``address`` or else the client IP. Shed
+    requests get ``503`` with ``Retry-After`` before any handler work is done.
+    """
+
+    def __init__(self, app, controllers: Dict[str, AdmissionController]):
+        self.app = app
+        self.controllers = controllers
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controllers.get(scope.get("path")) if scope["type"] == "http" else None
+        if controller is None or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer the (small) JSON body to find the address, then replay it downstream
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        client = scope.get("client")
+        key = _address_from_body(body) or (client[0] if client else "unknown")
+        try:
+            await controller.acquire(key)
+        except Overloaded as e:
+            payload = json.dumps({"detail": "Server is busy, please retry shortly", "reason": e.reason}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode()),
+                    (b"retry-after", str(e.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": payload})
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, replay, send)
+        finally:
+            controller.release(time.perf_counter() - started)
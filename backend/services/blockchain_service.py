@@ -1,67 +1,87 @@
 import requests
 import asyncio
+from datetime import datetime
 from typing import Dict, Any, Optional
 from web3 import Web3
 import os
 
+from config.sonic_config import get_network_config
+from services.chain_head import HeadFollower, get_head_follower
+from services.circuit_breaker import CircuitOpenError, stale_reader
+from services.rpc_client import SonicRPCClient, get_rpc_client
+
 class BlockchainService:
-    def __init__(self):
-        # Sonic Testnet configuration
-        self.rpc_url = "https://rpc.testnet.soniclabs.com"
-        self.explorer_api = "https://testnet.soniclabs.com/api"
-        self.web3 = Web3(Web3.HTTPProvider(self.rpc_url))
-        
-        # Check connection
-        if not self.web3.is_connected():
-            print("Warning: Could not connect to Sonic Network")
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.rpc_url = self.rpc.rpc_url
+        self.explorer_api = get_network_config(network)["explorer_api"]
+        # Only used for unit conversion; reads go through self.rpc
+        self.web3 = Web3()
+        self.transactions = stale_reader(network, "eth_getTransactionByHash")
+        self.head = get_head_follower(network) if rpc_client is None else HeadFollower(self.network, rpc_client)
 
     async def get_transaction(self, tx_hash: str) -> Dict[str, Any]:
         """Get transaction details from Sonic blockchain"""
         try:
-            # Get transaction from Web3
-            tx = self.web3.eth.get_transaction(tx_hash)
-            tx_receipt = self.web3.eth.get_transaction_receipt(tx_hash)
-            
-            # Get current block for confirmations
-            current_block = self.web3.eth.block_number
-            confirmations = current_block - tx_receipt.blockNumber if tx_receipt.blockNumber else 0
-            
-            # Determine transaction type and status
-            tx_type = "send" if tx.value > 0 else "contract"
-            status = "confirmed" if tx_receipt.status == 1 else "failed"
-            
-            # Convert Wei to S tokens
-            amount_s = self.web3.from_wei(tx.value, 'ether')
-            
-            return {
-                "hash": tx_hash,
-                "type": tx_type,
-                "amount": str(amount_s),
-                "token": "S",
-                "from": tx['from'],
-                "to": tx.to,
-                "status": status,
-                "timestamp": await self._get_block_timestamp(tx_receipt.blockNumber),
-                "gasUsed": str(tx_receipt.gasUsed),
-                "confirmations": confirmations,
-                "blockNumber": tx_receipt.blockNumber
-            }
-            
+            # During an RPC outage this is the last known copy, marked stale
+            transaction, stale_age = await self.transactions.get(tx_hash, lambda: self._fetch_transaction(tx_hash))
+            if stale_age is None:
+                return transaction
+            return {**transaction, "stale": True, "staleAgeSeconds": round(stale_age, 1)}
+
+        except CircuitOpenError as e:
+            return {"hash": tx_hash, "error": "Sonic RPC unavailable", "retryAfter": round(e.retry_after)}
         except Exception as e:
-            # Return mock data for demo purposes
-            return self._get_mock_transaction(tx_hash)
+            return {"hash": tx_hash, "error": str(e)}
+
+    async def _fetch_transaction(self, tx_hash: str) -> Dict[str, Any]:
+        tx, tx_receipt, current_block = await asyncio.gather(
+            self.rpc.call("eth_getTransactionByHash", [tx_hash]),
+            self.rpc.call("eth_getTransactionReceipt", [tx_hash]),
+            self.head.block_number(),
+        )
+        if tx is None or tx_receipt is None:
+            raise LookupError(f"Transaction {tx_hash} not found")
+
+        # Get current block for confirmations
+        block_number = int(tx_receipt["blockNumber"], 16) if tx_receipt.get("blockNumber") else None
+        confirmations = max(0, current_block - block_number) if block_number else 0
+
+        # Determine transaction type and status
+        value = int(tx.get("value") or "0x0", 16)
+        tx_type = "send" if value > 0 else "contract"
+        status = "confirmed" if tx_receipt.get("status") == "0x1" else "failed"
+
+        # Convert Wei to S tokens
+        amount_s = self.web3.from_wei(value, 'ether')
+
+        return {
+            "hash": tx_hash,
+            "type": tx_type,
+            "amount": str(amount_s),
+            "token": "S",
+            "from": tx['from'],
+            "to": tx.get("to"),
+            "status": status,
+            "timestamp": await self._get_block_timestamp(block_number),
+            "gasUsed": str(int(tx_receipt.get("gasUsed") or "0x0", 16)),
+            "confirmations": confirmations,
+            "blockNumber": block_number,
+            "stale": False
+        }
 
     async def get_block_info(self, block_number: int) -> Dict[str, Any]:
         """Get block information"""
         try:
-            block = self.web3.eth.get_block(block_number)
+            block = await self.rpc.call("eth_getBlockByNumber", [hex(block_number), False])
             return {
-                "number": block.number,
-                "hash": block.hash.hex(),
-                "timestamp": block.timestamp,
-                "transactions": len(block.transactions),
-                "gasUsed": block.gasUsed,
-                "gasLimit": block.gasLimit
+                "number": int(block["number"], 16),
+                "hash": block["hash"],
+                "timestamp": int(block["timestamp"], 16),
+                "transactions": len(block["transactions"]),
+                "gasUsed": int(block["gasUsed"], 16),
+                "gasLimit": int(block["gasLimit"], 16)
             }
         except Exception as e:
             return {"error": str(e)}
@@ -69,7 +89,7 @@ class BlockchainService:
     async def estimate_gas(self, transaction: Dict[str, Any]) -> int:
         """Estimate gas for a transaction"""
         try:
-            gas_estimate = self.web3.eth.estimate_gas(transaction)
+            gas_estimate = int(await self.rpc.call("eth_estimateGas", [transaction]), 16)
             return gas_estimate
         except Exception as e:
             # Return default gas estimate
@@ -78,40 +98,21 @@ class BlockchainService:
     async def get_gas_price(self) -> int:
         """Get current gas price"""
         try:
-            gas_price = self.web3.eth.gas_price
+            gas_price = int(await self.rpc.call("eth_gasPrice"), 16)
             return gas_price
         except Exception as e:
             # Return default gas price (in Wei)
             return self.web3.to_wei('20', 'gwei')
 
-    async def _get_block_timestamp(self, block_number: int) -> str:
+    async def _get_block_timestamp(self, block_number: Optional[int]) -> str:
         """Get block timestamp and format it"""
         try:
-            block = self.web3.eth.get_block(block_number)
-            timestamp = block.timestamp
-            from datetime import datetime
-            dt = datetime.fromtimestamp(timestamp)
+            block = await self.rpc.call("eth_getBlockByNumber", [hex(block_number), False])
+            dt = datetime.fromtimestamp(int(block["timestamp"], 16))
             return dt.strftime("%Y-%m-%d %H:%M:%S")
         except Exception:
-            from datetime import datetime
             return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    def _get_mock_transaction(self, tx_hash: str) -> Dict[str, Any]:
-        """Return mock transaction data for demo"""
-        return {
-            "hash": tx_hash,
-            "type": "send",
-            "amount": "10.0",
-            "token": "S",
-            "from": "0x742d35Cc6634C0532925a3b8D4C9db96590c6C87",
-            "to": "0x8ba1f109551bD432803012645Hac136c22C177ec",
-            "status": "confirmed",
-            "timestamp": "2024-01-15 14:30:25",
-            "gasUsed": "21000",
-            "usdValue": "25.00",
-            "confirmations": 15
-        }
-
     async def get_s_token_price(self) -> float:
         """Get current S token price in USD"""
         try:
@@ -124,17 +125,20 @@ class BlockchainService:
     async def get_network_stats(self) -> Dict[str, Any]:
         """Get Sonic network statistics"""
         try:
-            latest_block = self.web3.eth.block_number
-            gas_price = await self.get_gas_price()
+            latest_block, gas_price, chain_id = await asyncio.gather(
+                self.rpc.call("eth_blockNumber"),
+                self.get_gas_price(),
+                self.rpc.call("eth_chainId"),
+            )
             
             return {
-                "latestBlock": latest_block,
+                "latestBlock": int(latest_block, 16),
                 "gasPrice": self.web3.from_wei(gas_price, 'gwei'),
-                "networkId": self.web3.eth.chain_id,
-                "isConnected": self.web3.is_connected()
+                "networkId": int(chain_id, 16),
+                "isConnected": True
             }
         except Exception as e:
             return {
                 "error": str(e),
                 "isConnected": False
-            }
\ No newline at end of file
+            }
@@ -0,0 +1,366 @@
+"""
+Transaction Broadcaster for Smart Sonic
+Hands out nonces locally per sender, signs transactions as soon as they are
+requested and pipelines them to the node in batched eth_sendRawTransaction
+calls without waiting for earlier ones to confirm. Nonces taken behind our
+back are resynced, and a nonce whose transaction the node rejects is filled
+so later ones are not stuck behind the gap
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from eth_account import Account
+from web3 import Web3
+
+from services.chain_head import HeadFollower, get_head_follower
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient, get_rpc_client
+
+BROADCAST_TXS = registry.counter(
+    "sonic_broadcast_transactions_total", "Signed transactions submitted by the broadcaster", ["outcome"]
+)
+BROADCAST_BATCH = registry.histogram(
+    "sonic_broadcast_batch_size", "Raw transactions per eth_sendRawTransaction batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100),
+)
+NONCE_RESYNCS = registry.counter(
+    "sonic_nonce_resyncs_total", "Times a sender's nonce was re-read because the node had already used it"
+)
+
+# Estimates are padded; a reverting path can use a little more than the estimate
+GAS_MARGIN = 1.2
+# Geth-style pools need at least +10% to replace a pending transaction
+REPLACEMENT_BUMP = 1.125
+MAX_ATTEMPTS = 3
+# Sent transactions remembered for replace()
+SENT_HISTORY = 1024
+
+
+def nonce_taken(error: RPCError) -> bool:
+    """The node rejected a transaction because its nonce is already used"""
+    message = error.message.lower()
+    return "nonce too low" in message or "replacement transaction underpriced" in message
+
+
+def _already_known(error: RPCError) -> bool:
+    message = error.message.lower()
+    return "already known" in message or "known transaction" in message
+
+
+class NonceManager:
+    """Next nonce for one sender, reserved locally instead of read per transaction"""
+
+    def __init__(self, rpc_client: SonicRPCClient, address: str):
+        self.rpc = rpc_client
+        self.address = address
+        self._next: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def _pending_count(self) -> int:
+        return int(await self.rpc.call("eth_getTransactionCount", [self.address, "pending"]), 16)
+
+    async def reserve(self) -> int:
+        async with self._lock:
+            if self._next is None:
+                self._next = await self._pending_count()
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    async def sync(self):
+        """Skip past nonces the node has seen, keeping ones reserved but not yet sent"""
+        async with self._lock:
+            pending = await self._pending_count()
+            self._next = max(pending, self._next or 0)
+            NONCE_RESYNCS.inc()
+
+    def reset(self):
+        """Forget the local counter; the next reservation re-reads the node's pending nonce"""
+        self._next = None
+
+    def release(self, nonce: int) -> bool:
+        """Hand back an unused nonce; only possible if nothing was reserved after it"""
+        if self._next is not None and nonce == self._next - 1:
+            self._next = nonce
+            return True
+        return False
+
+
+class _Pending:
+    __slots__ = ("tx", "raw", "hash", "future", "attempts", "renonce", "fill_gap")
+
+    def __init__(self, tx: Dict[str, Any], raw: str, tx_hash: str, future: Optional[asyncio.Future],
+                 renonce: bool = True, fill_gap: Optional[bool] = None):
+        self.tx = tx
+        self.raw = raw
+        self.hash = tx_hash
+        self.future = future
+        self.attempts = 0
+        # Replacements, gap fillers and stored transactions must keep their nonce
+        self.renonce = renonce
+        # Whether a rejection leaves a nonce gap of ours to fill
+        self.fill_gap = renonce if fill_gap is None else fill_gap
+
+
+class Broadcaster:
+    """Pipelined sender for one account.
+
+    ``await send(to, data, value)`` returns the transaction hash once the
+    node has accepted it into its pool; confirmation is a separate concern.
+    Transactions signed within ``linger`` of each other go out in one batch
+    of up to ``max_batch``, lowest nonce first.
+    """
+
+    def __init__(self, account, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None,
+                 head: Optional[HeadFollower] = None, max_batch: Optional[int] = None,
+                 linger_ms: Optional[float] = None):
+        self.account = account
+        self.address = account.address
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.head = head or (get_head_follower(network) if rpc_client is None else HeadFollower(network, rpc_client))
+        self.max_batch = max_batch or int(os.getenv("BROADCAST_MAX_BATCH", "50"))
+        self.linger = (linger_ms if linger_ms is not None else float(os.getenv("BROADCAST_LINGER_MS", "5"))) / 1000
+        self.nonces = NonceManager(self.rpc, self.address)
+        self.chain_id: Optional[int] = None
+        self._queue: List[_Pending] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._sent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    async def _gas_price(self) -> int:
+        head = await self.head.head()
+        if head.get("gasPrice"):
+            return head["gasPrice"]
+        return int(await self.rpc.call("eth_gasPrice", []), 16)
+
+    async def _prepare(self, call: Dict[str, Any], gas: Optional[int]) -> Tuple[int, int]:
+        """Gas limit and price, with the estimate and chain id fetched in one round trip"""
+        calls = []
+        if gas is None:
+            calls.append(("eth_estimateGas", [call]))
+        if self.chain_id is None:
+            calls.append(("eth_chainId", []))
+        replies, gas_price = await asyncio.gather(self.rpc.batch(calls) if calls else asyncio.sleep(0, []),
+                                                  self._gas_price())
+        for reply in replies:
+            if isinstance(reply, RPCError):
+                raise reply  # a failed estimate means the call would revert
+        if gas is None:
+            gas = int(int(replies[0], 16) * GAS_MARGIN)
+        if self.chain_id is None:
+            self.chain_id = int(replies[-1], 16)
+        return gas, gas_price
+
+    def _sign_sync(self, tx: Dict[str, Any]) -> Tuple[str, str]:
+        signed = self.account.sign_transaction(tx)
+        raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+        raw = bytes(raw)
+        return "0x" + raw.hex(), "0x" + bytes(Web3.keccak(raw)).hex()
+
+    async def _sign(self, tx: Dict[str, Any]) -> Tuple[str, str]:
+        """Raw transaction and hash; ECDSA signing is CPU-bound, so it runs off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._sign_sync, dict(tx))
+
+    def _enqueue(self, pending: _Pending):
+        self._queue.append(pending)
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush())
+
+    async def send(self, to: str, data: str = "0x", value: int = 0, gas: Optional[int] = None) -> str:
+        """Sign and submit a transaction; returns its hash once the node accepted it"""
+        return await self.submit(await self.sign(to, data, value, gas), keep_nonce=False)
+
+    async def sign(self, to: str, data: str = "0x", value: int = 0, gas: Optional[int] = None) -> Dict[str, Any]:
+        """Reserve a nonce and sign a transaction without sending it.
+
+        The result (``tx``, ``raw``, ``hash``) is JSON-serializable, so it can be
+        stored before ``submit`` and submitted again after a crash; the node
+        accepts the same signed bytes at most once.
+        """
+        to = Web3.to_checksum_address(to)
+        gas, gas_price = await self._prepare({"from": self.address, "to": to, "data": data, "value": hex(value)}, gas)
+        nonce = await self.nonces.reserve()
+        tx = {
+            "to": to,
+            "data": data,
+            "value": value,
+            "nonce": nonce,
+            "gas": gas,
+            "gasPrice": gas_price,
+            "chainId": self.chain_id,
+        }
+        raw, tx_hash = await self._sign(tx)
+        return {"tx": tx, "raw": raw, "hash": tx_hash}
+
+    async def submit(self, signed: Dict[str, Any], keep_nonce: bool = True) -> str:
+        """Submit a transaction from ``sign``; returns its hash once the node accepted it.
+
+        With ``keep_nonce`` the exact signed bytes are sent: if another
+        transaction used the nonce, ``nonce_taken(error)`` holds for the error
+        raised and the stored transaction can never be mined.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Pending(dict(signed["tx"]), signed["raw"], signed["hash"], future,
+                               renonce=not keep_nonce, fill_gap=True))
+        return await future
+
+    async def replace(self, tx_hash: str, bump: float = REPLACEMENT_BUMP) -> str:
+        """Re-sign a still pending transaction at its nonce with a higher gas price"""
+        sent = self._sent.get(tx_hash)
+        if sent is None:
+            raise ValueError(f"{tx_hash} was not sent by this broadcaster")
+        tx = dict(sent, gasPrice=max(int(sent["gasPrice"] * bump) + 1, await self._gas_price()))
+        raw, new_hash = await self._sign(tx)
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Pending(tx, raw, new_hash, future, renonce=False))
+        return await future
+
+    async def _flush(self):
+        try:
+            await asyncio.sleep(self.linger)
+            while self._queue:
+                self._queue.sort(key=lambda p: p.tx["nonce"])
+                batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+                try:
+                    await self._submit(batch)
+                except Exception as e:
+                    self._abandon(batch, e)
+        finally:
+            self._flusher = None
+
+    def _abandon(self, batch: List[_Pending], error: BaseException):
+        """Unexpected failure while handling a batch: fail whatever is unresolved so no sender hangs"""
+        print(f"Broadcast batch for {self.address} failed: {error}")
+        for pending in batch:
+            if pending in self._queue or pending.future is None or pending.future.done():
+                continue
+            BROADCAST_TXS.labels("failed").inc()
+            pending.future.set_exception(error)
+        # Nonces may now be out of step with the node; re-read on the next send
+        self.nonces.reset()
+
+    def _accepted(self, pending: _Pending, outcome: str = "accepted"):
+        BROADCAST_TXS.labels(outcome).inc()
+        self._sent[pending.hash] = pending.tx
+        while len(self._sent) > SENT_HISTORY:
+            self._sent.popitem(last=False)
+        if pending.future is not None and not pending.future.done():
+            pending.future.set_result(pending.hash)
+
+    def _retry(self, pending: _Pending, error: BaseException) -> bool:
+        pending.attempts += 1
+        if pending.attempts >= MAX_ATTEMPTS:
+            return False
+        self._queue.append(pending)
+        return True
+
+    async def _failed(self, pending: _Pending, error: BaseException, fill: bool = True):
+        BROADCAST_TXS.labels("failed").inc()
+        if pending.future is not None:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+        else:
+            print(f"Gap filler for nonce {pending.tx['nonce']} of {self.address} failed: {error}")
+        # A nonce someone else used leaves no gap
+        if fill and pending.fill_gap and not self.nonces.release(pending.tx["nonce"]):
+            await self._fill_gap(pending.tx["nonce"])
+
+    async def _fill_gap(self, nonce: int):
+        """Zero-value self-transfer at ``nonce`` so later transactions can be mined"""
+        try:
+            gas_price = await self._gas_price()
+        except (RPCError, asyncio.TimeoutError, OSError) as e:
+            # The next send re-reads the pending nonce, which stops at the gap, and fills it
+            print(f"Could not fill nonce {nonce} of {self.address}: {e}")
+            self.nonces.reset()
+            return
+        tx = {
+            "to": self.address,
+            "value": 0,
+            "nonce": nonce,
+            "gas": 21000,
+            "gasPrice": gas_price,
+            "chainId": self.chain_id,
+        }
+        raw, tx_hash = await self._sign(tx)
+        BROADCAST_TXS.labels("gap_filled").inc()
+        self._queue.append(_Pending(tx, raw, tx_hash, None, renonce=False))
+
+    async def _submit(self, batch: List[_Pending]):
+        BROADCAST_BATCH.observe(len(batch))
+        try:
+            replies = await self.rpc.batch([("eth_sendRawTransaction", [p.raw]) for p in batch])
+        except (RPCError, asyncio.TimeoutError, OSError) as e:
+            # The batch may or may not have arrived; resending is safe ("already known")
+            for pending in batch:
+                if not self._retry(pending, e):
+                    await self._failed(pending, e)
+            return
+        taken = []
+        for pending, reply in zip(batch, replies):
+            if not isinstance(reply, RPCError):
+                self._accepted(pending)
+            elif _already_known(reply):
+                self._accepted(pending, "known")
+            elif nonce_taken(reply):
+                taken.append((pending, reply))
+            else:
+                await self._failed(pending, reply)
+        if taken:
+            await self._recover(taken)
+
+    async def _recover(self, taken: List[Tuple[_Pending, RPCError]]):
+        """Nonce already used: by this very transaction on an earlier attempt, or by another one"""
+        try:
+            known = await self.rpc.batch([("eth_getTransactionByHash", [p.hash]) for p, _ in taken])
+        except (RPCError, asyncio.TimeoutError, OSError) as e:
+            # Unknown whether they went out; resubmitting answers that again
+            for pending, _ in taken:
+                if not self._retry(pending, e):
+                    await self._failed(pending, e, fill=False)
+            return
+        resync = False
+        for (pending, error), found in zip(taken, known):
+            if isinstance(found, dict):
+                self._accepted(pending, "known")
+            elif not pending.renonce:
+                BROADCAST_TXS.labels("failed").inc()
+                if pending.future is not None and not pending.future.done():
+                    pending.future.set_exception(error)
+            else:
+                resync = True
+        if not resync:
+            return
+        try:
+            await self.nonces.sync()
+        except (RPCError, asyncio.TimeoutError, OSError) as e:
+            for (pending, _), found in zip(taken, known):
+                if not isinstance(found, dict) and pending.renonce and not self._retry(pending, e):
+                    await self._failed(pending, e, fill=False)
+            return
+        for (pending, error), found in zip(taken, known):
+            if isinstance(found, dict) or not pending.renonce:
+                continue
+            pending.tx["nonce"] = await self.nonces.reserve()
+            pending.raw, pending.hash = await self._sign(pending.tx)
+            BROADCAST_TXS.labels("renonced").inc()
+            if not self._retry(pending, error):
+                await self._failed(pending, error)
+
+
+_broadcasters: Dict[Tuple[str, str], Broadcaster] = {}
+
+
+def get_broadcaster(network: str = "testnet", private_key: Optional[str] = None) -> Optional[Broadcaster]:
+    """Shared broadcaster for a signer (``AGENT_PRIVATE_KEY`` by default), or None if no key is configured"""
+    key = private_key or os.getenv("AGENT_PRIVATE_KEY") or None
+    if key is None:
+        return None
+    account = Account.from_key(key)
+    broadcaster = _broadcasters.get((network, account.address))
+    if broadcaster is None:
+        broadcaster = _broadcasters[(network, account.address)] = Broadcaster(account, network)
+    return broadcaster
@@ -0,0 +1,469 @@
+"""
+Shared Cache for Smart Sonic
+One cache API over interchangeable backends so several uvicorn workers can
+share fetched blocks, receipts and balances instead of each refetching them
+
+    CACHE_BACKEND=memory   per-process LRU (default)
+    CACHE_BACKEND=shm      mmap'd file under /dev/shm shared by workers on one host
+    CACHE_BACKEND=redis    any Redis-protocol server at CACHE_URL
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from services.metrics import CACHE_HITS, CACHE_MISSES, OPERATION_ERRORS
+
+# Values above this size are zlib-compressed when that makes them smaller
+COMPRESS_THRESHOLD = 512
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON, zlib-compressed when large; the first byte tags the encoding"""
+    data = json.dumps(value, separators=(",", ":")).encode()
+    if len(data) > COMPRESS_THRESHOLD:
+        packed = zlib.compress(data, 1)
+        if len(packed) < len(data):
+            return b"z" + packed
+    return b"j" + data
+
+
+def loads(data: bytes) -> Any:
+    if data[:1] == b"z":
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+
+class CacheBackend:
+    """Byte-level storage; every backend is async so Redis fits the same interface"""
+
+    name = "base"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def status(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU with optional expiry"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("CACHE_MEMORY_ENTRIES", "50000"))
+        self._data: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires and expires < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._data[key] = (value, time.time() + ttl if ttl else 0.0)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def status(self) -> Dict[str, Any]:
+        return {"backend": self.name, "entries": len(self._data), "max_entries": self.max_entries}
+
+
+class SharedMemoryBackend(CacheBackend):
+    """Fixed-size, set-associative hash table in an mmap'd file.
+
+    Every worker on the host maps the same file (``/dev/shm`` keeps it in RAM).
+    Keys hash to a set of ``WAYS`` slots; a write replaces the same key, an
+    empty or expired slot, or else the oldest write in the set. Values larger
+    than a slot are not cached. ``flock`` serialises writers across processes;
+    readers take a shared lock so they never see a half-written slot. Locks
+    are taken without blocking and retried with a short async backoff, so a
+    worker waiting on another process's write never stalls its event loop.
+    """
+
+    name = "shm"
+    MAGIC = b"SSC2"
+    HEADER = struct.Struct("<4sII")          # magic, slot size, slot count
+    SLOT = struct.Struct("<QddHI")           # key hash, expires (0 = never), written, key length, value length
+    WAYS = 4
+    # Lock retry backoff bounds (seconds); critical sections take microseconds
+    LOCK_BACKOFF = (0.00005, 0.005)
+
+    def __init__(self, path: Optional[str] = None, size_mb: Optional[float] = None,
+                 slot_bytes: Optional[int] = None):
+        default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.path = path or os.getenv("CACHE_SHM_PATH", os.path.join(default_dir, "smart-sonic-cache"))
+        size = int((size_mb or float(os.getenv("CACHE_SHM_SIZE_MB", "64"))) * 1024 * 1024)
+        self.slot_bytes = slot_bytes or int(os.getenv("CACHE_SHM_SLOT_KB", "8")) * 1024
+        self.sets = max(1, (size - self.HEADER.size) // (self.slot_bytes * self.WAYS))
+        self.slots = self.sets * self.WAYS
+        self.too_large = 0
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, self.HEADER.size, 0)
+            if len(header) == self.HEADER.size and header[:4] == self.MAGIC:
+                # Another worker created the table; other processes may have it
+                # mapped, so adopt its geometry rather than resizing it
+                _, self.slot_bytes, self.slots = self.HEADER.unpack(header)
+                self.sets = self.slots // self.WAYS
+            else:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.HEADER.size + self.slots * self.slot_bytes)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, self.slot_bytes, self.slots), 0)
+            self._map = mmap.mmap(self._fd, self.HEADER.size + self.slots * self.slot_bytes)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _hash(key: bytes) -> int:
+        # 0 marks an empty slot, so never hand it out
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+    def _offset(self, index: int) -> int:
+        return self.HEADER.size + index * self.slot_bytes
+
+    def _find(self, key: bytes, key_hash: int, now: float) -> Tuple[Optional[int], int]:
+        """(offset of the live slot holding key, offset of the best slot to write)"""
+        first = (key_hash % self.sets) * self.WAYS
+        victim, victim_rank = None, None
+        for index in range(first, first + self.WAYS):
+            offset = self._offset(index)
+            slot_hash, expires, written, key_len, _ = self.SLOT.unpack_from(self._map, offset)
+            start = offset + self.SLOT.size
+            if slot_hash == key_hash and self._map[start:start + key_len] == key:
+                if expires and expires < now:
+                    return None, offset
+                return offset, offset
+            rank = -1.0 if slot_hash == 0 or (expires and expires < now) else written
+            if victim is None or rank < victim_rank:
+                victim, victim_rank = offset, rank
+        return None, victim
+
+    async def _lock(self, operation: int):
+        delay, ceiling = self.LOCK_BACKOFF
+        while True:
+            try:
+                fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, ceiling)
+
+    def _read(self, raw: bytes, now: float) -> Optional[bytes]:
+        offset, _ = self._find(raw, self._hash(raw), now)
+        if offset is None:
+            return None
+        _, _, _, key_len, value_len = self.SLOT.unpack_from(self._map, offset)
+        start = offset + self.SLOT.size + key_len
+        return bytes(self._map[start:start + value_len])
+
+    async def get(self, key: str) -> Optional[bytes]:
+        await self._lock(fcntl.LOCK_SH)
+        try:
+            return self._read(key.encode(), time.time())
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        await self._lock(fcntl.LOCK_SH)
+        try:
+            now = time.time()
+            return [self._read(key.encode(), now) for key in keys]
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        raw = key.encode()
+        if self.SLOT.size + len(raw) + len(value) > self.slot_bytes:
+            self.too_large += 1
+            return
+        key_hash = self._hash(raw)
+        await self._lock(fcntl.LOCK_EX)
+        try:
+            now = time.time()
+            _, offset = self._find(raw, key_hash, now)
+            self.SLOT.pack_into(self._map, offset, key_hash, now + ttl if ttl else 0.0, now, len(raw), len(value))
+            start = offset + self.SLOT.size
+            self._map[start:start + len(raw)] = raw
+            self._map[start + len(raw):start + len(raw) + len(value)] = value
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    async def delete(self, key: str):
+        raw = key.encode()
+        await self._lock(fcntl.LOCK_EX)
+        try:
+            offset, _ = self._find(raw, self._hash(raw), time.time())
+            if offset is not None:
+                self.SLOT.pack_into(self._map, offset, 0, 0.0, 0.0, 0, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    async def close(self):
+        if not self._map.closed:
+            self._map.close()
+            os.close(self._fd)
+
+    def status(self) -> Dict[str, Any]:
+        return {"backend": self.name, "path": self.path, "slots": self.slots,
+                "slot_bytes": self.slot_bytes, "too_large": self.too_large}
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend(CacheBackend):
+    """Minimal RESP2 client (GET/MGET/SET PX/DEL) over a small connection pool"""
+
+    name = "redis"
+
+    def __init__(self, url: Optional[str] = None, pool_size: Optional[int] = None, timeout: float = 1.0):
+        self.url = url or os.getenv("CACHE_URL", "redis://127.0.0.1:6379/0")
+        parsed = urlparse(self.url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.pool_size = pool_size or int(os.getenv("CACHE_REDIS_POOL", "8"))
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def _encode(*parts: Any) -> bytes:
+        out = [b"*%d\r\n" % len(parts)]
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _read(self, reader: asyncio.StreamReader) -> Any:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            return [await self._read(reader) for _ in range(int(rest))]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                writer.write(self._encode("AUTH", self.password))
+                await self._read(reader)
+            if self.db:
+                writer.write(self._encode("SELECT", self.db))
+                await self._read(reader)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _connect(self):
+        # An unreachable host must fail within the timeout (and count as a miss), not the OS connect timeout
+        return await asyncio.wait_for(self._open(), self.timeout)
+
+    async def _command(self, *parts: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections belong to one loop; drop them if the loop changed
+            self._idle, self._loop = [], loop
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else await self._connect()
+            try:
+                reader, writer = connection
+                writer.write(self._encode(*parts))
+                reply = await asyncio.wait_for(self._read(reader), self.timeout)
+            except BaseException:
+                connection[1].close()
+                raise
+            self._idle.append(connection)
+            return reply
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._command("GET", key)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self._command("MGET", *keys)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl:
+            await self._command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            await self._command("SET", key, value)
+
+    async def delete(self, key: str):
+        await self._command("DEL", key)
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+    def status(self) -> Dict[str, Any]:
+        return {"backend": self.name, "url": f"redis://{self.host}:{self.port}/{self.db}"}
+
+
+class Cache:
+    """Namespaced, serialising front end over a backend with hit/miss metrics.
+
+    Backend failures are counted and treated as misses so an unavailable cache
+    only costs the RPC calls it would have saved.
+    """
+
+    def __init__(self, namespace: str, backend: CacheBackend, default_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Any:
+        try:
+            data = await self.backend.get(self._key(key))
+        except Exception:
+            OPERATION_ERRORS.labels(f"cache_{self.backend.name}").inc()
+            data = None
+        if data is None:
+            CACHE_MISSES.labels(self.namespace).inc()
+            return None
+        CACHE_HITS.labels(self.namespace).inc()
+        return loads(data)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Any]:
+        try:
+            found = await self.backend.get_many([self._key(key) for key in keys])
+        except Exception:
+            OPERATION_ERRORS.labels(f"cache_{self.backend.name}").inc()
+            found = [None] * len(keys)
+        hits = sum(1 for data in found if data is not None)
+        CACHE_HITS.labels(self.namespace).inc(hits)
+        CACHE_MISSES.labels(self.namespace).inc(len(keys) - hits)
+        return [loads(data) if data is not None else None for data in found]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if value is None:
+            return
+        try:
+            await self.backend.set(self._key(key), dumps(value), ttl or self.default_ttl)
+        except Exception:
+            OPERATION_ERRORS.labels(f"cache_{self.backend.name}").inc()
+
+    async def delete(self, key: str):
+        try:
+            await self.backend.delete(self._key(key))
+        except Exception:
+            OPERATION_ERRORS.labels(f"cache_{self.backend.name}").inc()
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Cached value, or fetch it once (concurrent callers share the fetch) and store it"""
+        value = await self.get(key)
+        if value is not None:
+            return value
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+            await self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                # Nobody may be waiting; don't warn about an unretrieved exception
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+_backend: Optional[CacheBackend] = None
+_caches: Dict[str, Cache] = {}
+
+
+def create_backend(kind: Optional[str] = None) -> CacheBackend:
+    kind = (kind or os.getenv("CACHE_BACKEND", "memory")).lower()
+    if kind == "shm":
+        return SharedMemoryBackend()
+    if kind == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+def get_cache(namespace: str, default_ttl: Optional[float] = None) -> Cache:
+    """Process-wide cache for a namespace on the backend chosen by CACHE_BACKEND"""
+    global _backend
+    cache = _caches.get(namespace)
+    if cache is None:
+        if _backend is None:
+            _backend = create_backend()
+        cache = _caches[namespace] = Cache(namespace, _backend, default_ttl)
+    return cache
+
+
+def cache_status() -> Dict[str, Any]:
+    return {**(_backend.status() if _backend else {"backend": None}), "namespaces": sorted(_caches)}
+
+
+async def close_cache():
+    if _backend is not None:
+        await _backend.close()
@@ -0,0 +1,83 @@
+"""
+Chain Head Follower for Smart Sonic
+The leader worker polls the head block and gas price once and publishes them
+to the shared cache; every worker reads the published head instead of
+calling eth_blockNumber per request
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from services.cache import get_cache
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient, get_rpc_client
+
+HEAD_BLOCK = registry.gauge("sonic_chain_head_block", "Latest block seen by the head follower", ["network"])
+HEAD_FALLBACKS = registry.counter(
+    "sonic_chain_head_fallbacks_total", "Head reads that fell back to RPC because nothing fresh was published",
+    ["network"]
+)
+
+
+class HeadFollower:
+    """Publishes ``{"number", "gasPrice", "updated"}`` for one network"""
+
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None,
+                 interval: Optional[float] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.interval = interval or float(os.getenv("HEAD_POLL_INTERVAL", "1.0"))
+        # A head older than a few polls means the leader is gone or stuck
+        self.max_age = self.interval * 3
+        self.cache = get_cache("chain")
+        self.key = f"head:{network}"
+        self._polling: Optional[asyncio.Future] = None
+
+    async def poll(self) -> Dict[str, Any]:
+        number, gas_price = await self.rpc.batch([("eth_blockNumber", []), ("eth_gasPrice", [])])
+        if isinstance(number, RPCError):
+            raise number
+        head = {
+            "number": int(number, 16),
+            "gasPrice": int(gas_price, 16) if not isinstance(gas_price, RPCError) else None,
+            "updated": time.time(),
+        }
+        await self.cache.set(self.key, head, ttl=self.max_age * 10)
+        HEAD_BLOCK.labels(self.network).set(head["number"])
+        return head
+
+    async def run(self):
+        """Leader job: poll until cancelled"""
+        while True:
+            try:
+                await self.poll()
+            except (RPCError, asyncio.TimeoutError, OSError) as e:
+                print(f"Head poll for {self.network} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def head(self) -> Dict[str, Any]:
+        """Published head if fresh, otherwise poll the node directly"""
+        head = await self.cache.get(self.key)
+        if head is not None and time.time() - head["updated"] <= self.max_age:
+            return head
+        HEAD_FALLBACKS.labels(self.network).inc()
+        # Concurrent readers share one fallback poll
+        if self._polling is None:
+            self._polling = asyncio.ensure_future(self.poll())
+            self._polling.add_done_callback(lambda _: setattr(self, "_polling", None))
+        return await asyncio.shield(self._polling)
+
+    async def block_number(self) -> int:
+        return (await self.head())["number"]
+
+
+_followers: Dict[str, HeadFollower] = {}
+
+
+def get_head_follower(network: str = "testnet") -> HeadFollower:
+    follower = _followers.get(network)
+    if follower is None:
+        follower = _followers[network] = HeadFollower(network)
+    return follower
@@ -0,0 +1,208 @@
+"""
+Circuit Breaker and Stale-While-Revalidate for Smart Sonic
+Fails fast while an RPC method is down and serves the last known good value,
+marked stale, until a background probe sees the node recover
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+import aiohttp
+
+from services.metrics import registry
+from services.rpc_client import RPCError
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+CIRCUIT_STATE = registry.gauge(
+    "sonic_circuit_state", "Circuit breaker state per RPC endpoint/method (0 closed, 1 open, 2 half-open)",
+    ["circuit"]
+)
+CIRCUIT_OPENED = registry.counter(
+    "sonic_circuit_opened_total", "Times a circuit breaker tripped open", ["circuit"]
+)
+STALE_SERVED = registry.counter(
+    "sonic_stale_responses_total", "Responses served from the last known good value", ["circuit"]
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a method whose circuit is open and has no known good value"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name}: circuit open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_outage(error: BaseException) -> bool:
+    """True for failures that say the node is unhealthy, not that the request was bad"""
+    if isinstance(error, RPCError):
+        # 429s and unusable responses; JSON-RPC errors about the request itself don't count
+        return error.code == 429 or error.message == "invalid response"
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, OSError, ValueError))
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive outages; after
+    ``reset_timeout`` one probe is let through (half-open) and its outcome
+    closes the circuit or opens it again."""
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = reset_timeout or float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        CIRCUIT_STATE.labels(name).set(0)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go to the node now; in half-open only the single probe may"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.retry_after() <= 0:
+            self._set_state(HALF_OPEN)
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+            CIRCUIT_OPENED.labels(self.name).inc()
+
+    def release(self):
+        """The probe ended without telling us anything about the node; allow another"""
+        if self.state == HALF_OPEN:
+            self._set_state(OPEN)
+            self.opened_at = time.monotonic() - self.reset_timeout
+
+
+class StaleWhileRevalidate:
+    """Last known good values per key behind one circuit breaker.
+
+    ``get`` calls ``fetch`` while the circuit is closed and remembers the result.
+    On an outage, or while the circuit is open, it returns the remembered value
+    with its age instead (``stale_age`` is None for fresh values) and refreshes it
+    in the background once the breaker lets a probe through. Without a
+    remembered value the error (or CircuitOpenError) is raised.
+    """
+
+    def __init__(self, name: str, max_entries: Optional[int] = None, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name)
+        self.max_entries = max_entries or int(os.getenv("STALE_CACHE_SIZE", "10000"))
+        self._values: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._revalidating: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _remember(self, key: Hashable, value: Any):
+        self._values[key] = (value, time.time())
+        self._values.move_to_end(key)
+        if len(self._values) > self.max_entries:
+            self._values.popitem(last=False)
+
+    def _stale(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        STALE_SERVED.labels(self.name).inc()
+        return entry[0], time.time() - entry[1]
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if is_outage(e):
+                self.breaker.record_failure()
+            else:
+                # The node answered; the request was the problem
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        self._remember(key, value)
+        return value
+
+    def _revalidate(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        if key in self._revalidating or not self.breaker.allow():
+            return
+        self._revalidating.add(key)
+
+        async def run():
+            try:
+                await self._fetch(key, fetch)
+            except Exception:
+                pass
+            finally:
+                self._revalidating.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[float]]:
+        """Return ``(value, stale_age_seconds)``"""
+        if self.breaker.state != CLOSED:
+            stale = self._stale(key)
+            if stale is not None:
+                self._revalidate(key, fetch)
+                return stale
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.name, self.breaker.retry_after())
+        try:
+            return await self._fetch(key, fetch), None
+        except Exception as e:
+            stale = self._stale(key) if is_outage(e) else None
+            if stale is None:
+                raise
+            return stale
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "retry_after_s": round(self.breaker.retry_after(), 1) if self.breaker.state == OPEN else 0,
+            "known_values": len(self._values),
+        }
+
+
+_readers: Dict[str, StaleWhileRevalidate] = {}
+
+
+def stale_reader(network: str, method: str) -> StaleWhileRevalidate:
+    """Process-wide reader (and breaker) for one network and method.
+
+    The breaker sits in front of the network's whole client: with an RPC
+    pool, a single bad endpoint is ejected by the pool and only the pool as
+    a whole failing opens the circuit.
+    """
+    name = f"{network} {method}"
+    reader = _readers.get(name)
+    if reader is None:
+        reader = _readers[name] = StaleWhileRevalidate(name)
+    return reader
+
+
+def circuit_status() -> Dict[str, Any]:
+    return {name: reader.status() for name, reader in sorted(_readers.items())}
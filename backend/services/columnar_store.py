@@ -0,0 +1,260 @@
+"""
+Columnar Transaction Store for Smart Sonic
+Indexed transactions kept as fixed-width NumPy columns (optionally memory
+mapped files) with batch hex decoding, so analytics over millions of rows are
+vectorized array operations instead of per-row dicts and int(x, 16)
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+WEI_PER_GWEI = 10 ** 9
+SECONDS_PER_DAY = 86400
+
+# "0x" plus 16 hex digits is the widest quantity that fits in a uint64
+_U64_CHARS = 18
+_U64_MAX = 2 ** 64 - 1
+
+COLUMNS: Dict[str, str] = {
+    "block": "u8",
+    "timestamp": "i8",
+    "tx_index": "u4",
+    "hash": "S32",
+    "sender": "S20",
+    "recipient": "S20",
+    "value_gwei": "u8",       # value = value_gwei * 1e9 + value_rem, exact up to ~1.8e10 S
+    "value_rem": "u4",
+    "gas_price": "u8",
+    "gas_used": "u8",
+    "status": "u1",           # 1 success, 0 failed, 2 unknown (no receipt)
+}
+
+
+def decode_hex_u64(values: Sequence[Optional[str]]) -> np.ndarray:
+    """Decode "0x..." quantities of up to 16 hex digits into a uint64 array.
+
+    The digits are zero-padded to fixed width, decoded with a single
+    bytes.fromhex call and viewed as big-endian words, so there is no per-item
+    int() or dict churn. Raises ValueError for wider values (see decode_value).
+    """
+    if not len(values):
+        return np.zeros(0, dtype=np.uint64)
+    digits = "".join([(v or "0x0")[2:].rjust(16, "0") for v in values])
+    if len(digits) != 16 * len(values):
+        raise ValueError("hex quantity wider than 64 bits")
+    return np.frombuffer(bytes.fromhex(digits), dtype=">u8").astype(np.uint64)
+
+
+def decode_value(values: Sequence[Optional[str]]):
+    """Wei quantities of any width as (gwei uint64, remainder uint32) columns"""
+    values = [v or "0x0" for v in values]
+    wide = [i for i, v in enumerate(values) if len(v) > _U64_CHARS]
+    narrow = list(values)
+    for i in wide:
+        narrow[i] = "0x0"
+    wei = decode_hex_u64(narrow)
+    gwei = wei // np.uint64(WEI_PER_GWEI)
+    rem = (wei % np.uint64(WEI_PER_GWEI)).astype(np.uint32)
+    # Values of 2**64 wei (~18.4 S) and more are rare; decode those individually
+    for i in wide:
+        quotient, remainder = divmod(int(values[i], 16), WEI_PER_GWEI)
+        gwei[i], rem[i] = min(quotient, _U64_MAX), remainder
+    return gwei, rem
+
+
+def decode_fixed_bytes(values: Sequence[Optional[str]], width: int) -> np.ndarray:
+    """Hex addresses/hashes into an S<width> array with one bytes.fromhex call"""
+    empty = "0" * (width * 2)
+    joined = "".join((v[2:] if v else empty) or empty for v in values)
+    return np.frombuffer(bytes.fromhex(joined), dtype=f"S{width}").copy()
+
+
+def address_bytes(address: str) -> bytes:
+    return bytes.fromhex(address[2:] if address.startswith("0x") else address)
+
+
+class TransactionColumns:
+    """Append-only columnar table of transactions.
+
+    With a ``directory`` every column is a memory-mapped ``<name>.bin`` file and
+    ``meta.json`` records the row count, so the store survives restarts and
+    the OS pages columns in on demand; without one it lives in growable
+    in-memory arrays. Blocks must be appended in ascending order.
+    """
+
+    def __init__(self, directory: Optional[str] = None, capacity: int = 4096):
+        self.directory = directory
+        self.rows = 0
+        self.last_block: Optional[int] = None
+        self.capacity = capacity
+        self._columns: Dict[str, np.ndarray] = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            meta = self._read_meta()
+            self.rows = meta.get("rows", 0)
+            self.last_block = meta.get("last_block")
+            self.capacity = max(capacity, meta.get("capacity", 0))
+        self._allocate(self.capacity)
+
+    # Storage
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _allocate(self, capacity: int):
+        for name, dtype in COLUMNS.items():
+            if self.directory:
+                path = os.path.join(self.directory, f"{name}.bin")
+                size = capacity * np.dtype(dtype).itemsize
+                with open(path, "ab") as f:
+                    if f.tell() < size:
+                        f.truncate(size)
+                self._columns[name] = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity,))
+            else:
+                grown = np.zeros(capacity, dtype=dtype)
+                old = self._columns.get(name)
+                if old is not None:
+                    grown[:self.rows] = old[:self.rows]
+                self._columns[name] = grown
+        self.capacity = capacity
+
+    def _reserve(self, extra: int):
+        if self.rows + extra <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < self.rows + extra:
+            capacity *= 2
+        if self.directory:
+            self.flush()
+        self._allocate(capacity)
+
+    def flush(self):
+        if not self.directory:
+            return
+        for column in self._columns.values():
+            column.flush()
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"rows": self.rows, "last_block": self.last_block, "capacity": self.capacity}, f)
+        os.replace(tmp, self._meta_path())
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name][:self.rows]
+
+    # Ingestion
+
+    def append_block(self, block: Dict[str, Any], receipts: Optional[Dict[str, Dict[str, Any]]] = None) -> int:
+        """Append a full block's transactions (with receipts by hash, if known)"""
+        number = int(block["number"], 16)
+        if self.last_block is not None and number <= self.last_block:
+            return 0
+        txs = [tx for tx in block.get("transactions", []) if isinstance(tx, dict)]
+        timestamp = int(block.get("timestamp") or "0x0", 16)
+        added = self.append_transactions(txs, receipts or {}, number, timestamp)
+        self.last_block = number
+        return added
+
+    def append_transactions(self, txs: List[Dict[str, Any]], receipts: Dict[str, Dict[str, Any]],
+                            block: int, timestamp: int) -> int:
+        n = len(txs)
+        if not n:
+            return 0
+        self._reserve(n)
+        start, end = self.rows, self.rows + n
+        found = [receipts.get(tx.get("hash")) for tx in txs]
+        gwei, rem = decode_value([tx.get("value") for tx in txs])
+        columns = self._columns
+        columns["block"][start:end] = block
+        columns["timestamp"][start:end] = timestamp
+        columns["tx_index"][start:end] = decode_hex_u64([tx.get("transactionIndex") for tx in txs])
+        columns["hash"][start:end] = decode_fixed_bytes([tx.get("hash") for tx in txs], 32)
+        columns["sender"][start:end] = decode_fixed_bytes([tx.get("from") for tx in txs], 20)
+        columns["recipient"][start:end] = decode_fixed_bytes([tx.get("to") for tx in txs], 20)
+        columns["value_gwei"][start:end] = gwei
+        columns["value_rem"][start:end] = rem
+        columns["gas_price"][start:end] = decode_hex_u64(
+            [tx.get("effectiveGasPrice") or tx.get("gasPrice") for tx in txs]
+        )
+        columns["gas_used"][start:end] = decode_hex_u64([r.get("gasUsed") if r else None for r in found])
+        columns["status"][start:end] = [2 if r is None else (1 if r.get("status") == "0x1" else 0) for r in found]
+        self.rows = end
+        return n
+
+    # Vectorized analytics
+
+    def involving(self, address: str) -> np.ndarray:
+        """Boolean mask of rows sent from or to an address"""
+        target = np.bytes_(address_bytes(address))
+        return (self.column("sender") == target) | (self.column("recipient") == target)
+
+    def values_s(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        gwei, rem = self.column("value_gwei"), self.column("value_rem")
+        if mask is not None:
+            gwei, rem = gwei[mask], rem[mask]
+        return gwei * 1e-9 + rem * 1e-18
+
+    def fees_s(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        gas_used, gas_price = self.column("gas_used"), self.column("gas_price")
+        if mask is not None:
+            gas_used, gas_price = gas_used[mask], gas_price[mask]
+        return gas_used.astype(np.float64) * gas_price.astype(np.float64) * 1e-18
+
+    def total_volume(self, mask: Optional[np.ndarray] = None) -> float:
+        return float(self.values_s(mask).sum())
+
+    def total_volume_wei(self, mask: Optional[np.ndarray] = None) -> int:
+        """Exact volume in wei: 32-bit halves keep the uint64 sums from overflowing"""
+        gwei, rem = self.column("value_gwei"), self.column("value_rem")
+        if mask is not None:
+            gwei, rem = gwei[mask], rem[mask]
+        low = int((gwei & np.uint64(0xFFFFFFFF)).sum(dtype=np.uint64))
+        high = int((gwei >> np.uint64(32)).sum(dtype=np.uint64))
+        return ((high << 32) + low) * WEI_PER_GWEI + int(rem.sum(dtype=np.uint64))
+
+    def fees_paid(self, mask: Optional[np.ndarray] = None) -> float:
+        return float(self.fees_s(mask).sum())
+
+    def daily(self, mask: Optional[np.ndarray] = None) -> Dict[str, Dict[str, float]]:
+        """Transaction count, volume and fees per UTC day"""
+        days = self.column("timestamp") // SECONDS_PER_DAY
+        values, fees = self.values_s(mask), self.fees_s(mask)
+        if mask is not None:
+            days = days[mask]
+        if not len(days):
+            return {}
+        unique, index = np.unique(days, return_inverse=True)
+        counts = np.bincount(index)
+        volume = np.bincount(index, weights=values)
+        fee_totals = np.bincount(index, weights=fees)
+        return {
+            str(np.datetime64(int(day), "D")): {"count": int(c), "volume": float(v), "fees": float(f)}
+            for day, c, v, f in zip(unique, counts, volume, fee_totals)
+        }
+
+    def summary(self, mask: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        count = int(mask.sum()) if mask is not None else self.rows
+        return {"transactions": count, "volume_s": self.total_volume(mask), "fees_s": self.fees_paid(mask)}
+
+
+_store: Optional[TransactionColumns] = None
+
+
+def get_transaction_store() -> TransactionColumns:
+    """Process-wide store; TX_STORE_DIR makes it a set of memory-mapped column files"""
+    global _store
+    if _store is None:
+        _store = TransactionColumns(os.getenv("TX_STORE_DIR") or None)
+    return _store
@@ -0,0 +1,119 @@
+"""
+Durable State Store for Smart Sonic
+Indexer state that must never be evicted (per-address aggregates and the
+checkpoint they belong to) lives in a local SQLite file instead of the
+shared cache. A batch of records and its checkpoint are committed in one
+transaction, so a crash or leader change leaves all of a batch applied or
+none of it
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+# SQLite caps bound parameters per statement
+_MAX_KEYS = 500
+
+Entry = Tuple[str, str, Any]
+
+
+class DurableStore:
+    """JSON values by ``(namespace, key)`` in a SQLite file shared by every process on the host.
+
+    Like the job queue, all access goes through one thread so the event loop
+    never blocks on disk.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("STATE_STORE_PATH") or os.path.join(
+            tempfile.gettempdir(), "smart-sonic-state.sqlite3"
+        )
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _db(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    @staticmethod
+    def _read(conn: sqlite3.Connection, namespace: str, keys: Sequence[str]) -> List[Optional[Any]]:
+        found = {}
+        for i in range(0, len(keys), _MAX_KEYS):
+            chunk = keys[i:i + _MAX_KEYS]
+            rows = conn.execute(
+                f"SELECT key, value FROM state WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})",
+                (namespace, *chunk),
+            )
+            found.update((key, json.loads(value)) for key, value in rows)
+        return [found.get(key) for key in keys]
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        return (await self.get_many(namespace, [key]))[0]
+
+    async def get_many(self, namespace: str, keys: Sequence[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        return await self._db(lambda conn: self._read(conn, namespace, list(keys)))
+
+    async def write(self, entries: Sequence[Entry], expect: Optional[Entry] = None) -> bool:
+        """Store every entry in one transaction.
+
+        With ``expect``, the write only happens if that key still holds that
+        value (``None`` for absent); returns whether it was applied.
+        """
+
+        def transaction(conn: sqlite3.Connection) -> bool:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if expect is not None:
+                    namespace, key, value = expect
+                    if self._read(conn, namespace, [key])[0] != value:
+                        conn.execute("ROLLBACK")
+                        return False
+                conn.executemany(
+                    "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+                    [(namespace, key, json.dumps(value)) for namespace, key, value in entries],
+                )
+                conn.execute("COMMIT")
+                return True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        return await self._db(transaction)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_store: Optional[DurableStore] = None
+
+
+def get_durable_store() -> DurableStore:
+    global _store
+    if _store is None:
+        _store = DurableStore()
+    return _store
@@ -0,0 +1,121 @@
+"""
+Fee Estimation for Smart Sonic
+Gas estimates are cached per call shape (plain transfer to an account or to
+a given contract, ERC-20 call on a token, or contract + selector + calldata
+size) and head block, so repeated fee quotes within a block cost no RPC. A miss sends
+eth_estimateGas together with the gas price read in one batched round trip,
+and the gas price itself comes from the published head whenever the leader
+has one
+"""
+
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from services.cache import get_cache
+from services.chain_head import HeadFollower, get_head_follower
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient, get_rpc_client
+
+GAS_ESTIMATES = registry.counter(
+    "sonic_gas_estimates_total", "Gas estimates by call shape and whether they came from the cache",
+    ["network", "shape", "result"]
+)
+
+# transfer, approve and transferFrom
+ERC20_SELECTORS = {"0xa9059cbb", "0x095ea7b3", "0x23b872dd"}
+
+
+def _value(call: Dict[str, Any]) -> int:
+    value = call.get("value") or 0
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def call_shape(call: Dict[str, Any], recipient_is_contract: bool = False) -> Optional[str]:
+    """Cache key for what a call costs, ignoring sender and argument values.
+
+    A plain transfer costs 21000 to an account but runs code when sent to a
+    contract, so those are keyed per contract. Contract calls are keyed by
+    calldata size too, since a call with more (dynamic) arguments does more
+    work. Contract creations and calls sending value from a given sender
+    (whose estimate fails on insufficient funds) are never cached.
+    """
+    to = call.get("to")
+    if not to or (call.get("from") and _value(call)):
+        return None
+    data = call.get("data") or call.get("input") or "0x"
+    if len(data) < 10:
+        return f"transfer:{to.lower()}" if recipient_is_contract else "transfer"
+    selector = data[:10].lower()
+    kind = "erc20" if selector in ERC20_SELECTORS else "contract"
+    return f"{kind}:{to.lower()}:{selector}:{(len(data) - 2) // 2}"
+
+
+class FeeEstimator:
+    """Gas limit and price quotes for one network"""
+
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None,
+                 head: Optional[HeadFollower] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.head = head or (get_head_follower(network) if rpc_client is None else HeadFollower(network, rpc_client))
+        # Keys carry the block number; the TTL only keeps old blocks from piling up
+        self.cache = get_cache(f"gas:{network}", default_ttl=self.head.max_age)
+        self.codes = get_cache(f"code:{network}", default_ttl=float(os.getenv("CODE_CACHE_TTL", "3600")))
+
+    async def is_contract(self, address: str) -> bool:
+        """Whether ``address`` has code (cached; deployments are rare next to fee quotes)"""
+        code = await self.codes.get_or_fetch(address.lower(), lambda: self.rpc.call("eth_getCode", [address, "latest"]))
+        return code not in ("0x", "0x0", "")
+
+    async def gas_price(self) -> int:
+        """Current gas price in wei, from the published head when there is one"""
+        head = await self.head.head()
+        if head.get("gasPrice"):
+            return head["gasPrice"]
+        return int(await self.rpc.call("eth_gasPrice", []), 16)
+
+    async def _fetch(self, call: Dict[str, Any], gas_price: Optional[int]) -> Dict[str, int]:
+        calls = [("eth_estimateGas", [call])]
+        if gas_price is None:
+            calls.append(("eth_gasPrice", []))
+        replies = await self.rpc.batch(calls)
+        for reply in replies:
+            if isinstance(reply, RPCError):
+                raise reply  # a failed estimate means the call would revert
+        return {
+            "gas": int(replies[0], 16),
+            "gasPrice": gas_price if gas_price is not None else int(replies[1], 16),
+        }
+
+    async def estimate(self, call: Dict[str, Any]) -> Tuple[int, int]:
+        """``(gas, gas_price)`` for ``call``, reusing an estimate for the same shape in the same block"""
+        head = await self.head.head()
+        gas_price = head.get("gasPrice") or None
+        shape = call_shape(call)
+        if shape == "transfer" and await self.is_contract(call["to"]):
+            shape = call_shape(call, recipient_is_contract=True)
+        if shape is None:
+            GAS_ESTIMATES.labels(self.network, "uncached", "miss").inc()
+            quote = await self._fetch(call, gas_price)
+            return quote["gas"], quote["gasPrice"]
+
+        fetched = False
+
+        async def fetch() -> Dict[str, int]:
+            nonlocal fetched
+            fetched = True
+            return await self._fetch(call, gas_price)
+
+        quote = await self.cache.get_or_fetch(f"{shape}:{head['number']}", fetch)
+        GAS_ESTIMATES.labels(self.network, shape.split(":", 1)[0], "miss" if fetched else "hit").inc()
+        return quote["gas"], quote["gasPrice"]
+
+
+_estimators: Dict[str, FeeEstimator] = {}
+
+
+def get_fee_estimator(network: str = "testnet") -> FeeEstimator:
+    estimator = _estimators.get(network)
+    if estimator is None:
+        estimator = _estimators[network] = FeeEstimator(network)
+    return estimator
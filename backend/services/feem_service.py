@@ -1,22 +1,29 @@
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from web3 import Web3
 import requests
 
+from services.fee_estimator import FeeEstimator, get_fee_estimator
+from services.rpc_client import SonicRPCClient, get_rpc_client
+
 class FeeMService:
-    def __init__(self):
-        self.rpc_url = "https://rpc.testnet.soniclabs.com"
-        self.web3 = Web3(Web3.HTTPProvider(self.rpc_url))
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.rpc_url = self.rpc.rpc_url
+        # Only used for unit conversion; reads go through self.rpc
+        self.web3 = Web3()
+        self.fees = get_fee_estimator(network) if rpc_client is None else FeeEstimator(network, rpc_client)
 
     async def get_feem_data(self) -> Dict[str, Any]:
         """Get current FeeM (Fee Market) data from Sonic Network"""
         try:
             # Get current gas price
-            gas_price = self.web3.eth.gas_price
+            gas_price = int(await self.rpc.call("eth_gasPrice"), 16)
             gas_price_gwei = self.web3.from_wei(gas_price, 'gwei')
             
             # Get latest block for timing
-            latest_block = self.web3.eth.get_block('latest')
+            latest_block = await self.rpc.call("eth_getBlockByNumber", ["latest", False])
             
             # Calculate average block time (mock for demo)
             avg_block_time = 0.4  # Sonic's sub-second block time
@@ -34,8 +41,8 @@ class FeeMService:
                 "change24h": change_24h,
                 "avgBlockTime": str(avg_block_time),
                 "gasOptimization": gas_optimization,
-                "blockNumber": latest_block.number,
-                "timestamp": latest_block.timestamp
+                "blockNumber": int(latest_block["number"], 16),
+                "timestamp": int(latest_block["timestamp"], 16)
             }
             
         except Exception as e:
@@ -104,8 +111,8 @@ class FeeMService:
     async def _get_optimized_gas_price(self) -> int:
         """Get FeeM optimized gas price"""
         try:
-            # Get current gas price and apply Sonic's FeeM optimization
-            base_gas_price = self.web3.eth.gas_price
+            # Get current gas price (from the published head) and apply Sonic's FeeM optimization
+            base_gas_price = await self.fees.gas_price()
             
             # Sonic's FeeM typically reduces gas costs significantly
             optimized_price = int(base_gas_price * 0.1)  # 90% reduction
@@ -0,0 +1,346 @@
+"""
+Durable Job Queue for Smart Sonic
+Autonomous operations are written to a local SQLite queue before the chat
+response returns and are run by a bounded pool of async workers in every
+uvicorn process. Jobs survive restarts, run by priority, retry with
+exponential backoff, deduplicate on an idempotency key and record their
+progress for the status endpoint
+"""
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.metrics import registry
+
+JOBS_FINISHED = registry.counter("sonic_jobs_total", "Finished job attempts by kind and outcome", ["kind", "outcome"])
+JOB_DURATION = registry.histogram("sonic_job_duration_seconds", "Time spent running one job attempt", ["kind"])
+JOBS_QUEUED = registry.gauge("sonic_job_queue_depth", "Jobs waiting to run (all processes)")
+JOBS_RUNNING = registry.gauge("sonic_jobs_running", "Jobs this process is running")
+
+TERMINAL = ("succeeded", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    lease_until REAL,
+    idempotency_key TEXT UNIQUE,
+    progress TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, run_at);
+"""
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help"""
+
+
+class LeaseLost(Exception):
+    """The job's lease ran out and another worker has claimed it since"""
+
+
+class Job:
+    """A claimed job as its handler sees it"""
+
+    def __init__(self, queue: "JobQueue", row: Dict[str, Any]):
+        self.queue = queue
+        self.row = row
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.payload = row["payload"]
+        self.attempts = row["attempts"]
+        # Kept across attempts, so a retry can tell what an earlier one already did
+        self.progress: Dict[str, Any] = row["progress"]
+
+    async def report(self, **fields: Any):
+        """Merge ``fields`` into the job's progress (visible to pollers immediately).
+
+        Raises ``LeaseLost`` if another worker owns the job now, so a stale
+        attempt stops before it acts on what it was about to record.
+        """
+        self.progress.update(fields)
+        if not await self.queue._update_leased(self.row, "progress = ?, updated = ?",
+                                               (json.dumps(self.progress), time.time())):
+            raise LeaseLost(f"Job {self.id} was claimed by another worker")
+
+
+Handler = Callable[[Job], Awaitable[Any]]
+
+
+def _row(cursor: sqlite3.Cursor, values: tuple) -> Dict[str, Any]:
+    row = {column[0]: value for column, value in zip(cursor.description, values)}
+    for field in ("payload", "progress", "result"):
+        if row.get(field) is not None:
+            row[field] = json.loads(row[field])
+    return row
+
+
+class JobQueue:
+    """SQLite-backed queue shared by every process on the host.
+
+    All database access goes through one thread so the event loop never
+    blocks on disk. A worker claims the most urgent runnable job inside an
+    immediate transaction and holds it under a lease it keeps renewing; if
+    the process dies, the lease runs out and another worker picks the job
+    up again (so handlers must tolerate running twice; ``Job.progress``
+    survives for that). The lease expiry a worker set is its claim token:
+    every later write requires it, so a worker that lost its lease cannot
+    overwrite the attempt that replaced it.
+    """
+
+    def __init__(self, path: Optional[str] = None, workers: Optional[int] = None,
+                 max_attempts: Optional[int] = None, retry_base: Optional[float] = None,
+                 lease_seconds: Optional[float] = None, poll_interval: Optional[float] = None):
+        self.path = path or os.getenv("JOB_QUEUE_PATH") or os.path.join(tempfile.gettempdir(), "smart-sonic-jobs.sqlite3")
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "4"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+        self.retry_base = retry_base or float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+        self.lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", "120"))
+        self.poll_interval = poll_interval or float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+        self._handlers: Dict[str, Handler] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-queue")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        # Claimed rows (with their current lease) by job id
+        self._running: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    # Database access (on the queue's thread)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _db(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    async def _write(self, sql: str, params: tuple = ()):
+        await self._db(lambda conn: conn.execute(sql, params))
+
+    def _update_leased_sync(self, conn: sqlite3.Connection, row: Dict[str, Any], assignments: str,
+                            params: tuple) -> bool:
+        # Runs on the queue's thread, so it always sees the lease the last renewal stored in ``row``
+        cursor = conn.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running' AND lease_until = ?",
+            (*params, row["id"], row["lease_until"]),
+        )
+        return cursor.rowcount > 0
+
+    async def _update_leased(self, row: Dict[str, Any], assignments: str, params: tuple) -> bool:
+        """Update a claimed job only while this worker still holds its lease"""
+        return await self._db(lambda conn: self._update_leased_sync(conn, row, assignments, params))
+
+    def _fetch(self, conn: sqlite3.Connection, sql: str, params: tuple) -> Optional[Dict[str, Any]]:
+        cursor = conn.execute(sql, params)
+        values = cursor.fetchone()
+        return _row(cursor, values) if values else None
+
+    # Producer side
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], priority: int = 0,
+                      idempotency_key: Optional[str] = None, max_attempts: Optional[int] = None) -> Dict[str, Any]:
+        """Persist a job and return it; a repeated ``idempotency_key`` returns the original job"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+
+        def insert(conn: sqlite3.Connection) -> Dict[str, Any]:
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, payload, priority, status, max_attempts, run_at, "
+                "idempotency_key, created, updated) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), priority, max_attempts or self.max_attempts, now,
+                 idempotency_key, now, now),
+            )
+            if idempotency_key is not None:
+                return self._fetch(conn, "SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,))
+            return self._fetch(conn, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+        job = await self._db(insert)
+        if self._wake is not None:
+            self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._db(lambda conn: self._fetch(conn, "SELECT * FROM jobs WHERE id = ?", (job_id,)))
+
+    async def counts(self) -> Dict[str, int]:
+        rows = await self._db(lambda conn: conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return dict(rows)
+
+    # Worker side
+
+    def _claim_sync(self, conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases belong to dead workers; give up on jobs that have used every attempt
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'worker lost'), updated = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            job = self._fetch(
+                conn,
+                "SELECT * FROM jobs WHERE (status = 'queued' AND run_at <= ?) OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY priority DESC, run_at LIMIT 1",
+                (now, now),
+            )
+            if job is not None:
+                job["lease_until"] = now + self.lease_seconds
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated = ? "
+                    "WHERE id = ?",
+                    (job["lease_until"], now, job["id"]),
+                )
+                job["attempts"] += 1
+            conn.execute("COMMIT")
+            return job
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        return await self._db(self._claim_sync)
+
+    async def _heartbeat(self, row: Dict[str, Any]):
+        def renew(conn: sqlite3.Connection) -> bool:
+            lease = time.time() + self.lease_seconds
+            if not self._update_leased_sync(conn, row, "lease_until = ?", (lease,)):
+                return False
+            row["lease_until"] = lease
+            return True
+
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await self._db(renew):
+                print(f"Job {row['id']} lease was lost; another worker owns it now")
+                return
+
+    async def _finish(self, row: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None,
+                      run_at: Optional[float] = None) -> bool:
+        """Record the attempt's outcome; False if the lease was lost and nothing was written"""
+        return await self._update_leased(
+            row, "status = ?, result = ?, error = ?, run_at = COALESCE(?, run_at), lease_until = NULL, updated = ?",
+            (status, json.dumps(result) if result is not None else None, error, run_at, time.time()),
+        )
+
+    async def run_job(self, row: Dict[str, Any]):
+        kind = row["kind"]
+        handler = self._handlers.get(kind)
+        if handler is None:
+            await self._finish(row, "failed", error=f"no handler for job kind {kind!r}")
+            JOBS_FINISHED.labels(kind, "failed").inc()
+            return
+        heartbeat = asyncio.ensure_future(self._heartbeat(row))
+        started = time.perf_counter()
+        try:
+            result = await handler(Job(self, row))
+        except asyncio.CancelledError:
+            raise
+        except LeaseLost:
+            outcome = "lost"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if isinstance(e, PermanentJobError) or row["attempts"] >= row["max_attempts"]:
+                outcome = "failed"
+                finished = await self._finish(row, "failed", error=error)
+            else:
+                # Exponential backoff with jitter so a failing dependency isn't hammered in lockstep
+                delay = self.retry_base * 2 ** (row["attempts"] - 1) * random.uniform(0.5, 1.5)
+                outcome = "retried"
+                finished = await self._finish(row, "queued", error=error, run_at=time.time() + delay)
+            outcome = outcome if finished else "lost"
+        else:
+            outcome = "succeeded" if await self._finish(row, "succeeded", result=result) else "lost"
+        finally:
+            heartbeat.cancel()
+            JOB_DURATION.labels(kind).observe(time.perf_counter() - started)
+        if outcome == "lost":
+            print(f"Job {row['id']} attempt {row['attempts']} finished after its lease was lost; result dropped")
+        JOBS_FINISHED.labels(kind, outcome).inc()
+
+    async def _worker(self):
+        while True:
+            try:
+                row = await self.claim()
+            except sqlite3.Error as e:
+                print(f"Job queue claim failed: {e}")
+                row = None
+            if row is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._running[row["id"]] = row
+            JOBS_RUNNING.set(len(self._running))
+            try:
+                await self.run_job(row)
+            except sqlite3.Error as e:
+                print(f"Job {row['id']} could not be recorded: {e}")
+            finally:
+                self._running.pop(row["id"], None)
+                JOBS_RUNNING.set(len(self._running))
+
+    async def _report_depth(self):
+        while True:
+            try:
+                JOBS_QUEUED.set((await self.counts()).get("queued", 0))
+            except sqlite3.Error as e:
+                print(f"Job queue depth check failed: {e}")
+            await asyncio.sleep(max(self.poll_interval, 5.0))
+
+    def start(self):
+        """Start ``workers`` worker tasks in this process"""
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._report_depth()))
+
+    async def stop(self):
+        """Stop the workers; jobs they were running go back to the queue for the next start"""
+        running = list(self._running.values())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for row in running:
+            await self._update_leased(row, "status = 'queued', attempts = attempts - 1, lease_until = NULL, updated = ?",
+                                      (time.time(),))
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
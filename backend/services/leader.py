@@ -0,0 +1,140 @@
+"""
+Leader Election for Smart Sonic
+Exactly one uvicorn worker on a host runs the background pipelines (head
+follower, indexers, samplers); the others read their output from the shared
+cache and take over when the leader process dies
+"""
+
+import asyncio
+import fcntl
+import os
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.metrics import registry
+
+LEADER = registry.gauge("sonic_leader", "1 while this worker holds the background-job lease", ["lease"])
+JOB_RESTARTS = registry.counter(
+    "sonic_background_job_restarts_total", "Background job crashes followed by a restart", ["job"]
+)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class LeaderElection:
+    """Lease held as an exclusive ``flock`` on a lock file.
+
+    The kernel drops the lock when the holder exits or crashes, so a follower's
+    next attempt (every ``retry_interval`` seconds) takes over without any
+    timeout to tune. Registered jobs run only while this process leads and are
+    restarted with backoff if they raise.
+    """
+
+    def __init__(self, name: str = "background", lock_dir: Optional[str] = None,
+                 retry_interval: Optional[float] = None):
+        self.name = name
+        directory = lock_dir or os.getenv("LEADER_LOCK_DIR", tempfile.gettempdir())
+        self.path = os.path.join(directory, f"smart-sonic-{name}.lock")
+        self.retry_interval = retry_interval or float(os.getenv("LEADER_RETRY_SECONDS", "2"))
+        self.is_leader = False
+        self.since: Optional[float] = None
+        self._fd: Optional[int] = None
+        self._jobs: Dict[str, Job] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        LEADER.labels(name).set(0)
+
+    def register(self, name: str, job: Job):
+        """Run ``job()`` whenever this process is leader"""
+        self._jobs[name] = job
+        if self.is_leader and name not in self._running:
+            self._start_job(name)
+
+    def _try_acquire(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(os.getpid()).encode(), 0)
+        self._fd = fd
+        return True
+
+    def holder(self) -> Optional[int]:
+        """PID recorded by the current leader, if any"""
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def _start_job(self, name: str):
+        job = self._jobs[name]
+
+        async def supervise():
+            backoff = 1.0
+            while True:
+                started = time.monotonic()
+                try:
+                    await job()
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    JOB_RESTARTS.labels(name).inc()
+                    print(f"Background job {name} failed: {e}")
+                # Reset the backoff once a job has run for a while
+                backoff = 1.0 if time.monotonic() - started > 60 else min(backoff * 2, 60.0)
+                await asyncio.sleep(backoff)
+
+        self._running[name] = asyncio.get_running_loop().create_task(supervise(), name=f"job-{name}")
+
+    async def _campaign(self):
+        while True:
+            if not self.is_leader and self._try_acquire():
+                self.is_leader = True
+                self.since = time.time()
+                LEADER.labels(self.name).set(1)
+                print(f"Worker {os.getpid()} is now leader for {self.name} jobs")
+                for name in self._jobs:
+                    self._start_job(name)
+            await asyncio.sleep(self.retry_interval)
+
+    def start(self):
+        """Begin campaigning on the running loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._campaign(), name=f"leader-{self.name}")
+
+    async def stop(self):
+        """Stop jobs and release the lease so another worker takes over immediately"""
+        tasks = list(self._running.values())
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
+        self._task = None
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.is_leader = False
+        LEADER.labels(self.name).set(0)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "lease": self.name,
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "leader_pid": os.getpid() if self.is_leader else self.holder(),
+            "leader_since": self.since if self.is_leader else None,
+            "jobs": {name: ("running" if name in self._running and not self._running[name].done() else "idle")
+                     for name in self._jobs},
+        }
+
+
+leader = LeaderElection()
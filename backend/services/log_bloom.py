@@ -0,0 +1,89 @@
+"""
+Logs Bloom Filters for Smart Sonic
+Every block header carries a 2048-bit bloom of the addresses and topics its
+logs touched. Testing it locally tells us which blocks cannot contain logs
+we watch, so only the rest need receipts
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from web3 import Web3
+
+BLOOM_BYTES = 256
+
+
+@lru_cache(maxsize=8192)
+def bloom_positions(item: bytes) -> Tuple[Tuple[int, int], ...]:
+    """(byte index, mask) of the three bits an address or topic sets.
+
+    Cached: the same contracts, event signatures and accounts recur in every block.
+    """
+    digest = Web3.keccak(item)
+    positions = []
+    for i in (0, 2, 4):
+        bit = ((digest[i] << 8) | digest[i + 1]) & 2047
+        positions.append((BLOOM_BYTES - 1 - (bit >> 3), 1 << (bit & 7)))
+    return tuple(positions)
+
+
+def _item(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def bloom_add(bloom: bytearray, value: str):
+    for index, mask in bloom_positions(_item(value)):
+        bloom[index] |= mask
+
+
+def logs_bloom(logs: Iterable[Dict[str, Any]]) -> str:
+    """Header ``logsBloom`` for a block's logs"""
+    bloom = bytearray(BLOOM_BYTES)
+    for log in logs:
+        bloom_add(bloom, log["address"])
+        for topic in log.get("topics", []):
+            bloom_add(bloom, topic)
+    return "0x" + bloom.hex()
+
+
+class BloomMatcher:
+    """eth_getLogs-style filter (addresses OR'd, topic positions AND'd) tested against blooms.
+
+    Bit positions are hashed once up front, so each block costs a few byte
+    tests. A miss is definite; a hit only means the block may match.
+    """
+
+    def __init__(self, address: Union[str, Sequence[str], None] = None, topics: Optional[Sequence[Any]] = None):
+        addresses = [address] if isinstance(address, str) else list(address or [])
+        self.addresses = {a.lower() for a in addresses}
+        self.topics: List[Optional[set]] = [
+            None if wanted is None else {t.lower() for t in (wanted if isinstance(wanted, list) else [wanted])}
+            for wanted in (topics or [])
+        ]
+        self._groups = []
+        if addresses:
+            self._groups.append([bloom_positions(_item(a)) for a in addresses])
+        for wanted in self.topics:
+            if wanted is not None:
+                self._groups.append([bloom_positions(_item(t)) for t in wanted])
+
+    def may_contain(self, logs_bloom_hex: Optional[str]) -> bool:
+        if not logs_bloom_hex:
+            return True
+        bloom = bytes.fromhex(logs_bloom_hex[2:])
+        return all(
+            any(all(bloom[index] & mask for index, mask in positions) for positions in group)
+            for group in self._groups
+        )
+
+    def matches(self, log: Dict[str, Any]) -> bool:
+        """Exact test of one log against the filter"""
+        if self.addresses and log["address"].lower() not in self.addresses:
+            return False
+        topics = log.get("topics") or []
+        for i, wanted in enumerate(self.topics):
+            if wanted is None:
+                continue
+            if i >= len(topics) or topics[i].lower() not in wanted:
+                return False
+        return True
@@ -0,0 +1,234 @@
+"""
+Adaptive eth_getLogs Scanner for Smart Sonic
+Walks a block range with the widest window the node will answer: windows
+that fail with "too many results", "range too large" or a timeout are split
+in half, windows that come back small let the next ones grow again. Several
+windows are in flight at once but results are emitted in block order, and
+progress is checkpointed so a restarted scan resumes where it stopped.
+In bloom mode (or when the node has no eth_getLogs) it reads headers only,
+tests each logsBloom locally and fetches receipts just for blocks that may
+match
+"""
+
+import asyncio
+import os
+import re
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+from services.cache import get_cache
+from services.log_bloom import BloomMatcher
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient
+
+LOG_SCAN_SPLITS = registry.counter(
+    "sonic_log_scan_splits_total", "eth_getLogs windows split in half after the node refused them", ["scanner"]
+)
+LOG_SCAN_WINDOW = registry.gauge("sonic_log_scan_window_blocks", "Current eth_getLogs window size", ["scanner"])
+LOG_SCAN_BLOOM = registry.counter(
+    "sonic_log_scan_bloom_blocks_total", "Headers tested against the watched filter's bloom bits", ["scanner", "result"]
+)
+
+METHOD_NOT_FOUND = -32601
+
+# Phrases providers use when a range or result set is too large
+_LIMIT_HINTS = (
+    "too many", "more than", "limit", "exceed", "range", "too large", "response size", "timeout", "timed out",
+)
+# Some providers suggest a range that would work: "try with this block range [0x1, 0x2]"
+_SUGGESTED_RANGE = re.compile(r"\[(0x[0-9a-fA-F]+),\s*(0x[0-9a-fA-F]+)\]")
+
+Window = Tuple[int, int, List[Dict[str, Any]]]
+
+# Successful windows before growing past a size that failed once again
+PROBE_AFTER = 64
+
+
+def is_limit_error(error: BaseException) -> bool:
+    """Whether a smaller window could succeed where this one failed"""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, RPCError):
+        # -32005 is the conventional "limit exceeded" code
+        return error.code == -32005 or any(hint in error.message.lower() for hint in _LIMIT_HINTS)
+    return False
+
+
+def suggested_size(error: BaseException) -> Optional[int]:
+    match = _SUGGESTED_RANGE.search(getattr(error, "message", "") or "")
+    if not match:
+        return None
+    return int(match.group(2), 16) - int(match.group(1), 16) + 1
+
+
+class LogScanner:
+    """Ordered, resumable eth_getLogs over ``[start, end]`` for one filter.
+
+    ``async for start, end, logs in scanner.scan(first, last)`` yields
+    consecutive windows. With a ``checkpoint`` name, the window's end is
+    recorded once the consumer asks for the next one (so only handled windows
+    count), and ``resume(default)`` returns the block to start from.
+    """
+
+    def __init__(self, rpc_client: SonicRPCClient, address: Union[str, Sequence[str], None] = None,
+                 topics: Optional[Sequence[Any]] = None, name: str = "logs", checkpoint: Optional[str] = None,
+                 initial_range: Optional[int] = None, max_range: Optional[int] = None,
+                 target_results: Optional[int] = None, concurrency: Optional[int] = None,
+                 mode: Optional[str] = None, header_batch: Optional[int] = None):
+        self.rpc = rpc_client
+        self.address = address
+        self.topics = list(topics) if topics else None
+        self.name = name
+        self.max_range = max_range or int(os.getenv("LOG_SCAN_MAX_RANGE", "10000"))
+        self.range = min(self.max_range, initial_range or int(os.getenv("LOG_SCAN_INITIAL_RANGE", "2000")))
+        self.target_results = target_results or int(os.getenv("LOG_SCAN_TARGET_RESULTS", "2000"))
+        self.concurrency = concurrency or int(os.getenv("LOG_SCAN_CONCURRENCY", "4"))
+        # "logs" asks the node with eth_getLogs; "bloom" filters headers locally first
+        self.mode = mode or os.getenv("LOG_SCAN_MODE", "logs")
+        self.header_batch = header_batch or int(os.getenv("LOG_SCAN_HEADER_BATCH", "100"))
+        self.matcher = BloomMatcher(address, topics)
+        self._block_receipts = True
+        self.checkpoint_key = checkpoint
+        self.checkpoints = get_cache("indexer")
+        # Smallest window size refused so far; growth stops below it until it is probed again
+        self.ceiling: Optional[int] = None
+        self._successes = 0
+        LOG_SCAN_WINDOW.labels(name).set(self.range)
+
+    def criteria(self, start: int, end: int) -> Dict[str, Any]:
+        criteria: Dict[str, Any] = {"fromBlock": hex(start), "toBlock": hex(end)}
+        if self.address:
+            criteria["address"] = self.address
+        if self.topics:
+            criteria["topics"] = self.topics
+        return criteria
+
+    async def checkpoint(self) -> Optional[Dict[str, int]]:
+        """``{"from", "through"}`` covered so far, if checkpointing"""
+        if self.checkpoint_key is None:
+            return None
+        return await self.checkpoints.get(self.checkpoint_key)
+
+    async def resume(self, default: int) -> int:
+        """First block still to scan"""
+        checkpoint = await self.checkpoint()
+        return checkpoint["through"] + 1 if checkpoint else default
+
+    async def _save(self, start: int, end: int):
+        checkpoint = await self.checkpoint()
+        await self.checkpoints.set(self.checkpoint_key, {
+            "from": checkpoint["from"] if checkpoint else start,
+            "through": end,
+        })
+
+    def _resize(self, size: int):
+        self.range = max(1, min(self.max_range, size))
+        LOG_SCAN_WINDOW.labels(self.name).set(self.range)
+
+    def _shrink(self, failed: int, size: int):
+        self.ceiling = failed if self.ceiling is None else min(self.ceiling, failed)
+        self._successes = 0
+        self._resize(min(self.range, size))
+
+    def _grow(self):
+        self._successes += 1
+        size = self.range * 2
+        if self.ceiling is not None and size >= self.ceiling:
+            if self._successes < PROBE_AFTER:
+                size = max(self.range, self.ceiling // 2)
+            else:
+                # Result density changes along the chain; try the larger size again
+                self.ceiling = None
+        self._resize(size)
+
+    async def _batched(self, calls: List[Tuple[str, List[Any]]]) -> List[Any]:
+        chunks = [calls[i:i + self.header_batch] for i in range(0, len(calls), self.header_batch)]
+        replies = await asyncio.gather(*(self.rpc.batch(chunk) for chunk in chunks))
+        return [reply for chunk in replies for reply in chunk]
+
+    async def _receipts(self, headers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """All receipts of the given blocks, per block where the node supports it"""
+        if self._block_receipts:
+            replies = await self._batched([("eth_getBlockReceipts", [header["number"]]) for header in headers])
+            if not any(isinstance(r, RPCError) and r.code == METHOD_NOT_FOUND for r in replies):
+                receipts = []
+                for reply in replies:
+                    if isinstance(reply, RPCError):
+                        raise reply
+                    receipts.extend(reply or [])
+                return receipts
+            self._block_receipts = False
+        hashes = [tx if isinstance(tx, str) else tx["hash"] for header in headers for tx in header.get("transactions", [])]
+        receipts = []
+        for reply in await self._batched([("eth_getTransactionReceipt", [tx_hash]) for tx_hash in hashes]):
+            if isinstance(reply, RPCError):
+                raise reply
+            if reply is not None:
+                receipts.append(reply)
+        return receipts
+
+    async def fetch_bloom(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Logs for one window from headers and the receipts of blocks whose bloom may match"""
+        headers = await self._batched([("eth_getBlockByNumber", [hex(n), False]) for n in range(start, end + 1)])
+        candidates = []
+        for header in headers:
+            if isinstance(header, RPCError):
+                raise header
+            if header is None:
+                raise RPCError("eth_getBlockByNumber", "block not available yet")
+            if self.matcher.may_contain(header.get("logsBloom")):
+                candidates.append(header)
+        LOG_SCAN_BLOOM.labels(self.name, "candidate").inc(len(candidates))
+        LOG_SCAN_BLOOM.labels(self.name, "skipped").inc(len(headers) - len(candidates))
+        if not candidates:
+            return []
+        return [log for receipt in await self._receipts(candidates)
+                for log in receipt.get("logs", []) if self.matcher.matches(log)]
+
+    async def fetch(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Logs for one window, halving it until the node answers"""
+        if self.mode == "bloom":
+            return await self.fetch_bloom(start, end)
+        try:
+            logs = await self.rpc.call("eth_getLogs", [self.criteria(start, end)])
+        except (RPCError, asyncio.TimeoutError) as e:
+            if isinstance(e, RPCError) and e.code == METHOD_NOT_FOUND:
+                print(f"eth_getLogs unavailable for {self.name}; filtering headers by logsBloom instead")
+                self.mode = "bloom"
+                return await self.fetch_bloom(start, end)
+            if start == end or not is_limit_error(e):
+                raise
+            LOG_SCAN_SPLITS.labels(self.name).inc()
+            size = end - start + 1
+            hint = suggested_size(e)
+            half = hint if hint and hint < size else size // 2
+            self._shrink(size, half)
+            middle = start + half - 1
+            left, right = await asyncio.gather(self.fetch(start, middle), self.fetch(middle + 1, end))
+            return left + right
+        logs = logs or []
+        if len(logs) * 2 < self.target_results and end - start + 1 >= self.range:
+            self._grow()
+        return logs
+
+    async def scan(self, start: int, end: int) -> AsyncIterator[Window]:
+        """Yield ``(window_start, window_end, logs)`` for consecutive windows, in block order"""
+        pending: deque = deque()
+        cursor = start
+        try:
+            while cursor <= end or pending:
+                while cursor <= end and len(pending) < self.concurrency:
+                    high = min(end, cursor + self.range - 1)
+                    task = asyncio.ensure_future(self.fetch(cursor, high))
+                    pending.append((cursor, high, task))
+                    cursor = high + 1
+                low, high, task = pending.popleft()
+                logs = await task
+                yield low, high, logs
+                if self.checkpoint_key is not None:
+                    await self._save(low, high)
+        finally:
+            tasks = [task for _, _, task in pending]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
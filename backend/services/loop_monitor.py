@@ -0,0 +1,116 @@
+"""
+Event Loop Lag Monitor for Smart Sonic
+Measures loop lag continuously and logs the stack of whatever is blocking it
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+STACK_DEPTH = 25
+
+LOOP_LAG = registry.gauge("sonic_event_loop_lag_seconds", "Most recent event loop scheduling lag")
+LOOP_LAG_HISTOGRAM = registry.histogram(
+    "sonic_event_loop_lag_distribution_seconds", "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_STALLS = registry.counter("sonic_event_loop_stalls_total", "Times the loop was blocked past the threshold")
+
+
+class LoopLagMonitor:
+    """Heartbeat task on the loop plus a watchdog thread that inspects it.
+
+    The task wakes every ``interval`` seconds and records how late it was. The
+    watchdog thread notices when the heartbeat stops advancing for longer than
+    ``threshold`` and, while the loop is still stuck, grabs the loop thread's
+    current stack so the blocking call shows up by name.
+    """
+
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None,
+                 log_interval: Optional[float] = None):
+        self.interval = interval if interval is not None else float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+        self.threshold = threshold if threshold is not None else float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000
+        self.log_interval = log_interval if log_interval is not None else float(os.getenv("LOOP_STALL_LOG_INTERVAL_S", "30"))
+
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._last_logged = 0.0
+        self._stall_reported = False
+        self.max_lag = 0.0
+
+    def start(self):
+        """Start monitoring the running loop (call from inside it)"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat(), name="loop-lag-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            self._stall_reported = False
+            LOOP_LAG.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def _watch(self):
+        # Poll at a fraction of the threshold so the captured stack is the blocker's
+        poll = max(self.threshold / 4, 0.005)
+        while not self._stopped.wait(poll):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._stall_reported:
+                continue
+            self._stall_reported = True
+            LOOP_STALLS.inc()
+
+            now = time.monotonic()
+            if now - self._last_logged < self.log_interval:
+                continue
+            self._last_logged = now
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            # The innermost frames are the ones that identify the blocking call
+            stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+            logger.warning(
+                "Event loop blocked for %.0fms (threshold %.0fms); loop thread stack:\n%s",
+                stalled_for * 1000, self.threshold * 1000, stack,
+            )
+
+
+loop_monitor = LoopLagMonitor()
+
+
+def loop_monitor_enabled() -> bool:
+    return os.getenv("LOOP_MONITOR_ENABLED", "1").lower() not in ("0", "false", "no")
@@ -0,0 +1,48 @@
+"""
+Multi-Network Fan-Out for Smart Sonic
+Runs the same per-network read against several networks at once (each with
+its own pooled client and cache namespace) and merges the answers, so a
+testnet + mainnet query costs the slower network's latency instead of the sum
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+from services.metrics import OPERATION_ERRORS
+
+
+async def gather_networks(networks: Sequence[str], fetch: Callable[[str], Awaitable[Any]],
+                          operation: str = "multi_network") -> Dict[str, Any]:
+    """``{network: fetch(network)}`` run concurrently; a failing network maps to ``{"error": ...}``"""
+    results = await asyncio.gather(*(fetch(network) for network in networks), return_exceptions=True)
+    merged: Dict[str, Any] = {}
+    for network, result in zip(networks, results):
+        if isinstance(result, Exception):
+            OPERATION_ERRORS.labels(operation).inc()
+            result = {"error": str(result)}
+        merged[network] = result
+    return merged
+
+
+def merge_histories(histories: Dict[str, Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """One newest-first history from per-network TransactionService results.
+
+    Block numbers are not comparable across networks, so entries are ordered
+    by timestamp ("YYYY-mm-dd HH:MM:SS" sorts as text) and tagged with their
+    network.
+    """
+    transactions: List[Dict[str, Any]] = []
+    errors: Dict[str, str] = {}
+    for network, history in histories.items():
+        if not history.get("success", False):
+            errors[network] = history.get("error", "unknown error")
+            continue
+        transactions.extend(dict(tx, network=network) for tx in history["transactions"])
+    transactions.sort(key=lambda tx: tx.get("timestamp") if tx.get("timestamp") != "Unknown" else "", reverse=True)
+    return {
+        "success": len(errors) < len(histories),
+        "networks": list(histories),
+        "transactions": transactions[:limit],
+        "total_found": len(transactions),
+        "errors": errors,
+    }
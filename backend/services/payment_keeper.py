@@ -0,0 +1,315 @@
+"""
+PaymentAutomation Keeper for Smart Sonic
+Mirrors RecurringPaymentCreated/PaymentExecuted events into a min-heap keyed
+by next due time, sleeps until the earliest payment is due, confirms dueness
+with one batched isPaymentDue read and submits executeRecurringPayment (and
+executeBulkPayment for bulk payments the keeper's signer created)
+"""
+
+import asyncio
+import heapq
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from eth_account import Account
+from web3 import Web3
+
+from services.broadcaster import Broadcaster, get_broadcaster
+from services.cache import get_cache
+from services.chain_head import HeadFollower, get_head_follower
+from services.log_scanner import LogScanner
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient, get_rpc_client
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+def _selector(signature: str) -> str:
+    return "0x" + bytes(Web3.keccak(text=signature)[:4]).hex()
+
+
+def _topic(signature: str) -> str:
+    return "0x" + bytes(Web3.keccak(text=signature)).hex()
+
+
+RECURRING_PAYMENT_CREATED = _topic("RecurringPaymentCreated(uint256,address,address,uint256)")
+PAYMENT_EXECUTED = _topic("PaymentExecuted(uint256,address,address,uint256)")
+BULK_PAYMENT_CREATED = _topic("BulkPaymentCreated(uint256,address,uint256)")
+BULK_PAYMENT_EXECUTED = _topic("BulkPaymentExecuted(uint256,address,uint256)")
+EVENTS = [RECURRING_PAYMENT_CREATED, PAYMENT_EXECUTED, BULK_PAYMENT_CREATED, BULK_PAYMENT_EXECUTED]
+
+RECURRING_PAYMENTS = _selector("recurringPayments(uint256)")
+IS_PAYMENT_DUE = _selector("isPaymentDue(uint256)")
+EXECUTE_RECURRING_PAYMENT = _selector("executeRecurringPayment(uint256)")
+EXECUTE_BULK_PAYMENT = _selector("executeBulkPayment(uint256)")
+
+KEEPER_PAYMENTS = registry.gauge("sonic_keeper_payments", "Active recurring payments tracked by the keeper", ["network"])
+KEEPER_EXECUTIONS = registry.counter(
+    "sonic_keeper_executions_total", "Keeper execution attempts", ["network", "kind", "outcome"]
+)
+KEEPER_DUE_READS = registry.counter(
+    "sonic_keeper_due_checks_total", "Payments whose dueness was confirmed on chain before executing", ["network"]
+)
+
+
+def _word(value: int) -> str:
+    return f"{value:064x}"
+
+
+def _words(data: Optional[str]) -> List[int]:
+    raw = (data or "0x")[2:]
+    return [int(raw[i:i + 64], 16) for i in range(0, len(raw) - 63, 64)]
+
+
+def _address(word: int) -> str:
+    return "0x" + f"{word:040x}"[-40:]
+
+
+class PaymentKeeper:
+    """Drives PaymentAutomation for one network.
+
+    The heap holds ``(next_due, payment_id)``; an entry whose time no longer
+    matches the payment's current ``next`` is stale and skipped when popped,
+    so rescheduling is a push, not a search. Payments that were due but could
+    not be executed back off exponentially. Without a signer key the keeper
+    only tracks payments and reports what it would execute.
+    """
+
+    def __init__(self, network: str = "testnet", contract: Optional[str] = None,
+                 rpc_client: Optional[SonicRPCClient] = None, head: Optional[HeadFollower] = None,
+                 private_key: Optional[str] = None, start_block: Optional[int] = None,
+                 scanner: Optional[LogScanner] = None, broadcaster: Optional[Broadcaster] = None):
+        self.network = network
+        self.contract = (contract or os.getenv("PAYMENT_AUTOMATION_ADDRESS", ZERO_ADDRESS)).lower()
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.head = head or (get_head_follower(network) if rpc_client is None else HeadFollower(network, rpc_client))
+        key = private_key or os.getenv("KEEPER_PRIVATE_KEY") or None
+        if broadcaster is None and key:
+            broadcaster = (get_broadcaster(network, key) if rpc_client is None
+                           else Broadcaster(Account.from_key(key), network, rpc_client, self.head))
+        self.broadcaster = broadcaster
+        self.account = broadcaster.account if broadcaster else None
+        self.start_block = start_block if start_block is not None else int(os.getenv("KEEPER_START_BLOCK", "0"))
+        self.batch_size = int(os.getenv("KEEPER_BATCH", "50"))
+        self.sync_interval = float(os.getenv("KEEPER_SYNC_SECONDS", "5"))
+        self.retry_seconds = float(os.getenv("KEEPER_RETRY_SECONDS", "30"))
+        self.scanner = scanner or LogScanner(
+            self.rpc, address=self.contract, topics=[EVENTS], name=f"payment_keeper:{network}",
+            checkpoint=f"payment_keeper:{network}:{self.contract}",
+        )
+        self.state = get_cache("keeper")
+        self.state_key = f"payments:{network}:{self.contract}"
+
+        self.payments: Dict[int, Dict[str, Any]] = {}
+        self.bulks: Set[int] = set()
+        self._heap: List[Tuple[float, int]] = []
+        self._loaded = False
+        self.executed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.contract != ZERO_ADDRESS
+
+    # Payment book
+
+    def _schedule(self, payment_id: int, due: float):
+        payment = self.payments[payment_id]
+        payment["next"] = due
+        heapq.heappush(self._heap, (due, payment_id))
+
+    def _apply(self, payment_id: int, words: List[int]):
+        """Update a payment from its recurringPayments() struct"""
+        if len(words) < 6 or not words[5]:
+            self.payments.pop(payment_id, None)  # cancelled or unknown
+            return
+        previous = self.payments.get(payment_id, {})
+        self.payments[payment_id] = {
+            "payer": _address(words[0]),
+            "payee": _address(words[1]),
+            "amount": str(words[2]),
+            "interval": words[3],
+            "next": previous.get("next"),
+            "due_on_chain": words[4],
+            # Failed attempts count until an execution moves nextPayment on
+            "failures": previous.get("failures", 0) if previous.get("due_on_chain") == words[4] else 0,
+        }
+        self._schedule(payment_id, float(words[4]))
+
+    async def _read_payments(self, payment_ids):
+        payment_ids = sorted(payment_ids)
+        if not payment_ids:
+            return
+        replies = await self.rpc.batch([
+            ("eth_call", [{"to": self.contract, "data": RECURRING_PAYMENTS + _word(pid)}, "latest"])
+            for pid in payment_ids
+        ])
+        for pid, reply in zip(payment_ids, replies):
+            if isinstance(reply, RPCError):
+                raise reply
+            self._apply(pid, _words(reply))
+
+    async def _load(self):
+        snapshot = await self.state.get(self.state_key)
+        if snapshot:
+            for pid, payment in snapshot["payments"].items():
+                self.payments[int(pid)] = payment
+                heapq.heappush(self._heap, (payment["next"], int(pid)))
+            self.bulks = set(snapshot["bulks"])
+        self._loaded = snapshot is not None
+
+    async def _save(self):
+        await self.state.set(self.state_key, {
+            "payments": {str(pid): payment for pid, payment in self.payments.items()},
+            "bulks": sorted(self.bulks),
+        })
+        KEEPER_PAYMENTS.labels(self.network).set(len(self.payments))
+
+    async def handle_logs(self, logs: List[Dict[str, Any]]):
+        """Fold a window of contract events into the payment book"""
+        touched = set()
+        signer = self.account.address.lower() if self.account else None
+        for log in logs:
+            topics = log.get("topics") or []
+            if len(topics) < 2:
+                continue
+            event, item = topics[0], int(topics[1], 16)
+            if event in (RECURRING_PAYMENT_CREATED, PAYMENT_EXECUTED):
+                touched.add(item)
+            elif event == BULK_PAYMENT_CREATED and len(topics) > 2 and _address(int(topics[2], 16)) == signer:
+                # executeBulkPayment is payer-only, so only our own bulk payments are ours to run
+                self.bulks.add(item)
+            elif event == BULK_PAYMENT_EXECUTED:
+                self.bulks.discard(item)
+        await self._read_payments(touched)
+        await self._save()
+
+    async def sync(self):
+        """Catch the payment book up with the contract's events"""
+        if not self._loaded:
+            await self._load()
+            if not self._loaded:
+                # No snapshot to resume from: rebuild from the deployment block
+                await self.state.set(self.state_key, {"payments": {}, "bulks": []})
+                if self.scanner.checkpoint_key:
+                    await self.scanner.checkpoints.delete(self.scanner.checkpoint_key)
+                self._loaded = True
+        head = await self.head.block_number()
+        start = await self.scanner.resume(self.start_block)
+        async for _, _, logs in self.scanner.scan(start, head):
+            if logs:
+                await self.handle_logs(logs)
+
+    # Execution
+
+    async def _execute(self, kind: str, data: str) -> Optional[str]:
+        if self.account is None:
+            KEEPER_EXECUTIONS.labels(self.network, kind, "no_signer").inc()
+            return None
+        try:
+            tx_hash = await self.broadcaster.send(self.contract, data)
+        except (RPCError, asyncio.TimeoutError, OSError) as e:
+            KEEPER_EXECUTIONS.labels(self.network, kind, "failed").inc()
+            print(f"Keeper {kind} execution failed: {e}")
+            return None
+        KEEPER_EXECUTIONS.labels(self.network, kind, "submitted").inc()
+        self.executed += 1
+        return tx_hash
+
+    def pop_due(self, now: float) -> List[int]:
+        """Up to ``batch_size`` payments due by ``now``, earliest first"""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            when, pid = heapq.heappop(self._heap)
+            payment = self.payments.get(pid)
+            if payment is not None and payment["next"] == when:
+                due.append(pid)
+        return due
+
+    async def execute_due(self) -> List[Tuple[int, Optional[str]]]:
+        """Confirm due payments in one batched read and execute the confirmed ones"""
+        now = time.time()
+        due = self.pop_due(now)
+        results = []
+        if due:
+            replies = await self.rpc.batch([
+                ("eth_call", [{"to": self.contract, "data": IS_PAYMENT_DUE + _word(pid)}, "latest"]) for pid in due
+            ])
+            KEEPER_DUE_READS.labels(self.network).inc(len(due))
+            stale, confirmed = [], []
+            for pid, reply in zip(due, replies):
+                if isinstance(reply, RPCError) or not any(_words(reply)):
+                    stale.append(pid)
+                else:
+                    confirmed.append(pid)
+            # Submitted concurrently so the broadcaster pipelines them into one batch
+            hashes = await asyncio.gather(*(
+                self._execute("recurring", EXECUTE_RECURRING_PAYMENT + _word(pid)) for pid in confirmed
+            ))
+            for pid, tx_hash in zip(confirmed, hashes):
+                payment = self.payments[pid]
+                if tx_hash is None:
+                    payment["failures"] += 1
+                # Until PaymentExecuted moves nextPayment, look again after a backoff
+                delay = self.retry_seconds * 2 ** min(payment["failures"], 7)
+                self._schedule(pid, now + delay)
+                results.append((pid, tx_hash))
+            # Not due after all (cancelled, or the chain clock is behind ours): reread the schedule
+            await self._read_payments(stale)
+            for pid in stale:
+                if pid in self.payments and self.payments[pid]["next"] <= now:
+                    self._schedule(pid, now + 1.0)
+        bulks = sorted(self.bulks)
+        hashes = await asyncio.gather(*(self._execute("bulk", EXECUTE_BULK_PAYMENT + _word(b)) for b in bulks))
+        for bulk_id, tx_hash in zip(bulks, hashes):
+            if tx_hash is not None:
+                self.bulks.discard(bulk_id)
+        if due or self.bulks:
+            await self._save()
+        return results
+
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            when, pid = self._heap[0]
+            payment = self.payments.get(pid)
+            if payment is not None and payment["next"] == when:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+    async def run(self):
+        """Leader job: sleep until the earliest payment is due or new events may have arrived"""
+        while True:
+            try:
+                await self.sync()
+                await self.execute_due()
+            except (RPCError, asyncio.TimeoutError, OSError) as e:
+                print(f"Payment keeper for {self.network} failed: {e}")
+            next_due = self.next_due()
+            wait = self.sync_interval if next_due is None else min(self.sync_interval, next_due - time.time())
+            await asyncio.sleep(max(wait, 0.05))
+
+    def status(self, upcoming: int = 5) -> Dict[str, Any]:
+        live = [(when, pid) for when, pid in self._heap if self.payments.get(pid, {}).get("next") == when]
+        return {
+            "contract": self.contract,
+            "enabled": self.enabled,
+            "signer": self.account.address if self.account else None,
+            "active_payments": len(self.payments),
+            "pending_bulk_payments": sorted(self.bulks),
+            "executions_submitted": self.executed,
+            "next_due": self.next_due(),
+            "upcoming": [
+                dict(self.payments[pid], id=pid, next=when) for when, pid in heapq.nsmallest(upcoming, live)
+            ],
+        }
+
+
+_keepers: Dict[str, PaymentKeeper] = {}
+
+
+def get_payment_keeper(network: str = "testnet") -> PaymentKeeper:
+    keeper = _keepers.get(network)
+    if keeper is None:
+        keeper = _keepers[network] = PaymentKeeper(network)
+    return keeper
@@ -0,0 +1,128 @@
+"""
+QR Code Service for Smart Sonic
+Renders payment QR codes off the event loop with an LRU cache
+"""
+
+import asyncio
+import base64
+import io
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import qrcode
+import qrcode.image.svg
+
+from services.metrics import CACHE_HITS, CACHE_MISSES
+
+SUPPORTED_FORMATS = ("png", "svg")
+MIN_BOX_SIZE = 1
+MAX_BOX_SIZE = 40
+
+MIME_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def render_qr(payment_uri: str, box_size: int = 10, border: int = 5, image_format: str = "png") -> bytes:
+    """Render a QR code to PNG or SVG bytes (module level so process pools can pickle it)"""
+    qr = qrcode.QRCode(version=1, box_size=box_size, border=border)
+    qr.add_data(payment_uri)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if image_format == "svg":
+        # A single <path> is far smaller than one <rect> per module
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buffer)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class QRService:
+    def __init__(self, max_entries: Optional[int] = None, executor: Optional[Executor] = None):
+        self.max_entries = max_entries or int(os.getenv("QR_CACHE_SIZE", "512"))
+        self._executor = executor
+        self._cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_executor(self) -> Executor:
+        """Create the render pool lazily so importing the service stays cheap"""
+        if self._executor is None:
+            workers = int(os.getenv("QR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+            if os.getenv("QR_RENDER_EXECUTOR", "thread").lower() == "process":
+                self._executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qr-render")
+        return self._executor
+
+    async def generate(self, payment_uri: str, box_size: int = 10, border: int = 5, image_format: str = "png") -> str:
+        """Return a data URI for the QR code, rendering it in the pool on a cache miss"""
+        if image_format not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported QR format: {image_format}")
+
+        key = (payment_uri, box_size, border, image_format)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            CACHE_HITS.labels("qr").inc()
+            return cached
+
+        # Concurrent requests for the same code share a single render
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            CACHE_HITS.labels("qr").inc()
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        CACHE_MISSES.labels("qr").inc()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            data = await loop.run_in_executor(
+                self._get_executor(), render_qr, payment_uri, box_size, border, image_format
+            )
+            encoded = base64.b64encode(data).decode()
+            data_uri = f"data:{MIME_TYPES[image_format]};base64,{encoded}"
+            self._store(key, data_uri)
+            future.set_result(data_uri)
+            return data_uri
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so waiters-less failures don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                # The render was cancelled; release anyone waiting on it
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    def _store(self, key: Tuple, value: str):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Cache statistics"""
+        return {
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
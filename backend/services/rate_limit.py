@@ -0,0 +1,188 @@
+"""
+RPC Rate Limiting for Smart Sonic
+Per-endpoint token bucket plus an AIMD concurrency limit, so bursts queue
+locally instead of tripping the node's rate limiter
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+
+from services.metrics import registry
+
+LIMITER_CONCURRENCY = registry.gauge(
+    "sonic_rpc_concurrency_limit", "Current adaptive concurrency limit per RPC endpoint", ["endpoint"]
+)
+LIMITER_QUEUED = registry.gauge(
+    "sonic_rpc_queued_requests", "Requests waiting for a concurrency slot or rate token", ["endpoint"]
+)
+LIMITER_WAIT = registry.histogram(
+    "sonic_rpc_queue_wait_seconds", "Time spent waiting for a slot and token before sending", ["endpoint"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LIMITER_BACKOFFS = registry.counter(
+    "sonic_rpc_limit_backoffs_total", "Multiplicative limit decreases by cause (http_429, timeout)",
+    ["endpoint", "reason"]
+)
+
+
+def _env_float(name: str, default: str) -> float:
+    return float(os.getenv(name, default))
+
+
+class TokenBucket:
+    """Classic token bucket; ``rate <= 0`` disables it"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0 and self.paused_until <= time.monotonic():
+            return
+        # The lock keeps waiters in arrival order and stops them racing for the same token
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self.paused_until > now:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens, e.g. for a node's Retry-After"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class AdaptiveLimiter:
+    """Token bucket plus AIMD concurrency limit for one endpoint.
+
+    Every success while the limit is in use raises it by ``1 / limit`` (about one
+    slot per window of requests); a 429 or timeout multiplies it by ``decrease``.
+    Failures of requests sent before the last decrease are ignored, so one burst
+    of rejections counts once per round trip. Waiters are served first in, first out.
+    """
+
+    def __init__(self, name: str, rate: Optional[float] = None, burst: Optional[float] = None,
+                 initial: Optional[float] = None, min_limit: Optional[float] = None,
+                 max_limit: Optional[float] = None, decrease: float = 0.5):
+        self.name = name
+        self.bucket = TokenBucket(
+            rate if rate is not None else _env_float("RPC_RATE_LIMIT", "0"),
+            burst if burst is not None else _env_float("RPC_RATE_BURST", "0"),
+        )
+        self.min_limit = min_limit or _env_float("RPC_CONCURRENCY_MIN", "1")
+        self.max_limit = max_limit or _env_float("RPC_CONCURRENCY_MAX", "64")
+        self.limit = initial or _env_float("RPC_CONCURRENCY_INITIAL", "16")
+        self.decrease = decrease
+        self.inflight = 0
+        self.backoffs = 0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        LIMITER_CONCURRENCY.labels(name).set(self.limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a concurrency slot and a rate token, then adjust the limit from the outcome"""
+        started = time.perf_counter()
+        queued = LIMITER_QUEUED.labels(self.name)
+        queued.inc()
+        try:
+            await self._enter()
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                self._exit()
+                raise
+        finally:
+            queued.dec()
+        sent = time.monotonic()
+        LIMITER_WAIT.labels(self.name).observe(time.perf_counter() - started)
+
+        try:
+            yield
+        except asyncio.TimeoutError:
+            self.overloaded("timeout", sent)
+            raise
+        except Exception as e:
+            if getattr(e, "code", None) == 429:
+                self.overloaded("http_429", sent)
+            raise
+        else:
+            self.succeeded()
+        finally:
+            self._exit()
+
+    async def _enter(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as we were cancelled: pass it on
+                self._exit()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def _exit(self):
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def succeeded(self):
+        # Only grow while the current limit is actually the constraint
+        if self.limit < self.max_limit and self.inflight >= int(self.limit) // 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            LIMITER_CONCURRENCY.labels(self.name).set(self.limit)
+            self._wake()
+
+    def overloaded(self, reason: str, sent: Optional[float] = None):
+        now = time.monotonic()
+        if sent is not None and sent < self._last_decrease:
+            return
+        self._last_decrease = now
+        self.backoffs += 1
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        LIMITER_CONCURRENCY.labels(self.name).set(self.limit)
+        LIMITER_BACKOFFS.labels(self.name, reason).inc()
+
+    def pause(self, seconds: float):
+        self.bucket.pause(seconds)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": len(self._waiters),
+            "rate": self.bucket.rate,
+            "backoffs": self.backoffs,
+        }
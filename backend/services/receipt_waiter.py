@@ -0,0 +1,229 @@
+"""
+Receipt Waiter for Smart Sonic
+Callers await a future per transaction hash; one loop per worker follows the
+published head and, for each new batch of blocks, resolves every pending
+future with a single batched round trip of receipt lookups (per hash or per
+block, whichever is fewer calls). Transactions the node forgets are reported
+as dropped instead of being waited on forever
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+from services.chain_head import HeadFollower, get_head_follower
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient, get_rpc_client
+
+RECEIPT_WAITERS = registry.gauge("sonic_receipt_waiters", "Transactions awaiting a receipt", ["network"])
+RECEIPTS_RESOLVED = registry.counter(
+    "sonic_receipts_resolved_total", "Receipt waits by outcome (mined, dropped, timeout)", ["network", "outcome"]
+)
+RECEIPT_LOOKUPS = registry.counter(
+    "sonic_receipt_lookups_total", "Receipt RPC calls made by the waiter, by lookup kind", ["network", "mode"]
+)
+
+METHOD_NOT_FOUND = -32601
+
+
+class TransactionDropped(Exception):
+    """The node no longer knows a transaction that was never mined (evicted or replaced)"""
+
+    def __init__(self, tx_hash: str):
+        super().__init__(f"Transaction {tx_hash} was dropped before it was mined")
+        self.tx_hash = tx_hash
+
+
+class _Waiter:
+    __slots__ = ("futures", "since_block", "checked")
+
+    def __init__(self, since_block: Optional[int]):
+        self.futures: List[asyncio.Future] = []
+        self.since_block = since_block
+        # Looked up by hash at least once; after that only newer blocks can hold its receipt
+        self.checked = False
+
+
+class ReceiptWaiter:
+    """Shared receipt polling for one network.
+
+    ``await wait(tx_hash, timeout)`` returns the receipt, raises
+    ``TransactionDropped`` if the node forgets the transaction, or
+    ``asyncio.TimeoutError``. The polling loop only runs while something is
+    waiting, and costs one batch per new head however many transactions
+    are pending.
+    """
+
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None,
+                 head: Optional[HeadFollower] = None, timeout: Optional[float] = None,
+                 drop_blocks: Optional[int] = None, batch_size: Optional[int] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.head = head or (get_head_follower(network) if rpc_client is None else HeadFollower(network, rpc_client))
+        self.timeout = timeout or float(os.getenv("RECEIPT_TIMEOUT_SECONDS", "60"))
+        # Unmined this many blocks after we started waiting: ask whether the node still has it
+        self.drop_blocks = drop_blocks or int(os.getenv("RECEIPT_DROP_BLOCKS", "50"))
+        self.batch_size = batch_size or int(os.getenv("RECEIPT_BATCH", "100"))
+        self._waiting: Dict[str, _Waiter] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._block_receipts = True
+        self.checked_through: Optional[int] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._waiting)
+
+    async def wait(self, tx_hash: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Receipt of ``tx_hash`` once it is mined"""
+        tx_hash = tx_hash.lower()
+        waiter = self._waiting.get(tx_hash)
+        if waiter is None:
+            waiter = self._waiting[tx_hash] = _Waiter(self.checked_through)
+            RECEIPT_WAITERS.labels(self.network).set(len(self._waiting))
+        future = asyncio.get_running_loop().create_future()
+        waiter.futures.append(future)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            RECEIPTS_RESOLVED.labels(self.network, "timeout").inc()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._forget(tx_hash, future)
+
+    def _forget(self, tx_hash: str, future: asyncio.Future):
+        waiter = self._waiting.get(tx_hash)
+        if waiter is None:
+            return
+        if future in waiter.futures:
+            waiter.futures.remove(future)
+        if not waiter.futures:
+            del self._waiting[tx_hash]
+            RECEIPT_WAITERS.labels(self.network).set(len(self._waiting))
+
+    def _resolve(self, tx_hash: str, receipt: Optional[Dict[str, Any]] = None, error: Optional[Exception] = None):
+        waiter = self._waiting.pop(tx_hash, None)
+        if waiter is None:
+            return
+        RECEIPTS_RESOLVED.labels(self.network, "mined" if error is None else "dropped").inc()
+        for future in waiter.futures:
+            if not future.done():
+                if error is None:
+                    future.set_result(receipt)
+                else:
+                    future.set_exception(error)
+        RECEIPT_WAITERS.labels(self.network).set(len(self._waiting))
+
+    async def _batched(self, calls: List[Any]) -> List[Any]:
+        chunks = [calls[i:i + self.batch_size] for i in range(0, len(calls), self.batch_size)]
+        replies = await asyncio.gather(*(self.rpc.batch(chunk) for chunk in chunks))
+        return [reply for chunk in replies for reply in chunk]
+
+    async def check(self, head: int):
+        """Resolve what was mined up to ``head`` in one batched round trip"""
+        hashes = list(self._waiting)
+        new = [h for h in hashes if not self._waiting[h].checked]
+        known = [h for h in hashes if self._waiting[h].checked]
+        start = (self.checked_through if self.checked_through is not None else head) + 1
+        blocks = list(range(start, head + 1))
+        # Transactions already looked up can only appear in new blocks: ask per block when that is fewer calls
+        by_block = self._block_receipts and known and len(blocks) < len(known)
+        by_hash = new + ([] if by_block else known)
+        calls = [("eth_getTransactionReceipt", [h]) for h in by_hash]
+        if by_block:
+            calls += [("eth_getBlockReceipts", [hex(n)]) for n in blocks]
+        if not calls:
+            self.checked_through = head
+            return
+        replies = await self._batched(calls)
+        RECEIPT_LOOKUPS.labels(self.network, "hash").inc(len(by_hash))
+
+        for tx_hash, receipt in zip(by_hash, replies):
+            if isinstance(receipt, RPCError):
+                continue  # looked up again next head
+            if receipt is not None and receipt.get("blockNumber"):
+                self._resolve(tx_hash, receipt)
+            elif tx_hash in self._waiting:
+                self._waiting[tx_hash].checked = True
+
+        if by_block:
+            RECEIPT_LOOKUPS.labels(self.network, "block").inc(len(blocks))
+            block_replies = replies[len(by_hash):]
+            if any(isinstance(r, RPCError) and r.code == METHOD_NOT_FOUND for r in block_replies):
+                # No eth_getBlockReceipts on this node: fall back to per-hash lookups for good
+                self._block_receipts = False
+                for tx_hash in known:
+                    if tx_hash in self._waiting:
+                        self._waiting[tx_hash].checked = False
+                return
+            if any(isinstance(r, RPCError) for r in block_replies):
+                return  # retry the same blocks next time
+            for receipts in block_replies:
+                for receipt in receipts or []:
+                    tx_hash = receipt.get("transactionHash", "").lower()
+                    if tx_hash in self._waiting and self._waiting[tx_hash].checked:
+                        self._resolve(tx_hash, receipt)
+        self.checked_through = head
+        await self._check_dropped(head)
+
+    async def _check_dropped(self, head: int):
+        """Transactions waited on for ``drop_blocks`` that the node no longer has"""
+        stale = [
+            h for h, w in self._waiting.items()
+            if w.checked and w.since_block is not None and head - w.since_block >= self.drop_blocks
+        ]
+        if not stale:
+            return
+        mined = []
+        for tx_hash, tx in zip(stale, await self._batched([("eth_getTransactionByHash", [h]) for h in stale])):
+            if tx is None:
+                self._resolve(tx_hash, error=TransactionDropped(tx_hash))
+            elif isinstance(tx, RPCError) or tx_hash not in self._waiting:
+                continue
+            elif tx.get("blockNumber"):
+                # Mined in a block we already passed (a lagging endpoint answered the receipt lookup)
+                mined.append(tx_hash)
+            else:
+                # Still in the pool; look again after another drop_blocks
+                self._waiting[tx_hash].since_block = head
+        if not mined:
+            return
+        RECEIPT_LOOKUPS.labels(self.network, "hash").inc(len(mined))
+        for tx_hash, receipt in zip(mined, await self._batched([("eth_getTransactionReceipt", [h]) for h in mined])):
+            if isinstance(receipt, dict) and receipt.get("blockNumber"):
+                self._resolve(tx_hash, receipt)
+            elif tx_hash in self._waiting:
+                # Receipt not served yet either; a per-hash lookup on the next head will find it
+                self._waiting[tx_hash].checked = False
+
+    async def run(self):
+        """Follow the head while anything is waiting"""
+        try:
+            while self._waiting:
+                try:
+                    head = await self.head.block_number()
+                    if self.checked_through is None or head > self.checked_through or any(
+                        not w.checked for w in self._waiting.values()
+                    ):
+                        await self.check(head)
+                        for waiter in self._waiting.values():
+                            if waiter.since_block is None:
+                                waiter.since_block = head
+                except (RPCError, asyncio.TimeoutError, OSError) as e:
+                    print(f"Receipt polling for {self.network} failed: {e}")
+                await asyncio.sleep(self.head.interval)
+        finally:
+            self._task = None
+
+
+_waiters: Dict[str, ReceiptWaiter] = {}
+
+
+def get_receipt_waiter(network: str = "testnet") -> ReceiptWaiter:
+    waiter = _waiters.get(network)
+    if waiter is None:
+        waiter = _waiters[network] = ReceiptWaiter(network)
+    return waiter
@@ -0,0 +1,201 @@
+"""
+JSON-RPC Client for Smart Sonic
+Shared aiohttp-based client for the Sonic RPC with per-method metrics
+"""
+
+import asyncio
+import itertools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from config.sonic_config import get_rpc_url, get_rpc_urls
+from services.metrics import RPC_ERRORS, RPC_INFLIGHT, RPC_LATENCY
+from services.rate_limit import AdaptiveLimiter
+from services.tracing import span
+
+
+class RPCError(Exception):
+    """Raised when the node answers with a JSON-RPC error or an unusable response"""
+
+    def __init__(self, method: str, message: str, code: Optional[int] = None):
+        super().__init__(f"{method}: {message}")
+        self.method = method
+        self.message = message
+        self.code = code
+
+
+# A transport takes a JSON-RPC payload (object or batch list) and returns the decoded reply
+Transport = Callable[[Any], Awaitable[Any]]
+
+
+class SonicRPCClient:
+    def __init__(self, rpc_url: Optional[str] = None, timeout: float = 10.0, transport: Optional[Transport] = None):
+        self.rpc_url = rpc_url or get_rpc_url("testnet")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # When set, requests go to this callable instead of HTTP (simulators, pools, replays)
+        self.transport = transport
+        self.pool = None
+        # Token bucket + AIMD concurrency limit for requests this client sends over HTTP
+        self.limiter = AdaptiveLimiter(self.rpc_url)
+        self.rate_limit_retries = int(os.getenv("RPC_RATE_LIMIT_RETRIES", "2"))
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ids = itertools.count(1)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Reuse one pooled session per event loop"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+            self._session_loop = loop
+        return self._session
+
+    async def _post(self, payload: Any) -> Any:
+        if self.transport is not None:
+            return await self.transport(payload)
+        return await self.http_post(payload)
+
+    async def http_post(self, payload: Any) -> Any:
+        """Send a payload straight to the node over HTTP, bypassing any transport.
+
+        A 429 means the node did not process the request, so it is retried (up to
+        ``rate_limit_retries`` times) after the limiter has backed off.
+        """
+        for attempt in range(self.rate_limit_retries + 1):
+            try:
+                async with self.limiter.slot():
+                    session = await self._get_session()
+                    async with session.post(self.rpc_url, json=payload) as response:
+                        if response.status == 429:
+                            retry_after = response.headers.get("Retry-After", "")
+                            if retry_after.isdigit():
+                                self.limiter.pause(float(retry_after))
+                            raise RPCError("http", "rate limited", 429)
+                        return await response.json(content_type=None)
+            except RPCError as e:
+                if e.code != 429 or attempt == self.rate_limit_retries:
+                    raise
+            RPC_ERRORS.labels("http", "http_429_retried").inc()
+
+    async def call(self, method: str, params: Optional[Sequence[Any]] = None) -> Any:
+        """Send a single JSON-RPC request and return its result"""
+        payload = {"jsonrpc": "2.0", "method": method, "params": list(params or []), "id": next(self._ids)}
+
+        inflight = RPC_INFLIGHT.labels(method)
+        inflight.inc()
+        started = time.perf_counter()
+        try:
+            with span(f"rpc {method}"):
+                data = await self._post(payload)
+        except asyncio.TimeoutError:
+            RPC_ERRORS.labels(method, "timeout").inc()
+            raise
+        except RPCError as e:
+            RPC_ERRORS.labels(method, "http_429" if e.code == 429 else "rpc").inc()
+            raise RPCError(method, e.message, e.code)
+        except Exception:
+            RPC_ERRORS.labels(method, "transport").inc()
+            raise
+        finally:
+            inflight.dec()
+            RPC_LATENCY.labels(method).observe(time.perf_counter() - started)
+
+        return self._unwrap(method, data)
+
+    async def batch(self, calls: Sequence[Tuple[str, Sequence[Any]]]) -> List[Any]:
+        """Send several requests in one round trip; results come back in call order.
+
+        Individual failures are returned as RPCError instances rather than raised so
+        one bad entry does not discard the rest of the batch.
+        """
+        if not calls:
+            return []
+
+        payload = []
+        for method, params in calls:
+            payload.append({"jsonrpc": "2.0", "method": method, "params": list(params or []), "id": next(self._ids)})
+
+        label = "batch"
+        inflight = RPC_INFLIGHT.labels(label)
+        inflight.inc()
+        started = time.perf_counter()
+        try:
+            with span("rpc batch", size=len(calls)):
+                data = await self._post(payload)
+        except asyncio.TimeoutError:
+            RPC_ERRORS.labels(label, "timeout").inc()
+            raise
+        except RPCError as e:
+            RPC_ERRORS.labels(label, "http_429" if e.code == 429 else "rpc").inc()
+            raise RPCError(label, e.message, e.code)
+        except Exception:
+            RPC_ERRORS.labels(label, "transport").inc()
+            raise
+        finally:
+            inflight.dec()
+            RPC_LATENCY.labels(label).observe(time.perf_counter() - started)
+
+        if not isinstance(data, list):
+            # Some nodes answer a rejected batch with a single error object
+            error = RPCError(label, str(data.get("error") if isinstance(data, dict) else data))
+            return [error for _ in calls]
+
+        by_id = {item.get("id"): item for item in data if isinstance(item, dict)}
+        results = []
+        for request, (method, _) in zip(payload, calls):
+            item = by_id.get(request["id"])
+            try:
+                results.append(self._unwrap(method, item))
+            except RPCError as e:
+                results.append(e)
+        return results
+
+    def _unwrap(self, method: str, data: Any) -> Any:
+        if not isinstance(data, dict):
+            RPC_ERRORS.labels(method, "invalid_response").inc()
+            raise RPCError(method, "invalid response")
+        if "error" in data:
+            error = data["error"] or {}
+            RPC_ERRORS.labels(method, "rpc").inc()
+            raise RPCError(method, error.get("message", "unknown error"), error.get("code"))
+        return data.get("result")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_clients: Dict[str, SonicRPCClient] = {}
+
+
+def get_rpc_client(network: str = "testnet") -> SonicRPCClient:
+    """Return the process-wide client for a network"""
+    client = _clients.get(network)
+    if client is None:
+        client = _clients[network] = SonicRPCClient(get_rpc_url(network))
+        urls = get_rpc_urls(network)
+        if len(urls) > 1:
+            from services.rpc_pool import RPCPool
+            client.pool = client.transport = RPCPool(urls)
+        # SONIC_RPC_RECORD / SONIC_RPC_REPLAY swap in a recording or replay transport
+        from services.rpc_recording import configure_from_env
+        configure_from_env(client, network)
+    return client
+
+
+def start_background_tasks():
+    """Start health checks for every pooled client (call from the running loop)"""
+    for client in _clients.values():
+        if client.pool is not None:
+            client.pool.start()
+
+
+async def close_clients():
+    for client in _clients.values():
+        if client.pool is not None:
+            await client.pool.stop()
+        await client.close()
@@ -0,0 +1,404 @@
+"""
+RPC Endpoint Pool for Smart Sonic
+Spreads JSON-RPC traffic over several nodes using EWMA latency, ejects
+failing or lagging nodes and re-admits them once they recover
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import aiohttp
+
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient
+from services.tracing import current_span
+
+# Methods that can be safely retried on (or duplicated to) another node
+IDEMPOTENT_METHODS = frozenset({
+    "eth_blockNumber", "eth_chainId", "net_version", "eth_gasPrice", "eth_maxPriorityFeePerGas",
+    "eth_feeHistory", "eth_getBalance", "eth_getCode", "eth_getTransactionCount", "eth_getStorageAt",
+    "eth_call", "eth_estimateGas", "eth_getBlockByNumber", "eth_getBlockByHash",
+    "eth_getTransactionByHash", "eth_getTransactionReceipt", "eth_getLogs", "eth_getBlockReceipts",
+})
+
+# Point reads whose duplicates are cheap for the node; hedging is limited to these
+HEDGEABLE_METHODS = frozenset({
+    "eth_getBalance", "eth_getBlockByNumber", "eth_getBlockByHash", "eth_getTransactionByHash",
+    "eth_getTransactionReceipt", "eth_getBlockReceipts",
+})
+
+ENDPOINT_REQUESTS = registry.counter(
+    "sonic_rpc_endpoint_requests_total", "Round trips per RPC endpoint by outcome", ["endpoint", "outcome"]
+)
+ENDPOINT_LATENCY = registry.gauge(
+    "sonic_rpc_endpoint_latency_ewma_seconds", "EWMA round-trip latency per RPC endpoint", ["endpoint"]
+)
+ENDPOINT_HEALTHY = registry.gauge(
+    "sonic_rpc_endpoint_healthy", "1 while an RPC endpoint is in rotation, 0 while ejected", ["endpoint"]
+)
+HEDGES = registry.counter(
+    "sonic_rpc_hedges_total", "Hedged RPC requests by outcome (sent, won, lost, denied)", ["outcome"]
+)
+HEDGE_DELAY = registry.gauge(
+    "sonic_rpc_hedge_delay_seconds", "Current adaptive hedge delay per method", ["method"]
+)
+
+
+def is_idempotent(payload: Any) -> bool:
+    items = payload if isinstance(payload, list) else [payload]
+    return all(item.get("method") in IDEMPOTENT_METHODS for item in items)
+
+
+def is_hedgeable(payload: Any) -> bool:
+    items = payload if isinstance(payload, list) else [payload]
+    return all(item.get("method") in HEDGEABLE_METHODS for item in items)
+
+
+def _method_label(payload: Any) -> str:
+    return "batch" if isinstance(payload, list) else str(payload.get("method"))
+
+
+class HedgePolicy:
+    """Decides when a slow read gets a duplicate on a second endpoint.
+
+    The delay is the ``percentile`` of recent round-trip latencies for the same
+    method, so only the slowest few percent of requests are hedged. Each eligible
+    request adds ``budget_pct / 100`` tokens to a small bucket and each hedge
+    spends one, which caps the extra load at roughly ``budget_pct`` percent.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                 budget_pct: Optional[float] = None, min_delay: Optional[float] = None,
+                 min_samples: Optional[int] = None, window: int = 256):
+        if enabled is None:
+            enabled = os.getenv("RPC_HEDGE_ENABLED", "0").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.percentile = percentile or float(os.getenv("RPC_HEDGE_PERCENTILE", "95"))
+        self.budget_pct = budget_pct if budget_pct is not None else float(os.getenv("RPC_HEDGE_BUDGET_PCT", "5"))
+        self.min_delay = min_delay if min_delay is not None else float(os.getenv("RPC_HEDGE_MIN_DELAY_MS", "5")) / 1000
+        self.min_samples = min_samples or int(os.getenv("RPC_HEDGE_MIN_SAMPLES", "20"))
+        self.window = window
+        self.max_tokens = 10.0
+        self.tokens = 0.0
+        self._samples: Dict[str, Deque[float]] = {}
+        self._delays: Dict[str, float] = {}
+        self._since_refresh: Dict[str, int] = {}
+        self.sent = 0
+        self.won = 0
+        self.denied = 0
+
+    def observe(self, method: str, elapsed: float):
+        if not self.enabled:
+            return
+        samples = self._samples.get(method)
+        if samples is None:
+            samples = self._samples[method] = deque(maxlen=self.window)
+        samples.append(elapsed)
+        # Re-sorting the window on every sample is wasteful; refresh periodically
+        count = self._since_refresh.get(method, 0) + 1
+        if count >= 16 or method not in self._delays:
+            count = 0
+            if len(samples) >= self.min_samples:
+                ordered = sorted(samples)
+                index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+                self._delays[method] = max(self.min_delay, ordered[index])
+                HEDGE_DELAY.labels(method).set(self._delays[method])
+        self._since_refresh[method] = count
+
+    def delay(self, method: str) -> Optional[float]:
+        """Hedge delay for a method, or None until enough latencies are known"""
+        if not self.enabled:
+            return None
+        self.tokens = min(self.max_tokens, self.tokens + self.budget_pct / 100)
+        return self._delays.get(method)
+
+    def acquire(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.sent += 1
+            HEDGES.labels("sent").inc()
+            return True
+        self.denied += 1
+        HEDGES.labels("denied").inc()
+        return False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "budget_pct": self.budget_pct,
+            "tokens": round(self.tokens, 2),
+            "sent": self.sent,
+            "won": self.won,
+            "denied": self.denied,
+            "delays_ms": {method: round(delay * 1000, 3) for method, delay in sorted(self._delays.items())},
+        }
+
+
+class RPCEndpoint:
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.client = SonicRPCClient(url, timeout=timeout)
+        # The pool fails over to another node on 429 instead of retrying this one
+        self.client.rate_limit_retries = 0
+        self.ewma: Optional[float] = None
+        self.inflight = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.head: Optional[int] = None
+        self.served = 0
+        self.failed = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+    def score(self, default_latency: float) -> float:
+        # Expected wait: latency scaled by the queue already sent to this node
+        return (self.ewma if self.ewma is not None else default_latency) * (1 + self.inflight)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "ewma_ms": round(self.ewma * 1000, 3) if self.ewma is not None else None,
+            "inflight": self.inflight,
+            "served": self.served,
+            "failed": self.failed,
+            "consecutive_failures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "ejected_for_s": round(max(0.0, self.ejected_until - time.monotonic()), 1),
+            "head": self.head,
+            "limiter": self.client.limiter.status(),
+        }
+
+
+class RPCPool:
+    """Transport that routes each round trip to the best healthy endpoint.
+
+    Selection is power-of-two-choices on ``ewma * (1 + inflight)`` so reads spread
+    across healthy nodes while slow nodes get proportionally less traffic. After
+    ``eject_after`` consecutive transport failures, or when a health check finds a
+    node more than ``max_block_lag`` blocks behind, the node is ejected with
+    exponential backoff; when the backoff expires it gets traffic again and is
+    re-ejected for longer if it is still failing.
+
+    With hedging enabled, point reads that outlive the adaptive delay get a
+    duplicate on a second endpoint; the first answer wins and the other request
+    is cancelled.
+    """
+
+    def __init__(self, urls: List[str], timeout: float = 10.0, alpha: Optional[float] = None,
+                 eject_after: Optional[int] = None, eject_seconds: Optional[float] = None,
+                 max_block_lag: Optional[int] = None, max_attempts: Optional[int] = None,
+                 hedging: Optional[HedgePolicy] = None):
+        if not urls:
+            raise ValueError("RPCPool needs at least one endpoint")
+        self.endpoints = [RPCEndpoint(url, timeout) for url in urls]
+        self.alpha = alpha if alpha is not None else float(os.getenv("RPC_POOL_EWMA_ALPHA", "0.3"))
+        self.eject_after = eject_after or int(os.getenv("RPC_POOL_EJECT_AFTER", "3"))
+        self.eject_seconds = eject_seconds or float(os.getenv("RPC_POOL_EJECT_SECONDS", "15"))
+        self.max_block_lag = max_block_lag or int(os.getenv("RPC_POOL_MAX_BLOCK_LAG", "20"))
+        self.max_attempts = max_attempts or int(os.getenv("RPC_POOL_MAX_ATTEMPTS", "2"))
+        self.hedging = hedging or HedgePolicy()
+        self._health_task: Optional[asyncio.Task] = None
+        for endpoint in self.endpoints:
+            ENDPOINT_HEALTHY.labels(endpoint.url).set(1)
+
+    # Routing
+
+    def _default_latency(self) -> float:
+        known = [e.ewma for e in self.endpoints if e.ewma is not None]
+        # Unmeasured nodes look as fast as the fastest known one so they get tried
+        return min(known) if known else 0.0
+
+    def select(self, exclude: Optional[set] = None) -> RPCEndpoint:
+        exclude = exclude or set()
+        candidates = [e for e in self.endpoints if e.healthy and e.url not in exclude]
+        if not candidates:
+            # Everything is ejected: fall back to whichever node recovers soonest
+            candidates = [e for e in self.endpoints if e.url not in exclude] or self.endpoints
+            return min(candidates, key=lambda e: e.ejected_until)
+        if len(candidates) == 1:
+            return candidates[0]
+        default = self._default_latency()
+        first, second = random.sample(candidates, 2)
+        return first if first.score(default) <= second.score(default) else second
+
+    def endpoint_for(self, url: str) -> Optional[RPCEndpoint]:
+        for endpoint in self.endpoints:
+            if endpoint.url == url:
+                return endpoint
+        return None
+
+    async def send(self, endpoint: RPCEndpoint, payload: Any) -> Any:
+        """One round trip to a specific endpoint, updating its health and latency"""
+        endpoint.inflight += 1
+        started = time.perf_counter()
+        try:
+            response = await endpoint.client.http_post(payload)
+        except asyncio.CancelledError:
+            # A cancelled hedge loser was at least this slow; keep that in the stats
+            self.hedging.observe(_method_label(payload), time.perf_counter() - started)
+            raise
+        except Exception:
+            self._record_failure(endpoint)
+            raise
+        finally:
+            endpoint.inflight -= 1
+        elapsed = time.perf_counter() - started
+        self._record_success(endpoint, elapsed)
+        self.hedging.observe(_method_label(payload), elapsed)
+        return response
+
+    async def __call__(self, payload: Any) -> Any:
+        attempts = self.max_attempts if is_idempotent(payload) else 1
+        hedge = self.hedging.enabled and len(self.endpoints) > 1 and is_hedgeable(payload)
+        tried = set()
+        last_error: Optional[BaseException] = None
+        for _ in range(min(attempts, len(self.endpoints))):
+            endpoint = self.select(tried)
+            tried.add(endpoint.url)
+            span = current_span()
+            if span is not None:
+                span.set_attribute("endpoint", endpoint.url)
+            try:
+                if hedge:
+                    return await self._hedged(endpoint, payload, tried)
+                return await self.send(endpoint, payload)
+            except RPCError as e:
+                last_error = e
+                if e.code != 429:
+                    raise
+            except (asyncio.TimeoutError, aiohttp.ClientError, OSError, ValueError) as e:
+                # ValueError covers non-JSON bodies such as proxy error pages
+                last_error = e
+        raise last_error
+
+    async def _hedged(self, endpoint: RPCEndpoint, payload: Any, tried: set) -> Any:
+        """Send to ``endpoint``; past the hedge delay also send to a second one"""
+        delay = self.hedging.delay(_method_label(payload))
+        primary = asyncio.ensure_future(self.send(endpoint, payload))
+        backup: Optional[asyncio.Future] = None
+        try:
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            second = self.select(tried)
+            if second.url in tried or not self.hedging.acquire():
+                return await primary
+            tried.add(second.url)
+            backup = asyncio.ensure_future(self.send(second, payload))
+
+            pending = {primary, backup}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.hedging.won += 1
+                            HEDGES.labels("won").inc()
+                            span = current_span()
+                            if span is not None:
+                                span.set_attribute("endpoint", second.url)
+                        else:
+                            HEDGES.labels("lost").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel whichever request is still running, including on caller cancellation
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def _record_success(self, endpoint: RPCEndpoint, elapsed: float):
+        endpoint.ewma = elapsed if endpoint.ewma is None else self.alpha * elapsed + (1 - self.alpha) * endpoint.ewma
+        endpoint.consecutive_failures = 0
+        endpoint.served += 1
+        ENDPOINT_REQUESTS.labels(endpoint.url, "ok").inc()
+        ENDPOINT_LATENCY.labels(endpoint.url).set(endpoint.ewma)
+        if endpoint.ejections and endpoint.healthy:
+            # Survived its probation period: reset the backoff
+            endpoint.ejections = 0
+            ENDPOINT_HEALTHY.labels(endpoint.url).set(1)
+
+    def _record_failure(self, endpoint: RPCEndpoint):
+        endpoint.consecutive_failures += 1
+        endpoint.failed += 1
+        ENDPOINT_REQUESTS.labels(endpoint.url, "error").inc()
+        if not endpoint.healthy:
+            # Requests sent before the ejection are still failing; don't extend it
+            return
+        # A node back from ejection is on probation: one failure sends it back out
+        threshold = 1 if endpoint.ejections else self.eject_after
+        if endpoint.consecutive_failures >= threshold:
+            self.eject(endpoint)
+
+    def eject(self, endpoint: RPCEndpoint):
+        endpoint.ejections += 1
+        backoff = min(self.eject_seconds * 2 ** (endpoint.ejections - 1), 600)
+        endpoint.ejected_until = time.monotonic() + backoff
+        endpoint.consecutive_failures = 0
+        ENDPOINT_HEALTHY.labels(endpoint.url).set(0)
+
+    # Health checks
+
+    async def health_check(self):
+        """Probe every endpoint's head; eject unreachable or lagging nodes"""
+        payload = {"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 0}
+
+        async def probe(endpoint: RPCEndpoint):
+            try:
+                response = await self.send(endpoint, payload)
+                endpoint.head = int(response["result"], 16)
+            except Exception:
+                endpoint.head = None
+
+        await asyncio.gather(*(probe(e) for e in self.endpoints))
+        heads = [e.head for e in self.endpoints if e.head is not None]
+        if not heads:
+            return
+        best = max(heads)
+        for endpoint in self.endpoints:
+            if endpoint.head is not None and best - endpoint.head > self.max_block_lag and endpoint.healthy:
+                self.eject(endpoint)
+            elif endpoint.head is not None and endpoint.healthy:
+                ENDPOINT_HEALTHY.labels(endpoint.url).set(1)
+
+    def start(self, interval: Optional[float] = None):
+        """Run health checks periodically on the current loop"""
+        if self._health_task is not None or len(self.endpoints) < 2:
+            return
+        interval = interval or float(os.getenv("RPC_POOL_HEALTH_INTERVAL", "10"))
+
+        async def loop():
+            while True:
+                try:
+                    await self.health_check()
+                except Exception as e:
+                    print(f"RPC pool health check failed: {e}")
+                await asyncio.sleep(interval)
+
+        self._health_task = asyncio.get_running_loop().create_task(loop(), name="rpc-pool-health")
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "endpoints": [endpoint.to_dict() for endpoint in self.endpoints],
+            "hedging": self.hedging.status(),
+        }
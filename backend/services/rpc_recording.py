@@ -0,0 +1,228 @@
+"""
+RPC Record/Replay for Smart Sonic
+Captures JSON-RPC request/response pairs with timings and serves them back
+deterministically, so performance runs do not depend on the public node's load
+
+Record:  SONIC_RPC_RECORD=traffic.jsonl.gz python test_transactions.py
+Replay:  SONIC_RPC_REPLAY=traffic.jsonl.gz SONIC_RPC_REPLAY_SCALE=1.0 python test_transactions.py
+"""
+
+import asyncio
+import atexit
+import gzip
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from services.rpc_client import RPCError, SonicRPCClient, Transport
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _strip(payload: Any) -> List[Tuple[str, Any]]:
+    """(method, params) pairs of a payload without the volatile ids"""
+    items = payload if isinstance(payload, list) else [payload]
+    return [(item.get("method"), item.get("params") or []) for item in items]
+
+
+def request_key(network: str, payload: Any) -> str:
+    """Canonical key for a payload; identical requests share a key regardless of id"""
+    return json.dumps([network, isinstance(payload, list), _strip(payload)], separators=(",", ":"), sort_keys=True)
+
+
+def _method_label(payload: Any) -> str:
+    return "batch" if isinstance(payload, list) else str(payload.get("method"))
+
+
+def _without_ids(response: Any) -> Any:
+    if isinstance(response, list):
+        return [{k: v for k, v in item.items() if k != "id"} if isinstance(item, dict) else item for item in response]
+    if isinstance(response, dict):
+        return {k: v for k, v in response.items() if k != "id"}
+    return response
+
+
+def _with_ids(payload: Any, response: Any) -> Any:
+    """Re-attach the live request ids to a recorded response"""
+    if isinstance(payload, list) and isinstance(response, list):
+        return [dict(item, id=request.get("id")) if isinstance(item, dict) else item
+                for request, item in zip(payload, response)]
+    if isinstance(payload, dict) and isinstance(response, dict):
+        return dict(response, id=payload.get("id"))
+    return response
+
+
+class RPCRecorder:
+    """Appends one compact JSON line per round trip: key, method, elapsed ms and response"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self.counts: Counter = Counter()
+
+    def write(self, network: str, payload: Any, response: Any, elapsed: float, error: Optional[str] = None):
+        if self._file is None:
+            self._file = _open(self.path, "a")
+        entry = {
+            "k": request_key(network, payload),
+            "m": _method_label(payload),
+            "t": round(elapsed * 1000, 3),
+        }
+        if error is not None:
+            entry["e"] = error
+        else:
+            entry["r"] = _without_ids(response)
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.counts[entry["m"]] += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RecordingTransport:
+    """Wraps a transport and records every round trip it carries"""
+
+    def __init__(self, inner: Transport, recorder: RPCRecorder, network: str = "testnet"):
+        self.inner = inner
+        self.recorder = recorder
+        self.network = network
+
+    async def __call__(self, payload: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            response = await self.inner(payload)
+        except RPCError as e:
+            self.recorder.write(self.network, payload, None, time.perf_counter() - started, f"rpc:{e.code}:{e.message}")
+            raise
+        except asyncio.TimeoutError:
+            self.recorder.write(self.network, payload, None, time.perf_counter() - started, "timeout")
+            raise
+        self.recorder.write(self.network, payload, response, time.perf_counter() - started)
+        return response
+
+
+class ReplayTransport:
+    """Serves recorded responses back at the recorded (optionally scaled) latency.
+
+    Repeated identical requests are answered in recorded order; once a key's
+    recordings run out the last one is reused. Unknown requests raise in strict
+    mode (the default) so a new RPC call shows up as a failure, not a silent miss.
+    """
+
+    def __init__(self, path: str, latency_scale: float = 1.0, strict: bool = True, network: str = "testnet"):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self.network = network
+        self._entries: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self.recorded: Counter = Counter()
+        self.replayed: Counter = Counter()
+        self.missing: Counter = Counter()
+        self.replayed_latency = 0.0
+        self._load()
+
+    def _load(self):
+        with _open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if not entry["k"].startswith(json.dumps([self.network])[:-1]):
+                    continue
+                self._entries[entry["k"]].append(entry)
+                self.recorded[entry["m"]] += 1
+
+    async def __call__(self, payload: Any) -> Any:
+        key = request_key(self.network, payload)
+        method = _method_label(payload)
+        queue = self._entries.get(key)
+        if queue:
+            entry = queue.popleft()
+            self._last[key] = entry
+        else:
+            entry = self._last.get(key)
+
+        if entry is None:
+            self.missing[method] += 1
+            if self.strict:
+                raise RPCError(method, f"no recorded response for {method}")
+            return _with_ids(payload, {"jsonrpc": "2.0", "error": {"code": -32000, "message": "not recorded"}})
+
+        self.replayed[method] += 1
+        delay = entry["t"] / 1000 * self.latency_scale
+        self.replayed_latency += delay
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        error = entry.get("e")
+        if error == "timeout":
+            raise asyncio.TimeoutError()
+        if error is not None:
+            _, code, message = error.split(":", 2)
+            raise RPCError(method, message, int(code) if code not in ("", "None") else None)
+        return _with_ids(payload, entry["r"])
+
+    def report(self) -> Dict[str, Any]:
+        """Recorded vs replayed call counts; any difference means the call pattern changed"""
+        methods = sorted(set(self.recorded) | set(self.replayed) | set(self.missing))
+        return {
+            "recording": self.path,
+            "latency_scale": self.latency_scale,
+            "replayed_latency_s": round(self.replayed_latency, 3),
+            "methods": {
+                method: {
+                    "recorded": self.recorded.get(method, 0),
+                    "replayed": self.replayed.get(method, 0),
+                    "missing": self.missing.get(method, 0),
+                }
+                for method in methods
+            },
+            "changed": any(
+                self.recorded.get(m, 0) != self.replayed.get(m, 0) or self.missing.get(m, 0) for m in methods
+            ),
+        }
+
+
+_recorders: Dict[str, RPCRecorder] = {}
+
+
+def configure_from_env(client: SonicRPCClient, network: str = "testnet"):
+    """Attach a recording or replay transport to a client based on the environment"""
+    replay_path = os.getenv("SONIC_RPC_REPLAY")
+    record_path = os.getenv("SONIC_RPC_RECORD")
+
+    if replay_path:
+        replay = ReplayTransport(
+            replay_path,
+            latency_scale=float(os.getenv("SONIC_RPC_REPLAY_SCALE", "1.0")),
+            strict=os.getenv("SONIC_RPC_REPLAY_STRICT", "1").lower() not in ("0", "false", "no"),
+            network=network,
+        )
+        client.transport = replay
+        report_path = os.getenv("SONIC_RPC_REPLAY_REPORT")
+
+        def _report():
+            report = replay.report()
+            if report_path:
+                with open(report_path, "w") as f:
+                    json.dump(report, f, indent=2)
+            elif report["changed"]:
+                print(f"RPC replay call pattern changed: {json.dumps(report['methods'])}", file=sys.stderr)
+
+        atexit.register(_report)
+    elif record_path:
+        recorder = _recorders.get(record_path)
+        if recorder is None:
+            recorder = _recorders[record_path] = RPCRecorder(record_path)
+            atexit.register(recorder.close)
+        client.transport = RecordingTransport(client.transport or client.http_post, recorder, network)
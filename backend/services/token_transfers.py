@@ -0,0 +1,222 @@
+"""
+ERC-20 Transfer Indexer for Smart Sonic
+The leader worker pulls Transfer(address,address,uint256) logs with
+eth_getLogs over block ranges and files each transfer under its sender and
+recipient in the shared cache, so history can show token movements that
+never appear as a transaction's from/to
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from services.cache import get_cache
+from services.chain_head import HeadFollower, get_head_follower
+from services.log_scanner import LogScanner
+from services.metrics import registry
+from services.rpc_client import RPCError, SonicRPCClient, get_rpc_client
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+DECIMALS_SELECTOR = "0x313ce567"
+SYMBOL_SELECTOR = "0x95d89b41"
+# Public endpoints cap batch sizes; header lookups are split into batches this large
+HEADER_BATCH = 200
+
+INDEXED_TRANSFERS = registry.counter(
+    "sonic_token_transfers_indexed_total", "ERC-20 Transfer logs filed by the token indexer", ["network"]
+)
+TRANSFER_BLOCK = registry.gauge("sonic_token_indexer_block", "Last block scanned for ERC-20 transfers", ["network"])
+
+
+def topic_address(topic: str) -> str:
+    """Indexed address topic (32-byte word) to a 0x address"""
+    return "0x" + topic[-40:].lower()
+
+
+def decode_uint(data: Optional[str]) -> int:
+    return int(data[2:66] or "0", 16) if data and len(data) > 2 else 0
+
+
+def decode_symbol(data: Optional[str]) -> Optional[str]:
+    """ABI string return value, or the bytes32 some older tokens return"""
+    raw = bytes.fromhex(data[2:]) if data and len(data) > 2 else b""
+    if len(raw) >= 64:
+        offset = int.from_bytes(raw[:32], "big")
+        if offset + 32 <= len(raw):
+            length = int.from_bytes(raw[offset:offset + 32], "big")
+            raw = raw[offset + 32:offset + 32 + length]
+    symbol = raw.rstrip(b"\0").decode("utf-8", "replace")
+    return symbol or None
+
+
+def is_revert(error: RPCError) -> bool:
+    """Whether an eth_call failed because the contract reverted, not because the request did"""
+    # 3 is the code geth-style nodes use for "execution reverted"
+    return error.code == 3 or "revert" in error.message.lower()
+
+
+def parse_transfer(log: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ERC-20 Transfer log to a transfer record; ERC-721 (tokenId indexed, 4 topics) is skipped"""
+    topics = log.get("topics") or []
+    if len(topics) != 3 or topics[0] != TRANSFER_TOPIC:
+        return None
+    transfer = {
+        "hash": log["transactionHash"],
+        "block": int(log["blockNumber"], 16),
+        "logIndex": int(log.get("logIndex") or "0x0", 16),
+        "token": log["address"].lower(),
+        "from": topic_address(topics[1]),
+        "to": topic_address(topics[2]),
+        # Amounts can exceed what JSON readers take as numbers
+        "amount": str(decode_uint(log.get("data"))),
+    }
+    if log.get("blockTimestamp"):
+        transfer["timestamp"] = int(log["blockTimestamp"], 16)
+    return transfer
+
+
+class TokenTransferIndexer:
+    """Transfers per address for one network, newest first.
+
+    Logs come from an adaptive LogScanner window at a time; for each window
+    the indexer looks up timestamps and token metadata it has not seen in
+    batched round trips and then rewrites each touched address's list once.
+    Address lists are capped at ``history`` entries and remember the last
+    block they include, so rescanning after a restart is harmless.
+    """
+
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None,
+                 head: Optional[HeadFollower] = None, scanner: Optional[LogScanner] = None,
+                 backfill_blocks: Optional[int] = None, history: Optional[int] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.head = head or (get_head_follower(network) if rpc_client is None else HeadFollower(network, rpc_client))
+        self.backfill_blocks = backfill_blocks if backfill_blocks is not None else int(
+            os.getenv("INDEXER_BACKFILL_BLOCKS", "1000")
+        )
+        self.history = history or int(os.getenv("TOKEN_TRANSFER_HISTORY", "200"))
+        self.transfers = get_cache(f"token_transfers:{network}")
+        self.tokens = get_cache(f"tokens:{network}")
+        self.scanner = scanner or LogScanner(
+            self.rpc, topics=[TRANSFER_TOPIC], name=f"token_transfers:{network}",
+            checkpoint=f"token_transfers:{network}",
+        )
+
+    async def checkpoint(self) -> Optional[Dict[str, int]]:
+        return await self.scanner.checkpoint()
+
+    async def _add_timestamps(self, transfers: List[Dict[str, Any]]):
+        """Nodes that don't put blockTimestamp on logs get batched header reads instead"""
+        missing = sorted({t["block"] for t in transfers if "timestamp" not in t})
+        if not missing:
+            return
+        chunks = [missing[i:i + HEADER_BATCH] for i in range(0, len(missing), HEADER_BATCH)]
+        replies = await asyncio.gather(*(
+            self.rpc.batch([("eth_getBlockByNumber", [hex(n), False]) for n in chunk]) for chunk in chunks
+        ))
+        headers = [header for reply in replies for header in reply]
+        timestamps = {
+            number: int(header["timestamp"], 16)
+            for number, header in zip(missing, headers)
+            if isinstance(header, dict)
+        }
+        for transfer in transfers:
+            if "timestamp" not in transfer and transfer["block"] in timestamps:
+                transfer["timestamp"] = timestamps[transfer["block"]]
+
+    async def token_info(self, tokens: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Symbol and decimals per token, read once per token in batched round trips.
+
+        Metadata is only cached once both reads answered or reverted; a token
+        without ``decimals()``/``symbol()`` is remembered as ``None``.
+        """
+        tokens = list(dict.fromkeys(tokens))
+        known = dict(zip(tokens, await self.tokens.get_many(tokens)))
+        unknown = [token for token, info in known.items() if info is None]
+        if unknown:
+            calls = []
+            for token in unknown:
+                calls.append(("eth_call", [{"to": token, "data": DECIMALS_SELECTOR}, "latest"]))
+                calls.append(("eth_call", [{"to": token, "data": SYMBOL_SELECTOR}, "latest"]))
+            chunks = [calls[i:i + HEADER_BATCH] for i in range(0, len(calls), HEADER_BATCH)]
+            replies = [reply for chunk in await asyncio.gather(*(self.rpc.batch(c) for c in chunks)) for reply in chunk]
+            writes = []
+            for i, token in enumerate(unknown):
+                decimals, symbol = replies[2 * i], replies[2 * i + 1]
+                info = {
+                    "decimals": decode_uint(decimals) if isinstance(decimals, str) else None,
+                    "symbol": decode_symbol(symbol) if isinstance(symbol, str) else None,
+                }
+                known[token] = info
+                # A rejected batch, rate limit or timeout says nothing about the token; ask again next time
+                if all(isinstance(reply, str) or is_revert(reply) for reply in (decimals, symbol)):
+                    writes.append(self.tokens.set(token, info))
+            await asyncio.gather(*writes)
+        return known
+
+    async def index_logs(self, end: int, logs: List[Dict[str, Any]]) -> int:
+        """File the Transfer logs of a window ending at ``end``; returns transfers filed"""
+        transfers = [t for t in map(parse_transfer, logs) if t is not None]
+        if transfers:
+            await self._add_timestamps(transfers)
+            await self.token_info([t["token"] for t in transfers])
+
+        by_address: Dict[str, List[Dict[str, Any]]] = {}
+        for transfer in transfers:
+            for address in {transfer["from"], transfer["to"]}:
+                by_address.setdefault(address, []).append(transfer)
+        addresses = list(by_address)
+        records = await self.transfers.get_many(addresses)
+        writes = []
+        for address, record in zip(addresses, records):
+            through = record["through"] if record else -1
+            # Replayed windows (after a restart the scanner's window size starts over) end
+            # anywhere; only blocks past what the record already covers are new
+            new = [t for t in by_address[address] if t["block"] > through]
+            if not new:
+                continue
+            newest = sorted(new, key=lambda t: (t["block"], t["logIndex"]), reverse=True)
+            items = (newest + (record["items"] if record else []))[:self.history]
+            writes.append(self.transfers.set(address, {"items": items, "through": max(end, through)}))
+        await asyncio.gather(*writes)
+        TRANSFER_BLOCK.labels(self.network).set(end)
+        INDEXED_TRANSFERS.labels(self.network).inc(len(transfers))
+        return len(transfers)
+
+    async def catch_up(self) -> int:
+        """Scan up to the current head; returns blocks scanned"""
+        head = await self.head.block_number()
+        start = await self.scanner.resume(max(0, head - self.backfill_blocks))
+        async for _, end, logs in self.scanner.scan(start, head):
+            await self.index_logs(end, logs)
+        return max(0, head - start + 1)
+
+    async def run(self):
+        """Leader job: follow the head until cancelled"""
+        while True:
+            try:
+                if not await self.catch_up():
+                    await asyncio.sleep(self.head.interval)
+            except (RPCError, asyncio.TimeoutError, OSError) as e:
+                print(f"Token transfer indexing for {self.network} failed: {e}")
+                await asyncio.sleep(self.head.interval)
+
+    async def get_transfers(self, address: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most recent indexed transfers to or from an address, with token symbol/decimals"""
+        record = await self.transfers.get(address.lower())
+        items = record["items"][:limit] if record else []
+        if items:
+            info = await self.token_info([t["token"] for t in items])
+            items = [dict(t, **info.get(t["token"], {})) for t in items]
+        return items
+
+
+_indexers: Dict[str, TokenTransferIndexer] = {}
+
+
+def get_token_transfer_indexer(network: str = "testnet") -> TokenTransferIndexer:
+    indexer = _indexers.get(network)
+    if indexer is None:
+        indexer = _indexers[network] = TokenTransferIndexer(network)
+    return indexer
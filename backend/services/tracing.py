@@ -0,0 +1,193 @@
+"""
+Request Tracing for Smart Sonic
+Lightweight span trees propagated through contextvars, sampled per request
+"""
+
+import contextvars
+import functools
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("sonic_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attributes", "children", "started", "ended", "error")
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.children: List["Span"] = []
+        self.started = time.perf_counter()
+        self.ended: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        end = self.ended if self.ended is not None else time.perf_counter()
+        return end - self.started
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        """Serialize the span tree with offsets relative to the root"""
+        origin = self.started if origin is None else origin
+        data = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+        }
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+    def format_tree(self, indent: int = 0, origin: Optional[float] = None) -> str:
+        origin = self.started if origin is None else origin
+        line = f"{'  ' * indent}{self.name} +{(self.started - origin) * 1000:.1f}ms {self.duration * 1000:.1f}ms"
+        if self.error:
+            line += f" error={self.error}"
+        lines = [line]
+        for child in self.children:
+            lines.append(child.format_tree(indent + 1, origin))
+        return "\n".join(lines)
+
+
+class _SpanContext:
+    """Context manager that opens a child span when the request is being traced"""
+
+    __slots__ = ("_name", "_attributes", "_span", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self._name = name
+        self._attributes = attributes
+        self._span = None
+        self._token = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current_span.get()
+        if parent is None:
+            # Unsampled request: tracing costs one contextvar lookup
+            return None
+        self._span = Span(self._name, self._attributes)
+        parent.children.append(self._span)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            self._span.ended = time.perf_counter()
+            if exc is not None:
+                self._span.error = f"{exc_type.__name__}: {exc}"
+            _current_span.reset(self._token)
+        return False
+
+
+def span(name: str, **attributes) -> _SpanContext:
+    """Open a child span under the current request's trace (no-op when unsampled)"""
+    return _SpanContext(name, attributes)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def traced(name: Optional[str] = None):
+    """Decorator wrapping an async function in a span"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return await func(*args, **kwargs)
+            with span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Tracer:
+    def __init__(self, sample_rate: Optional[float] = None, buffer_size: Optional[int] = None,
+                 log_slow_ms: Optional[float] = None):
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+        self.log_slow_ms = log_slow_ms if log_slow_ms is not None else float(os.getenv("TRACE_LOG_SLOW_MS", "0"))
+        self._recent: deque = deque(maxlen=buffer_size or int(os.getenv("TRACE_BUFFER_SIZE", "256")))
+
+    def should_sample(self, force: bool = False) -> bool:
+        return force or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, name: str, **attributes):
+        """Start a root span and make it current; returns (span, token)"""
+        root = Span(name, attributes)
+        return root, _current_span.set(root)
+
+    def finish(self, root: Span, token):
+        root.ended = time.perf_counter()
+        _current_span.reset(token)
+        self._recent.append(root)
+        if self.log_slow_ms and root.duration * 1000 >= self.log_slow_ms:
+            logger.warning("Slow request trace:\n%s", root.format_tree())
+
+    def slowest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Span trees of the slowest recently sampled requests"""
+        ranked = sorted(self._recent, key=lambda s: s.duration, reverse=True)[:limit]
+        return [root.to_dict() for root in ranked]
+
+    def clear(self):
+        self._recent.clear()
+
+
+tracer = Tracer()
+
+
+class TracingMiddleware:
+    """ASGI middleware that opens a root span for sampled HTTP requests.
+
+    Sending an ``X-Trace: 1`` header forces a request to be sampled.
+    """
+
+    def __init__(self, app, tracer_instance: Optional[Tracer] = None):
+        self.app = app
+        self.tracer = tracer_instance or tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        forced = (b"x-trace", b"1") in scope.get("headers", [])
+        if not self.tracer.should_sample(forced):
+            await self.app(scope, receive, send)
+            return
+
+        root, token = self.tracer.start(f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("status", message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                root.set_attribute("route", getattr(route, "path", None))
+            self.tracer.finish(root, token)
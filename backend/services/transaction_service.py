@@ -1,39 +1,66 @@
 """
 Transaction History Service for Smart Sonic
-Fetches real transaction data from Sonic testnet
+Fetches real transaction data from a Sonic network (testnet by default)
 """
 
 import asyncio
-import aiohttp
+import os
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import json
 
+from config.sonic_config import get_network_config
+from services.cache import get_cache
+from services.chain_head import HeadFollower, get_head_follower
+from services.metrics import OPERATION_ERRORS
+from services.rpc_client import SonicRPCClient, get_rpc_client
+from services.token_transfers import TokenTransferIndexer, get_token_transfer_indexer
+from services.tracing import traced
+
 class TransactionService:
-    def __init__(self):
-        self.rpc_url = "https://rpc.testnet.soniclabs.com"
-        self.explorer_api = "https://testnet.soniclabs.com/api"
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None,
+                 token_transfers: Optional[TokenTransferIndexer] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        # The leader worker publishes the head block; fall back to our own client otherwise
+        self.head = get_head_follower(network) if rpc_client is None else HeadFollower(self.network, rpc_client)
+        # ERC-20 transfers only show up in logs; the leader's indexer files them by address
+        self.token_transfers = token_transfers or (
+            get_token_transfer_indexer(network) if rpc_client is None
+            else TokenTransferIndexer(self.network, rpc_client, self.head)
+        )
+        self.rpc_url = self.rpc.rpc_url
+        self.explorer_api = get_network_config(network)["explorer_api"]
+        # Mined blocks and receipts don't change; share them across workers (block numbers are per network)
+        self.blocks = get_cache(f"blocks:{network}")
+        self.receipts = get_cache(f"receipts:{network}")
+        self.immutable_ttl = float(os.getenv("BLOCK_CACHE_TTL", "86400"))
         
+    @traced("transactions.history")
     async def get_transaction_history(self, address: str, limit: int = 10) -> Dict[str, Any]:
-        """Get transaction history for an address from Sonic testnet"""
+        """Get transaction history for an address from this service's network"""
         try:
-            async with aiohttp.ClientSession() as session:
-                # Get latest transactions using RPC
-                transactions = await self._fetch_transactions_rpc(session, address, limit)
-                
-                # Format transactions for display
-                formatted_txs = []
-                for tx in transactions:
-                    formatted_tx = await self._format_transaction(session, tx, address)
-                    if formatted_tx:
-                        formatted_txs.append(formatted_tx)
-                
-                return {
-                    "success": True,
-                    "address": address,
-                    "transactions": formatted_txs[:limit],
-                    "total_found": len(formatted_txs)
-                }
+            # Get latest transactions using RPC, and indexed token transfers alongside
+            transactions, transfers = await asyncio.gather(
+                self._fetch_transactions_rpc(address, limit),
+                self._fetch_token_transfers(address, limit),
+            )
+            
+            # Format transactions for display
+            formatted_txs = []
+            for tx in transactions:
+                formatted_tx = await self._format_transaction(tx, address)
+                if formatted_tx:
+                    formatted_txs.append(formatted_tx)
+            formatted_txs = self._merge_token_transfers(formatted_txs, transfers, address)
+            
+            return {
+                "success": True,
+                "address": address,
+                "network": self.network,
+                "transactions": formatted_txs[:limit],
+                "total_found": len(formatted_txs)
+            }
                 
         except Exception as e:
             return {
@@ -42,45 +69,27 @@ class TransactionService:
                 "transactions": []
             }
     
-    async def _fetch_transactions_rpc(self, session: aiohttp.ClientSession, address: str, limit: int) -> List[Dict]:
+    @traced("transactions.scan_blocks")
+    async def _fetch_transactions_rpc(self, address: str, limit: int) -> List[Dict]:
         """Fetch transactions using RPC calls"""
         try:
             # Get latest block number
-            latest_block_payload = {
-                "jsonrpc": "2.0",
-                "method": "eth_blockNumber",
-                "params": [],
-                "id": 1
-            }
-            
-            async with session.post(self.rpc_url, json=latest_block_payload) as response:
-                latest_result = await response.json()
-                latest_block = int(latest_result["result"], 16)
+            latest_block = await self.head.block_number()
             
             transactions = []
             blocks_to_check = min(100, latest_block)  # Check last 100 blocks
             
             # Check recent blocks for transactions involving this address
             for block_num in range(latest_block - blocks_to_check, latest_block + 1):
-                block_payload = {
-                    "jsonrpc": "2.0",
-                    "method": "eth_getBlockByNumber",
-                    "params": [hex(block_num), True],
-                    "id": 1
-                }
+                block_data = await self._get_block(block_num)
                 
-                async with session.post(self.rpc_url, json=block_payload) as response:
-                    block_result = await response.json()
-                    
-                    if "result" in block_result and block_result["result"]:
-                        block_data = block_result["result"]
-                        if block_data and "transactions" in block_data:
-                            for tx in block_data["transactions"]:
-                                if (tx.get("from", "").lower() == address.lower() or 
-                                    tx.get("to", "").lower() == address.lower()):
-                                    tx["blockNumber"] = block_num
-                                    tx["timestamp"] = int(block_data.get("timestamp", "0x0"), 16)
-                                    transactions.append(tx)
+                if block_data and "transactions" in block_data:
+                    for tx in block_data["transactions"]:
+                        if ((tx.get("from") or "").lower() == address.lower() or 
+                            (tx.get("to") or "").lower() == address.lower()):
+                            tx["blockNumber"] = block_num
+                            tx["timestamp"] = int(block_data.get("timestamp", "0x0"), 16)
+                            transactions.append(tx)
                 
                 if len(transactions) >= limit:
                     break
@@ -90,31 +99,83 @@ class TransactionService:
             return transactions[:limit]
             
         except Exception as e:
+            OPERATION_ERRORS.labels("fetch_transactions").inc()
             print(f"Error fetching transactions via RPC: {e}")
             return []
     
-    async def _format_transaction(self, session: aiohttp.ClientSession, tx: Dict, user_address: str) -> Optional[Dict]:
+    async def _fetch_token_transfers(self, address: str, limit: int) -> List[Dict]:
+        try:
+            return await self.token_transfers.get_transfers(address, limit)
+        except Exception as e:
+            OPERATION_ERRORS.labels("fetch_token_transfers").inc()
+            print(f"Error fetching token transfers: {e}")
+            return []
+
+    def _merge_token_transfers(self, formatted_txs: List[Dict], transfers: List[Dict], user_address: str) -> List[Dict]:
+        """Attach transfers to the transaction that emitted them, or list them on their own (newest first)"""
+        user_addr = user_address.lower()
+        by_hash = {tx["hash"]: tx for tx in formatted_txs}
+        for transfer in transfers:
+            decimals = transfer.get("decimals")
+            amount = int(transfer["amount"])
+            outgoing = transfer["from"] == user_addr
+            token_transfer = {
+                "token": transfer["token"],
+                "symbol": transfer.get("symbol"),
+                "value": amount / 10 ** decimals if decimals is not None else amount,
+                "direction": "sent" if outgoing else "received",
+                "counterparty": transfer["to"] if outgoing else transfer["from"],
+            }
+            tx = by_hash.get(transfer["hash"])
+            if tx is None:
+                timestamp = transfer.get("timestamp")
+                tx = by_hash[transfer["hash"]] = {
+                    "hash": transfer["hash"],
+                    "direction": token_transfer["direction"],
+                    "counterparty": token_transfer["counterparty"],
+                    "value": 0.0,
+                    "fee": 0.0,  # paid by the transaction's sender
+                    "status": "success",  # reverted transactions emit no logs
+                    "timestamp": datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") if timestamp else "Unknown",
+                    "block": transfer["block"],
+                    "gas_used": 0,
+                    "gas_price": 0,
+                    "type": "token_transfer",
+                    "token_transfers": [],
+                }
+            tx["type"] = "token_transfer"
+            tx.setdefault("token_transfers", []).append(token_transfer)
+        return sorted(by_hash.values(), key=lambda tx: tx.get("block", 0), reverse=True)
+
+    async def _get_block(self, block_num: int) -> Optional[Dict]:
+        """Full block by number, from the shared cache when another request already fetched it"""
+        return await self.blocks.get_or_fetch(
+            str(block_num),
+            lambda: self.rpc.call("eth_getBlockByNumber", [hex(block_num), True]),
+            self.immutable_ttl,
+        )
+
+    async def _get_receipt(self, tx_hash: str) -> Optional[Dict]:
+        return await self.receipts.get_or_fetch(
+            tx_hash,
+            lambda: self.rpc.call("eth_getTransactionReceipt", [tx_hash]),
+            self.immutable_ttl,
+        )
+
+    @traced("transactions.format")
+    async def _format_transaction(self, tx: Dict, user_address: str) -> Optional[Dict]:
         """Format transaction data for display"""
         try:
             # Get transaction receipt for status
-            receipt_payload = {
-                "jsonrpc": "2.0",
-                "method": "eth_getTransactionReceipt",
-                "params": [tx.get("hash")],
-                "id": 1
-            }
-            
             receipt = None
             try:
-                async with session.post(self.rpc_url, json=receipt_payload) as response:
-                    receipt_result = await response.json()
-                    receipt = receipt_result.get("result")
+                receipt = await self._get_receipt(tx.get("hash"))
             except:
                 pass
             
             # Determine transaction type and direction
-            from_addr = tx.get("from", "").lower()
-            to_addr = tx.get("to", "").lower()
+            from_addr = (tx.get("from") or "").lower()
+            to_addr = (tx.get("to") or "").lower()
             user_addr = user_address.lower()
             
             if from_addr == user_addr:
@@ -164,69 +225,62 @@ class TransactionService:
             }
             
         except Exception as e:
+            OPERATION_ERRORS.labels("format_transaction").inc()
             print(f"Error formatting transaction: {e}")
             return None
     
+    @traced("transactions.details")
     async def get_transaction_details(self, tx_hash: str) -> Dict[str, Any]:
         """Get detailed information about a specific transaction"""
         try:
-            async with aiohttp.ClientSession() as session:
-                # Get transaction data
-                tx_payload = {
-                    "jsonrpc": "2.0",
-                    "method": "eth_getTransactionByHash",
-                    "params": [tx_hash],
-                    "id": 1
-                }
-                
-                async with session.post(self.rpc_url, json=tx_payload) as response:
-                    tx_result = await response.json()
-                    tx_data = tx_result.get("result")
-                
-                if not tx_data:
-                    return {"success": False, "error": "Transaction not found"}
-                
-                # Get transaction receipt
-                receipt_payload = {
-                    "jsonrpc": "2.0",
-                    "method": "eth_getTransactionReceipt",
-                    "params": [tx_hash],
-                    "id": 1
-                }
-                
-                async with session.post(self.rpc_url, json=receipt_payload) as response:
-                    receipt_result = await response.json()
-                    receipt_data = receipt_result.get("result")
-                
-                # Format detailed transaction info
-                value_wei = int(tx_data.get("value", "0x0"), 16)
-                gas_price = int(tx_data.get("gasPrice", "0x0"), 16)
-                gas_limit = int(tx_data.get("gas", "0x0"), 16)
-                
-                gas_used = 0
-                status = "pending"
-                if receipt_data:
-                    gas_used = int(receipt_data.get("gasUsed", "0x0"), 16)
-                    status = "success" if receipt_data.get("status") == "0x1" else "failed"
-                
-                return {
-                    "success": True,
-                    "hash": tx_hash,
-                    "from": tx_data.get("from"),
-                    "to": tx_data.get("to"),
-                    "value_s": value_wei / 1e18,
-                    "gas_limit": gas_limit,
-                    "gas_used": gas_used,
-                    "gas_price_gwei": gas_price / 1e9,
-                    "fee_s": (gas_used * gas_price) / 1e18,
-                    "status": status,
-                    "block_number": int(tx_data.get("blockNumber", "0x0"), 16) if tx_data.get("blockNumber") else None,
-                    "nonce": int(tx_data.get("nonce", "0x0"), 16),
-                    "input_data": tx_data.get("input", "0x")
-                }
-                
+            # Get transaction data
+            tx_data = await self.rpc.call("eth_getTransactionByHash", [tx_hash])
+            
+            if not tx_data:
+                return {"success": False, "error": "Transaction not found"}
+            
+            # Get transaction receipt
+            receipt_data = await self.rpc.call("eth_getTransactionReceipt", [tx_hash])
+            
+            # Format detailed transaction info
+            value_wei = int(tx_data.get("value", "0x0"), 16)
+            gas_price = int(tx_data.get("gasPrice", "0x0"), 16)
+            gas_limit = int(tx_data.get("gas", "0x0"), 16)
+            
+            gas_used = 0
+            status = "pending"
+            if receipt_data:
+                gas_used = int(receipt_data.get("gasUsed", "0x0"), 16)
+                status = "success" if receipt_data.get("status") == "0x1" else "failed"
+            
+            return {
+                "success": True,
+                "hash": tx_hash,
+                "from": tx_data.get("from"),
+                "to": tx_data.get("to"),
+                "value_s": value_wei / 1e18,
+                "gas_limit": gas_limit,
+                "gas_used": gas_used,
+                "gas_price_gwei": gas_price / 1e9,
+                "fee_s": (gas_used * gas_price) / 1e18,
+                "status": status,
+                "block_number": int(tx_data.get("blockNumber", "0x0"), 16) if tx_data.get("blockNumber") else None,
+                "nonce": int(tx_data.get("nonce", "0x0"), 16),
+                "input_data": tx_data.get("input", "0x")
+            }
+            
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Failed to get transaction details: {str(e)}"
-            }
\ No newline at end of file
+            }
+
+
+_services: Dict[str, TransactionService] = {}
+
+
+def get_transaction_service(network: str = "testnet") -> TransactionService:
+    service = _services.get(network)
+    if service is None:
+        service = _services[network] = TransactionService(network)
+    return service
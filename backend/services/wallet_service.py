@@ -1,37 +1,61 @@
 import asyncio
+import os
 import uuid
 from typing import Dict, Any, Optional
 from web3 import Web3
 import requests
 
+from services.cache import get_cache
+from services.circuit_breaker import CircuitOpenError, stale_reader
+from services.fee_estimator import FeeEstimator, get_fee_estimator
+from services.rpc_client import SonicRPCClient, get_rpc_client
+
 class WalletService:
-    def __init__(self):
-        self.rpc_url = "https://rpc.testnet.soniclabs.com"
-        self.web3 = Web3(Web3.HTTPProvider(self.rpc_url))
+    def __init__(self, network: str = "testnet", rpc_client: Optional[SonicRPCClient] = None):
+        self.network = network
+        self.rpc = rpc_client or get_rpc_client(network)
+        self.rpc_url = self.rpc.rpc_url
+        # Only used for unit conversion and address validation; reads go through self.rpc
+        self.web3 = Web3()
+        self.balances = stale_reader(network, "eth_getBalance")
+        self.balance_cache = get_cache(f"balances:{network}", default_ttl=float(os.getenv("BALANCE_CACHE_TTL", "2")))
+        self.fees = get_fee_estimator(network) if rpc_client is None else FeeEstimator(network, rpc_client)
         self.base_payment_url = "https://astra-ai.vercel.app/pay"
 
     async def get_balance(self, address: str) -> Dict[str, Any]:
         """Get wallet balance for S tokens and other assets"""
         try:
-            # Get S token balance
-            balance_wei = self.web3.eth.get_balance(address)
+            # Get S token balance; during an RPC outage this is the last known value
+            balance_hex, stale_age = await self.balances.get(
+                address, lambda: self.balance_cache.get_or_fetch(
+                    address.lower(), lambda: self.rpc.call("eth_getBalance", [address, "latest"])
+                )
+            )
+            balance_wei = int(balance_hex, 16)
             balance_s = self.web3.from_wei(balance_wei, 'ether')
             
             # Get USD value (mock price for demo)
             s_price = await self._get_s_token_price()
             usd_value = float(balance_s) * s_price
             
-            return {
+            balance = {
                 "token": "S",
                 "balance": f"{balance_s:.6f}",
                 "usdValue": f"{usd_value:.2f}",
                 "change24h": "+5.2",  # Mock 24h change
-                "address": address
+                "address": address,
+                "network": self.network,
+                "stale": stale_age is not None
             }
+            if stale_age is not None:
+                balance["staleAgeSeconds"] = round(stale_age, 1)
+            return balance
             
+        except CircuitOpenError as e:
+            return {"token": "S", "address": address, "network": self.network, "error": "Sonic RPC unavailable",
+                    "retryAfter": round(e.retry_after)}
         except Exception as e:
-            # Return mock data for demo
-            return self._get_mock_balance(address)
+            return {"token": "S", "address": address, "network": self.network, "error": str(e)}
 
     async def create_payment_link(self, amount: float, token: str = "S", message: str = "") -> Dict[str, Any]:
         """Create a payment link with QR code"""
@@ -73,15 +97,18 @@ class WalletService:
             # Convert amount to Wei
             amount_wei = self.web3.to_wei(amount, 'ether')
             
-            # Estimate gas
-            gas_estimate = self.web3.eth.estimate_gas({
-                'from': from_addr,
-                'to': to_addr,
-                'value': amount_wei
-            })
-            
-            # Get gas price
-            gas_price = self.web3.eth.gas_price
+            # Estimate without sender and value so the quote is cached per recipient
+            # shape and block; affordability is checked against the cached balance
+            quote, balance_hex = await asyncio.gather(
+                self.fees.estimate({'to': to_addr}),
+                self.balance_cache.get_or_fetch(
+                    from_addr.lower(), lambda: self.rpc.call("eth_getBalance", [from_addr, "latest"])
+                ),
+                return_exceptions=True,
+            )
+            if isinstance(quote, BaseException):
+                raise quote
+            gas_estimate, gas_price = quote
             
             # Calculate fee
             fee_wei = gas_estimate * gas_price
@@ -91,6 +118,9 @@ class WalletService:
                 "gasEstimate": gas_estimate,
                 "gasPrice": self.web3.from_wei(gas_price, 'gwei'),
                 "feeS": f"{fee_s:.6f}",
+                "sufficientFunds": (
+                    None if isinstance(balance_hex, BaseException) else int(balance_hex, 16) >= amount_wei + fee_wei
+                ),
                 "feeUSD": f"{float(fee_s) * await self._get_s_token_price():.4f}"
             }
             
@@ -119,16 +149,6 @@ class WalletService:
         except Exception:
             return 2.50
 
-    def _get_mock_balance(self, address: str) -> Dict[str, Any]:
-        """Return mock balance data for demo"""
-        return {
-            "token": "S",
-            "balance": "123.456789",
-            "usdValue": "308.64",
-            "change24h": "+5.2",
-            "address": address
-        }
-
     def _get_mock_transactions(self, address: str, limit: int) -> list:
         """Return mock transaction history"""
         return [
@@ -152,4 +172,14 @@ class WalletService:
                 "timestamp": "2024-01-14 09:15:10",
                 "usdValue": "125.00"
             }
-        ][:limit]
\ No newline at end of file
+        ][:limit]
+
+
+_services: Dict[str, WalletService] = {}
+
+
+def get_wallet_service(network: str = "testnet") -> WalletService:
+    service = _services.get(network)
+    if service is None:
+        service = _services[network] = WalletService(network)
+    return service
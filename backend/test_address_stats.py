@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the address statistics indexer against the local RPC simulator
+"""
+
+import asyncio
+import os
+import tempfile
+
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.address_stats import AddressStatsIndexer
+from services.chain_head import HeadFollower
+from services.durable_store import DurableStore
+from services.rpc_client import SonicRPCClient
+
+
+def make_indexer(simulator: SonicChainSimulator, directory: str, **kwargs) -> AddressStatsIndexer:
+    rpc = SonicRPCClient("http://simulator", transport=simulator)
+    state = DurableStore(os.path.join(directory, "state.sqlite3"))
+    network = f"test-stats-{os.path.basename(directory)}"
+    return AddressStatsIndexer(network, rpc, HeadFollower(network, rpc), state=state,
+                               backfill_blocks=simulator.head, **kwargs)
+
+
+def expected_transactions(simulator: SonicChainSimulator, address: str) -> int:
+    count = 0
+    for number in range(simulator.blocks):
+        for tx in simulator._rpc_eth_getBlockByNumber(hex(number), True)["transactions"]:
+            count += address in (tx["from"], tx["to"])
+    return count
+
+
+def test_busy_ranges_stay_under_the_batch_cap():
+    async def run(block_receipts: bool):
+        # 20 blocks of 30 transactions: 600 receipts, far over a 50-request cap
+        simulator = SonicChainSimulator(blocks=41, txs_per_block=30, max_batch=50, block_receipts=block_receipts)
+        with tempfile.TemporaryDirectory() as directory:
+            indexer = make_indexer(simulator, directory, batch_blocks=20, rpc_batch=50)
+            assert await indexer.catch_up() == simulator.blocks
+            assert simulator.calls["rejected_batch"] == 0
+            address = simulator.sample_address(3)
+            stats = await indexer.get_stats(address)
+            assert stats["transactions"] == expected_transactions(simulator, address)
+            assert stats["indexed_through"] == simulator.head
+            indexer.state.close()
+
+    asyncio.run(run(block_receipts=True))
+    asyncio.run(run(block_receipts=False))
+
+
+def test_replayed_range_is_not_counted_twice():
+    async def run():
+        simulator = SonicChainSimulator(blocks=30, txs_per_block=5)
+        with tempfile.TemporaryDirectory() as directory:
+            indexer = make_indexer(simulator, directory, batch_blocks=10)
+            await indexer.catch_up()
+            address = simulator.sample_address(1)
+            before = await indexer.get_stats(address)
+            try:
+                await indexer.index_range(10, 19)
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("a stale range should be refused")
+            assert await indexer.get_stats(address) == before
+            indexer.state.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
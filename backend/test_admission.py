@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control: fair queueing per address and CoDel-style shedding
+"""
+
+import asyncio
+
+from services.admission import AdmissionController, Overloaded
+
+
+async def queue_up(controller: AdmissionController, key: str, admitted: list) -> asyncio.Task:
+    async def acquire():
+        await controller.acquire(key)
+        admitted.append(key)
+
+    task = asyncio.ensure_future(acquire())
+    await asyncio.sleep(0)  # let it reach the queue
+    return task
+
+
+async def shed_reason(controller: AdmissionController, key: str) -> str:
+    try:
+        await controller.acquire(key)
+    except Overloaded as e:
+        assert e.retry_after >= 1
+        return e.reason
+    raise AssertionError("request should have been shed")
+
+
+def test_busy_address_does_not_starve_others():
+    async def run():
+        controller = AdmissionController("test_fair", max_inflight=1, max_queue=10, max_queue_per_key=4)
+        await controller.acquire("holder")
+        admitted = []
+        tasks = [await queue_up(controller, "busy", admitted) for _ in range(3)]
+        tasks.append(await queue_up(controller, "quiet", admitted))
+        for _ in tasks:
+            controller.release(0.01)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        # Round-robin across addresses: the quiet one goes second, not last
+        assert admitted == ["busy", "quiet", "busy", "busy"]
+
+    asyncio.run(run())
+
+
+def test_per_address_and_total_queue_limits():
+    async def run():
+        controller = AdmissionController("test_limits", max_inflight=1, max_queue=3, max_queue_per_key=2)
+        await controller.acquire("holder")
+        admitted = []
+        tasks = [await queue_up(controller, "a", admitted) for _ in range(2)]
+        assert await shed_reason(controller, "a") == "shed_address_limit"
+        tasks.append(await queue_up(controller, "b", admitted))
+        assert await shed_reason(controller, "c") == "shed_queue_full"
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert controller.queued == 0
+
+    asyncio.run(run())
+
+
+def test_standing_queue_sheds_until_it_drains():
+    async def run():
+        controller = AdmissionController("test_codel", max_inflight=1, max_queue=10, target=0.01, interval=0.05)
+        await controller.acquire("a")
+        admitted = []
+        tasks = [await queue_up(controller, key, admitted) for key in ("b", "c", "d")]
+
+        # Every request now waits well past the target for longer than an interval
+        await asyncio.sleep(0.06)
+        controller.release(0.06)
+        await asyncio.sleep(0.06)
+        controller.release(0.06)
+        await asyncio.sleep(0)
+        assert controller.overloaded
+
+        # A full round is already queued behind the standing queue: fail fast
+        assert await shed_reason(controller, "e") == "shed_overload"
+        controller.release(0.06)
+        await asyncio.sleep(0)
+        # Nothing is queued, but while overloaded a new arrival only waits up to the target
+        assert await shed_reason(controller, "f") == "shed_queue_delay"
+
+        # Served promptly again: the queue has drained and admission recovers
+        controller.release(0.01)
+        await controller.acquire("g")
+        assert not controller.overloaded
+        await asyncio.gather(*tasks)
+        assert admitted == ["b", "c", "d"]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Tests for the transaction broadcaster against the local RPC simulator
+"""
+
+import asyncio
+import itertools
+
+from eth_account import Account
+
+from benchmarks.rpc_simulator import SonicChainSimulator, decode_raw_transaction
+from services.broadcaster import Broadcaster, nonce_taken
+from services.rpc_client import RPCError, SonicRPCClient
+
+_networks = itertools.count()
+
+
+class FlakyTransport:
+    """Simulator transport that times out the next ``fail[method]`` round trips containing ``method``"""
+
+    def __init__(self, simulator: SonicChainSimulator):
+        self.simulator = simulator
+        self.fail = {}
+
+    async def __call__(self, payload):
+        methods = {item["method"] for item in (payload if isinstance(payload, list) else [payload])}
+        for method in methods:
+            if self.fail.get(method):
+                self.fail[method] -= 1
+                raise asyncio.TimeoutError(f"{method} timed out")
+        return await self.simulator(payload)
+
+
+def make_broadcaster(linger_ms: float = 1):
+    simulator = SonicChainSimulator(blocks=5, txs_per_block=1)
+    transport = FlakyTransport(simulator)
+    account = Account.create()
+    simulator.fund(account.address)
+    rpc = SonicRPCClient("http://simulator", transport=transport)
+    # A network name of its own keeps the published head apart from other tests
+    broadcaster = Broadcaster(account, f"test-{next(_networks)}", rpc_client=rpc, linger_ms=linger_ms)
+    return broadcaster, simulator, transport
+
+
+def sign_external(account, nonce: int, gas_price: int = 10**9) -> str:
+    signed = account.sign_transaction({
+        "to": account.address, "value": 0, "nonce": nonce, "gas": 21000, "gasPrice": gas_price,
+        "chainId": int(SonicChainSimulator()._rpc_eth_chainId(), 16),
+    })
+    raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+    return "0x" + bytes(raw).hex()
+
+
+def sender_nonce(simulator: SonicChainSimulator, broadcaster: Broadcaster) -> int:
+    return simulator._nonces[broadcaster.address.lower()]
+
+
+def test_pipelined_sends_use_consecutive_nonces():
+    async def run():
+        broadcaster, simulator, _ = make_broadcaster()
+        recipient = simulator.sample_address(1)
+        hashes = await asyncio.gather(*(broadcaster.send(recipient, value=i) for i in range(10)))
+        assert simulator.pending_nonce(broadcaster.address.lower()) == 10
+        simulator.mine()
+        assert sender_nonce(simulator, broadcaster) == 10
+        assert all(simulator._rpc_eth_getTransactionReceipt(h) for h in hashes)
+
+    asyncio.run(run())
+
+
+def test_nonce_used_elsewhere_is_resynced():
+    async def run():
+        broadcaster, simulator, _ = make_broadcaster()
+        recipient = simulator.sample_address(1)
+        await broadcaster.send(recipient)
+        # Another process sends from the same key at the nonce we would use next
+        simulator._rpc_eth_sendRawTransaction(sign_external(broadcaster.account, 1))
+        tx_hash = await broadcaster.send(recipient)
+        assert simulator._pending[tx_hash]["nonce"] == 2
+        simulator.mine()
+        assert sender_nonce(simulator, broadcaster) == 3
+
+    asyncio.run(run())
+
+
+def test_rejected_transaction_gap_is_filled():
+    async def run():
+        broadcaster, simulator, _ = make_broadcaster(linger_ms=100)
+        recipient = simulator.sample_address(1)
+        await broadcaster.send(recipient)
+        too_big = asyncio.ensure_future(broadcaster.send(recipient, value=10**30))
+        await asyncio.sleep(0.05)  # reserves nonce 1 before the next send reserves 2
+        results = await asyncio.gather(too_big, broadcaster.send(recipient), return_exceptions=True)
+        assert isinstance(results[0], RPCError) and "insufficient funds" in results[0].message
+        assert simulator._pending[results[1]]["nonce"] == 2
+        await asyncio.sleep(0.2)  # the filler goes out with the next flush
+        simulator.mine()
+        assert sender_nonce(simulator, broadcaster) == 3
+        assert simulator._rpc_eth_getTransactionReceipt(results[1])
+
+    asyncio.run(run())
+
+
+def test_replacement_bumps_gas_price():
+    async def run():
+        broadcaster, simulator, _ = make_broadcaster()
+        original = await broadcaster.send(simulator.sample_address(1))
+        replacement = await broadcaster.replace(original)
+        assert replacement != original
+        assert simulator._pending[replacement]["gasPrice"] > broadcaster._sent[original]["gasPrice"]
+        simulator.mine()
+        assert simulator._rpc_eth_getTransactionReceipt(replacement)
+        assert simulator._rpc_eth_getTransactionReceipt(original) is None
+
+    asyncio.run(run())
+
+
+def test_stored_transaction_is_accepted_at_most_once():
+    async def run():
+        broadcaster, simulator, _ = make_broadcaster()
+        signed = await broadcaster.sign(simulator.sample_address(1), value=5)
+        assert await broadcaster.submit(signed) == signed["hash"]
+        # Submitted again after a restart, before and after it was mined
+        assert await broadcaster.submit(signed) == signed["hash"]
+        simulator.mine()
+        assert await broadcaster.submit(signed) == signed["hash"]
+        assert sender_nonce(simulator, broadcaster) == 1
+
+    asyncio.run(run())
+
+
+def test_stored_transaction_with_taken_nonce_is_reported():
+    async def run():
+        broadcaster, simulator, _ = make_broadcaster()
+        signed = await broadcaster.sign(simulator.sample_address(1), value=5)
+        simulator._rpc_eth_sendRawTransaction(sign_external(broadcaster.account, signed["tx"]["nonce"]))
+        simulator.mine()
+        try:
+            await asyncio.wait_for(broadcaster.submit(signed), 5)
+        except RPCError as e:
+            assert nonce_taken(e)
+        else:
+            raise AssertionError("submit should have failed")
+
+    asyncio.run(run())
+
+
+def test_resend_after_submit_timeout_is_already_known():
+    async def run():
+        broadcaster, simulator, transport = make_broadcaster()
+        transport.fail["eth_sendRawTransaction"] = 1
+        tx_hash = await asyncio.wait_for(broadcaster.send(simulator.sample_address(1)), 5)
+        assert tx_hash in simulator._pending
+
+    asyncio.run(run())
+
+
+def test_recovery_lookup_timeout_is_retried():
+    async def run():
+        broadcaster, simulator, transport = make_broadcaster()
+        await broadcaster.send(simulator.sample_address(1))
+        simulator._rpc_eth_sendRawTransaction(sign_external(broadcaster.account, 1))
+        # "replacement underpriced" is followed by a lookup that times out once
+        transport.fail["eth_getTransactionByHash"] = 1
+        tx_hash = await asyncio.wait_for(broadcaster.send(simulator.sample_address(1)), 5)
+        assert simulator._pending[tx_hash]["nonce"] == 2
+
+    asyncio.run(run())
+
+
+def test_recovery_failures_fail_the_send_instead_of_hanging():
+    async def run():
+        broadcaster, simulator, transport = make_broadcaster()
+        await broadcaster.send(simulator.sample_address(1))
+        simulator._rpc_eth_sendRawTransaction(sign_external(broadcaster.account, 1))
+        transport.fail["eth_getTransactionByHash"] = 100
+        try:
+            await asyncio.wait_for(broadcaster.send(simulator.sample_address(1)), 5)
+        except asyncio.TimeoutError as e:
+            assert "eth_getTransactionByHash" in str(e)
+        else:
+            raise AssertionError("send should have failed")
+
+        # Nonce resync failing as well: still an error, not a hang
+        transport.fail = {"eth_getTransactionCount": 100}
+        simulator._rpc_eth_sendRawTransaction(sign_external(broadcaster.account, 2))
+        try:
+            await asyncio.wait_for(broadcaster.send(simulator.sample_address(1)), 5)
+        except (asyncio.TimeoutError, RPCError):
+            pass
+        else:
+            raise AssertionError("send should have failed")
+
+        transport.fail = {}
+        tx_hash = await asyncio.wait_for(broadcaster.send(simulator.sample_address(1)), 5)
+        assert simulator._pending[tx_hash]["nonce"] == 3
+
+    asyncio.run(run())
+
+
+def test_gap_fill_failure_is_filled_by_the_next_send():
+    async def run():
+        broadcaster, simulator, _ = make_broadcaster(linger_ms=100)
+        recipient = simulator.sample_address(1)
+        await broadcaster.send(recipient)
+        gas_price = broadcaster._gas_price
+
+        async def flaky_gas_price():
+            # Fine while preparing sends, failing once the batch is being handled
+            if broadcaster._flusher is not None and not broadcaster._queue:
+                raise OSError("gas price unavailable")
+            return await gas_price()
+
+        broadcaster._gas_price = flaky_gas_price
+        too_big = asyncio.ensure_future(broadcaster.send(recipient, value=10**30))
+        await asyncio.sleep(0.05)
+        results = await asyncio.wait_for(
+            asyncio.gather(too_big, broadcaster.send(recipient), return_exceptions=True), 5
+        )
+        assert isinstance(results[0], RPCError)
+        assert simulator._pending[results[1]]["nonce"] == 2
+
+        broadcaster._gas_price = gas_price
+        filler = await broadcaster.send(recipient)
+        assert simulator._pending[filler]["nonce"] == 1
+        simulator.mine()
+        assert sender_nonce(simulator, broadcaster) == 3
+
+    asyncio.run(run())
+
+
+def test_decoded_raw_transaction_matches_sender():
+    account = Account.create()
+    tx = decode_raw_transaction(sign_external(account, 7))
+    assert tx["from"] == account.address.lower() and tx["nonce"] == 7
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
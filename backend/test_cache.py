@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared-memory cache backend
+"""
+
+import asyncio
+import fcntl
+import os
+import tempfile
+
+from services.cache import SharedMemoryBackend
+
+
+def test_workers_share_values():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache")
+            first, second = SharedMemoryBackend(path, size_mb=1), SharedMemoryBackend(path, size_mb=1)
+            await first.set("block:1", b"jdata")
+            await first.set("gone", b"jx", ttl=-1)
+            assert await second.get_many(["block:1", "gone", "missing"]) == [b"jdata", None, None]
+            await second.delete("block:1")
+            assert await first.get("block:1") is None
+            await first.close()
+            await second.close()
+
+    asyncio.run(run())
+
+
+def test_lock_held_elsewhere_does_not_block_the_loop():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache")
+            cache = SharedMemoryBackend(path, size_mb=1)
+            await cache.set("key", b"jvalue")
+            # Another worker mid-write: its own open file description holds the lock
+            fd = os.open(path, os.O_RDWR)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.001)
+
+            running = asyncio.ensure_future(ticker())
+            asyncio.get_running_loop().call_later(0.1, fcntl.flock, fd, fcntl.LOCK_UN)
+            assert await asyncio.wait_for(cache.get("key"), 2) == b"jvalue"
+            running.cancel()
+            os.close(fd)
+            await cache.close()
+            assert ticks >= 20
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for gas estimate caching against the local RPC simulator
+"""
+
+import asyncio
+import itertools
+
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.chain_head import HeadFollower
+from services.fee_estimator import FeeEstimator, call_shape
+from services.rpc_client import SonicRPCClient
+from services.wallet_service import WalletService
+
+_networks = itertools.count()
+
+ACCOUNT = "0x" + "11" * 20
+BULK_SELECTOR = "0x12345678"
+
+
+def make_estimator():
+    simulator = SonicChainSimulator(blocks=5, txs_per_block=1)
+    rpc = SonicRPCClient("http://simulator", transport=simulator)
+    # A network name of its own keeps cached estimates apart from other tests
+    network = f"test-fees-{next(_networks)}"
+    head = HeadFollower(network, rpc)
+    return FeeEstimator(network, rpc, head), simulator, head
+
+
+def test_call_shapes():
+    assert call_shape({"to": ACCOUNT}) == "transfer"
+    assert call_shape({"to": ACCOUNT}, recipient_is_contract=True) == f"transfer:{ACCOUNT}"
+    assert call_shape({"to": ACCOUNT, "data": "0xa9059cbb" + "00" * 64}) == f"erc20:{ACCOUNT}:0xa9059cbb:68"
+    assert call_shape({"to": ACCOUNT, "from": ACCOUNT, "value": "0x1"}) is None
+    assert call_shape({"data": "0x6080"}) is None
+    two = call_shape({"to": ACCOUNT, "data": BULK_SELECTOR + "00" * 32 * 2})
+    fifty = call_shape({"to": ACCOUNT, "data": BULK_SELECTOR + "00" * 32 * 50})
+    assert two != fifty
+
+
+def test_repeated_shapes_hit_until_the_head_moves():
+    async def run():
+        estimator, simulator, head = make_estimator()
+        token = simulator.tokens[0]
+        calls = [
+            ({"to": simulator.sample_address(1)}, {"to": simulator.sample_address(2)}),
+            ({"to": token}, {"to": token, "from": simulator.sample_address(3)}),
+            ({"to": token, "data": "0xa9059cbb" + "01" * 64}, {"to": token, "data": "0xa9059cbb" + "02" * 64}),
+        ]
+        await head.poll()
+        for first, second in calls:
+            await estimator.estimate(first)
+            simulator.reset_counters()
+            await estimator.estimate(second)
+            assert simulator.calls["eth_estimateGas"] == 0, first
+
+        # A new head block is a new key for every shape
+        simulator.blocks += 1
+        await head.poll()
+        for first, _ in calls:
+            simulator.reset_counters()
+            await estimator.estimate(first)
+            assert simulator.calls["eth_estimateGas"] == 1, first
+
+    asyncio.run(run())
+
+
+def test_contract_recipients_and_calldata_sizes_miss():
+    async def run():
+        estimator, simulator, head = make_estimator()
+        await head.poll()
+        await estimator.estimate({"to": simulator.sample_address(1)})
+        simulator.reset_counters()
+        # Same empty calldata, but the recipient runs code
+        await estimator.estimate({"to": simulator.tokens[0]})
+        assert simulator.calls["eth_estimateGas"] == 1
+
+        contract = simulator.tokens[1]
+        await estimator.estimate({"to": contract, "data": BULK_SELECTOR + "00" * 32 * 2})
+        simulator.reset_counters()
+        await estimator.estimate({"to": contract, "data": BULK_SELECTOR + "00" * 32 * 50})
+        assert simulator.calls["eth_estimateGas"] == 1
+
+    asyncio.run(run())
+
+
+def test_value_calls_from_a_sender_are_never_cached():
+    async def run():
+        estimator, simulator, head = make_estimator()
+        await head.poll()
+        call = {"to": simulator.sample_address(1), "from": simulator.sample_address(2), "value": "0x1"}
+        await estimator.estimate(call)
+        simulator.reset_counters()
+        await estimator.estimate(call)
+        assert simulator.calls["eth_estimateGas"] == 1
+
+    asyncio.run(run())
+
+
+def test_wallet_fee_quotes_are_cached_and_check_the_balance():
+    async def run():
+        estimator, simulator, head = make_estimator()
+        wallet = WalletService(estimator.network, estimator.rpc)
+        wallet.fees = estimator
+        sender, recipient = "0x" + "22" * 20, simulator.sample_address(2)
+        simulator.fund(sender, 10**18)
+        await head.poll()
+        quote = await wallet.estimate_transaction_fee(sender, recipient, 0.5)
+        assert quote["gasEstimate"] == 21000 and quote["sufficientFunds"] is True
+        simulator.reset_counters()
+        quote = await wallet.estimate_transaction_fee(sender, simulator.sample_address(3), 0.5)
+        assert simulator.calls["eth_estimateGas"] == 0
+        assert simulator.calls["eth_getBalance"] == 0
+        quote = await wallet.estimate_transaction_fee(sender, recipient, 5)
+        assert quote["sufficientFunds"] is False
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Tests for the durable job queue against a temporary SQLite file
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from services.job_queue import JobQueue, LeaseLost, PermanentJobError
+
+
+def run_with_queue(test, **kwargs):
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            queue = JobQueue(os.path.join(directory, "jobs.sqlite3"), **kwargs)
+            try:
+                await test(queue)
+            finally:
+                await queue.stop()
+
+    asyncio.run(run())
+
+
+def test_idempotency_key_returns_the_original_job():
+    async def test(queue):
+        first = await queue.enqueue("op", {"n": 1}, idempotency_key="chat:a:1")
+        again = await queue.enqueue("op", {"n": 2}, idempotency_key="chat:a:1")
+        other = await queue.enqueue("op", {"n": 3}, idempotency_key="chat:a:2")
+        assert again["id"] == first["id"] and again["payload"] == {"n": 1}
+        assert other["id"] != first["id"]
+        assert (await queue.counts())["queued"] == 2
+
+    run_with_queue(test)
+
+
+def test_claims_follow_priority():
+    async def test(queue):
+        low = await queue.enqueue("op", {}, priority=0)
+        high = await queue.enqueue("op", {}, priority=5)
+        assert (await queue.claim())["id"] == high["id"]
+        assert (await queue.claim())["id"] == low["id"]
+        assert await queue.claim() is None
+
+    run_with_queue(test)
+
+
+def test_failures_back_off_then_fail():
+    async def test(queue):
+        async def flaky(job):
+            raise RuntimeError("node unavailable")
+
+        async def broken(job):
+            raise PermanentJobError("bad request")
+
+        queue.register("flaky", flaky)
+        queue.register("broken", broken)
+        job = await queue.enqueue("flaky", {}, max_attempts=2)
+        before = time.time()
+        await queue.run_job(await queue.claim())
+        row = await queue.get(job["id"])
+        assert row["status"] == "queued" and "node unavailable" in row["error"]
+        # First retry waits retry_base * 2**0, jittered by 0.5-1.5x
+        assert before + 5 <= row["run_at"] <= time.time() + 15
+        assert await queue.claim() is None
+
+        await queue._write("UPDATE jobs SET run_at = 0 WHERE id = ?", (job["id"],))
+        await queue.run_job(await queue.claim())
+        assert (await queue.get(job["id"]))["status"] == "failed"
+
+        job = await queue.enqueue("broken", {})
+        await queue.run_job(await queue.claim())
+        row = await queue.get(job["id"])
+        assert row["status"] == "failed" and row["attempts"] == 1
+
+    run_with_queue(test, retry_base=10)
+
+
+def test_expired_lease_is_reclaimed_and_the_late_worker_cannot_overwrite_it():
+    async def test(queue):
+        reclaimed = asyncio.Event()
+        release = asyncio.Event()
+        outcomes = []
+
+        async def handler(job):
+            if job.attempts == 1:
+                await release.wait()
+                try:
+                    await job.report(step="late")
+                except LeaseLost:
+                    outcomes.append("lost")
+                    raise
+                return "stale"
+            await job.report(step="second")
+            reclaimed.set()
+            return "fresh"
+
+        queue.register("op", handler)
+        job = await queue.enqueue("op", {})
+        stale = asyncio.ensure_future(queue.run_job(await queue.claim()))
+        await asyncio.sleep(0.05)
+        # The worker stalls past its lease (blocked loop, GC pause) and another one takes over
+        await queue._write("UPDATE jobs SET lease_until = 0 WHERE id = ?", (job["id"],))
+        second = await queue.claim()
+        assert second["id"] == job["id"] and second["attempts"] == 2
+        await queue.run_job(second)
+        await reclaimed.wait()
+        release.set()
+        await stale
+
+        row = await queue.get(job["id"])
+        assert outcomes == ["lost"]
+        assert row["status"] == "succeeded" and row["result"] == "fresh"
+        assert row["progress"]["step"] == "second"
+
+    run_with_queue(test)
+
+
+def test_late_finish_after_reclaim_is_dropped():
+    async def test(queue):
+        job = await queue.enqueue("op", {})
+        first = await queue.claim()
+        await queue._write("UPDATE jobs SET lease_until = 0 WHERE id = ?", (job["id"],))
+        second = await queue.claim()
+        assert await queue._finish(first, "failed", error="late") is False
+        assert await queue._finish(second, "succeeded", result="ok") is True
+        row = await queue.get(job["id"])
+        assert row["status"] == "succeeded" and row["error"] is None
+
+    run_with_queue(test)
+
+
+def test_heartbeat_keeps_a_long_job_leased():
+    async def test(queue):
+        async def slow(job):
+            await asyncio.sleep(0.5)
+            return "done"
+
+        queue.register("op", slow)
+        job = await queue.enqueue("op", {})
+        running = asyncio.ensure_future(queue.run_job(await queue.claim()))
+        await asyncio.sleep(0.35)
+        # Past the original lease, but renewed
+        assert await queue.claim() is None
+        await running
+        assert (await queue.get(job["id"]))["result"] == "done"
+
+    run_with_queue(test, lease_seconds=0.3)
+
+
+def test_workers_run_queued_jobs():
+    async def test(queue):
+        async def double(job):
+            return job.payload["n"] * 2
+
+        queue.register("op", double)
+        queue.start()
+        jobs = [await queue.enqueue("op", {"n": n}) for n in range(5)]
+        for _ in range(100):
+            rows = [await queue.get(job["id"]) for job in jobs]
+            if all(row["status"] == "succeeded" for row in rows):
+                break
+            await asyncio.sleep(0.02)
+        assert [row["result"] for row in rows] == [0, 2, 4, 6, 8]
+
+    run_with_queue(test, workers=2, poll_interval=0.01)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
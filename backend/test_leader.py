@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for leader election between workers sharing a lock directory
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+from services.leader import LeaderElection
+
+
+async def wait_until(condition, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def test_one_leader_runs_jobs_and_hands_over_on_stop():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            runs = []
+
+            def job_for(worker):
+                async def job():
+                    runs.append(worker)
+                    await asyncio.Event().wait()
+                return job
+
+            workers = [LeaderElection("test", directory, retry_interval=0.02) for _ in range(3)]
+            for i, worker in enumerate(workers):
+                worker.register("head", job_for(i))
+                worker.start()
+            await wait_until(lambda: any(w.is_leader for w in workers))
+            await asyncio.sleep(0.1)
+            leaders = [i for i, w in enumerate(workers) if w.is_leader]
+            assert len(leaders) == 1 and runs == leaders
+            assert workers[leaders[0]].status()["jobs"] == {"head": "running"}
+
+            # Releasing the lease lets a follower take over and start the jobs
+            await workers[leaders[0]].stop()
+            await wait_until(lambda: len(runs) == 2)
+            assert runs[1] != leaders[0]
+            assert sum(w.is_leader for w in workers) == 1
+            for worker in workers:
+                await worker.stop()
+
+    asyncio.run(run())
+
+
+def test_follower_takes_over_when_the_leader_process_dies():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            holder = subprocess.Popen([sys.executable, "-c", (
+                "import asyncio, sys\n"
+                "from services.leader import LeaderElection\n"
+                "async def main():\n"
+                f"    leader = LeaderElection('test', {directory!r}, retry_interval=0.02)\n"
+                "    leader.start()\n"
+                "    await asyncio.Event().wait()\n"
+                "asyncio.run(main())\n"
+            )], cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True,
+                env={**os.environ, "PYTHONUNBUFFERED": "1"})
+            try:
+                assert "is now leader" in holder.stdout.readline()
+                follower = LeaderElection("test", directory, retry_interval=0.02)
+                follower.start()
+                await asyncio.sleep(0.1)
+                assert not follower.is_leader and follower.holder() == holder.pid
+
+                # No clean shutdown: the kernel drops the lock with the process
+                os.kill(holder.pid, signal.SIGKILL)
+                holder.wait()
+                await wait_until(lambda: follower.is_leader)
+                assert follower.holder() == os.getpid()
+                await follower.stop()
+            finally:
+                if holder.poll() is None:
+                    holder.kill()
+                holder.stdout.close()
+
+    asyncio.run(run())
+
+
+def test_failed_job_is_restarted():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            attempts = []
+            done = asyncio.Event()
+
+            async def job():
+                attempts.append(1)
+                if len(attempts) == 1:
+                    raise RuntimeError("node unreachable")
+                done.set()
+
+            worker = LeaderElection("test", directory, retry_interval=0.02)
+            worker.register("indexer", job)
+            worker.start()
+            await asyncio.wait_for(done.wait(), 3)
+            assert len(attempts) == 2
+            await worker.stop()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
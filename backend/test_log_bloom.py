@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for logs bloom bit positions and the bloom-filtered log scan
+"""
+
+import asyncio
+
+from eth_hash.auto import keccak
+
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.log_bloom import BLOOM_BYTES, BloomMatcher, bloom_positions, logs_bloom
+from services.log_scanner import LogScanner
+from services.rpc_client import SonicRPCClient
+from services.token_transfers import TRANSFER_TOPIC
+
+
+def reference_bloom(items) -> str:
+    """Yellow paper M3:2048, written the way geth does: set bit (h[i] << 8 | h[i + 1]) & 2047 of a big-endian int"""
+    bloom = 0
+    for item in items:
+        digest = keccak(bytes.fromhex(item[2:]))
+        for i in (0, 2, 4):
+            bloom |= 1 << (((digest[i] << 8) | digest[i + 1]) & 2047)
+    return "0x" + bloom.to_bytes(BLOOM_BYTES, "big").hex()
+
+
+def log_items(logs):
+    return [item for log in logs for item in [log["address"], *log["topics"]]]
+
+
+def test_bit_positions_match_the_spec():
+    simulator = SonicChainSimulator(blocks=20, txs_per_block=5)
+    items = [TRANSFER_TOPIC, simulator.tokens[0], "0x" + "00" * 20, "0x" + "ff" * 32]
+    for item in items:
+        assert logs_bloom([{"address": item, "topics": []}]) == reference_bloom([item])
+        assert len(bloom_positions(bytes.fromhex(item[2:]))) == 3
+    # Whole blocks: every address and topic a block's logs touched
+    assert sum(map(len, simulator._block_logs)) > 0
+    for number in range(simulator.blocks):
+        logs = simulator._block_logs[number]
+        assert logs_bloom(logs) == reference_bloom(log_items(logs))
+        assert simulator._rpc_eth_getBlockByNumber(hex(number))["logsBloom"] == reference_bloom(log_items(logs))
+
+
+def test_matcher_hits_blocks_with_watched_logs_and_skips_the_rest():
+    simulator = SonicChainSimulator(blocks=50, txs_per_block=5)
+    block = simulator._rpc_eth_getBlockByNumber(hex(10))
+    log = simulator._block_logs[10][0]
+    assert BloomMatcher(log["address"], [log["topics"][0]]).may_contain(block["logsBloom"])
+    assert BloomMatcher(log["address"], [None, log["topics"][1]]).may_contain(block["logsBloom"])
+    assert BloomMatcher(topics=[TRANSFER_TOPIC]).may_contain(block["logsBloom"])
+    # Empty blooms and unrelated contracts miss
+    assert not BloomMatcher(topics=[TRANSFER_TOPIC]).may_contain("0x" + "00" * BLOOM_BYTES)
+    unrelated = "0x" + "12" * 20
+    assert unrelated not in log_items(simulator._block_logs[10])
+    assert not BloomMatcher(unrelated).may_contain(reference_bloom(log_items(simulator._block_logs[10])))
+    # A header without a bloom cannot rule anything out
+    assert BloomMatcher(unrelated).may_contain(None)
+
+
+def test_bloom_scan_returns_what_get_logs_returns():
+    async def run():
+        simulator = SonicChainSimulator(blocks=200, txs_per_block=5)
+        token = simulator.tokens[1]
+        by_logs = LogScanner(SonicRPCClient("http://simulator", transport=simulator), token, [TRANSFER_TOPIC],
+                             name="test-logs", initial_range=50)
+        expected = await by_logs.fetch(0, simulator.head)
+
+        simulator = SonicChainSimulator(blocks=200, txs_per_block=5, get_logs=False)
+        by_bloom = LogScanner(SonicRPCClient("http://simulator", transport=simulator), token, [TRANSFER_TOPIC],
+                              name="test-bloom", initial_range=50)
+        found = await by_bloom.fetch(0, simulator.head)
+        assert by_bloom.mode == "bloom"
+        assert expected and found == expected
+        # Only blocks whose bloom may hold the token's transfers had receipts read
+        assert simulator.calls["eth_getBlockReceipts"] < simulator.blocks
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive eth_getLogs scanner against the local RPC simulator
+"""
+
+import asyncio
+import itertools
+
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.log_scanner import LogScanner
+from services.rpc_client import SonicRPCClient
+from services.token_transfers import TRANSFER_TOPIC
+
+_checkpoints = itertools.count()
+
+
+def make_scanner(simulator: SonicChainSimulator, **kwargs) -> LogScanner:
+    rpc = SonicRPCClient("http://simulator", transport=simulator)
+    return LogScanner(rpc, topics=[TRANSFER_TOPIC], name="test", **kwargs)
+
+
+def all_logs(simulator: SonicChainSimulator):
+    limits = simulator.max_log_range, simulator.max_logs
+    simulator.max_log_range = simulator.max_logs = 0
+    logs = simulator._rpc_eth_getLogs({"fromBlock": "0x0", "toBlock": "latest", "topics": [TRANSFER_TOPIC]})
+    simulator.max_log_range, simulator.max_logs = limits
+    return [(log["blockNumber"], log["logIndex"]) for log in logs]
+
+
+async def collect(scanner: LogScanner, start: int, end: int, stop_after=None):
+    windows, logs = [], []
+    async for low, high, found in scanner.scan(start, end):
+        windows.append((low, high))
+        logs.extend((log["blockNumber"], log["logIndex"]) for log in found)
+        if stop_after is not None and len(windows) == stop_after:
+            break
+    return windows, logs
+
+
+def test_refused_windows_are_split_until_the_node_answers():
+    async def run():
+        simulator = SonicChainSimulator(blocks=400, txs_per_block=5, max_log_range=50)
+        scanner = make_scanner(simulator, initial_range=400, max_range=1000)
+        windows, logs = await collect(scanner, 0, simulator.head)
+        assert logs == all_logs(simulator)
+        # Windows tile the range in order
+        assert windows[0][0] == 0 and windows[-1][1] == simulator.head
+        assert all(a[1] + 1 == b[0] for a, b in zip(windows, windows[1:]))
+        # Later windows start small enough instead of being refused again
+        assert scanner.range <= 50 and scanner.ceiling is not None
+
+    asyncio.run(run())
+
+
+def test_provider_suggested_range_is_used():
+    async def run():
+        simulator = SonicChainSimulator(blocks=200, txs_per_block=5)
+        handle = simulator._rpc_eth_getLogs
+
+        def suggesting(criteria):
+            start, end = int(criteria["fromBlock"], 16), int(criteria["toBlock"], 16)
+            if end - start + 1 > 30:
+                raise ValueError(f"query returned more than 10000 results. Try with this block range "
+                                 f"[{hex(start)}, {hex(start + 29)}]")
+            return handle(criteria)
+
+        simulator._rpc_eth_getLogs = suggesting
+        scanner = make_scanner(simulator, initial_range=200, max_range=1000)
+        _, logs = await collect(scanner, 0, simulator.head)
+        assert scanner.range == 30
+        simulator._rpc_eth_getLogs = handle
+        assert logs == all_logs(simulator)
+
+    asyncio.run(run())
+
+
+def test_sparse_results_grow_the_window():
+    async def run():
+        simulator = SonicChainSimulator(blocks=2000, txs_per_block=1)
+        scanner = make_scanner(simulator, initial_range=10, max_range=1000, target_results=100000, concurrency=1)
+        windows, logs = await collect(scanner, 0, simulator.head)
+        assert logs == all_logs(simulator)
+        assert scanner.range > 10
+        assert windows[-1][1] - windows[-1][0] + 1 > windows[0][1] - windows[0][0] + 1
+
+    asyncio.run(run())
+
+
+def test_scan_resumes_after_the_last_handled_window():
+    async def run():
+        simulator = SonicChainSimulator(blocks=300, txs_per_block=5)
+        checkpoint = f"test-scanner-{next(_checkpoints)}"
+        first = make_scanner(simulator, initial_range=50, max_range=50, checkpoint=checkpoint)
+        windows, before = await collect(first, 0, simulator.head, stop_after=3)
+        # The third window was yielded but not handled before the consumer stopped
+        assert await first.resume(0) == windows[1][1] + 1
+
+        second = make_scanner(simulator, initial_range=50, max_range=50, checkpoint=checkpoint)
+        start = await second.resume(0)
+        _, after = await collect(second, start, simulator.head)
+        handled = [log for log in before if int(log[0], 16) < start]
+        assert handled + after == all_logs(simulator)
+        assert await second.checkpoint() == {"from": 0, "through": simulator.head}
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
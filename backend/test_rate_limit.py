@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the RPC token bucket and AIMD concurrency limiter
+"""
+
+import asyncio
+import itertools
+import time
+
+from services.rate_limit import AdaptiveLimiter, TokenBucket
+from services.rpc_client import RPCError
+
+_names = itertools.count()
+
+
+def make_limiter(**kwargs) -> AdaptiveLimiter:
+    return AdaptiveLimiter(f"test-{next(_names)}", rate=0, **kwargs)
+
+
+def test_concurrency_limit_is_enforced_first_in_first_out():
+    async def run():
+        limiter = make_limiter(initial=2, max_limit=2)
+        active, peak, order = 0, 0, []
+
+        async def request(i):
+            nonlocal active, peak
+            async with limiter.slot():
+                active += 1
+                peak = max(peak, active)
+                order.append(i)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(request(i) for i in range(10)))
+        assert peak == 2
+        assert order == list(range(10))
+
+    asyncio.run(run())
+
+
+def test_burst_of_429s_halves_the_limit_once():
+    async def run():
+        limiter = make_limiter(initial=8, min_limit=1, max_limit=64)
+        release = asyncio.Event()
+
+        async def rejected():
+            async with limiter.slot():
+                await release.wait()
+                raise RPCError("eth_call", "Too Many Requests", 429)
+
+        tasks = [asyncio.ensure_future(rejected()) for _ in range(8)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(r, RPCError) for r in results)
+        # All eight were sent before the first decrease, so they count once
+        assert limiter.limit == 4 and limiter.backoffs == 1
+
+        async def timed_out():
+            async with limiter.slot():
+                raise asyncio.TimeoutError()
+
+        try:
+            await timed_out()
+        except asyncio.TimeoutError:
+            pass
+        assert limiter.limit == 2
+
+    asyncio.run(run())
+
+
+def test_limit_grows_additively_only_under_load():
+    async def run():
+        limiter = make_limiter(initial=4, max_limit=64)
+        for _ in range(10):
+            async with limiter.slot():
+                pass
+        # One request at a time never uses the limit, so it doesn't grow
+        assert limiter.limit == 4
+
+        async def request():
+            async with limiter.slot():
+                await asyncio.sleep(0.005)
+
+        await asyncio.gather(*(request() for _ in range(40)))
+        # About one slot per window of requests, not one per request
+        assert 5 <= limiter.limit < 14
+
+    asyncio.run(run())
+
+
+def test_token_bucket_paces_and_pauses():
+    async def run():
+        bucket = TokenBucket(rate=200, burst=1)
+        started = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        assert 0.04 <= time.monotonic() - started < 0.5
+
+        bucket.pause(0.1)
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.09
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Tests for shared receipt polling and drop detection against the local RPC simulator
+"""
+
+import asyncio
+import itertools
+
+import pytest
+from eth_account import Account
+
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.chain_head import HeadFollower
+from services.receipt_waiter import ReceiptWaiter, TransactionDropped
+from services.rpc_client import SonicRPCClient
+
+_networks = itertools.count()
+
+
+class LaggingSimulator(SonicChainSimulator):
+    """Simulator whose receipt lookups miss until a transaction lookup is served, like a lagging endpoint"""
+
+    lagging = True
+
+    def _rpc_eth_getTransactionReceipt(self, tx_hash: str):
+        return None if self.lagging else super()._rpc_eth_getTransactionReceipt(tx_hash)
+
+    def _rpc_eth_getBlockReceipts(self, tag):
+        return [] if self.lagging else super()._rpc_eth_getBlockReceipts(tag)
+
+    def _rpc_eth_getTransactionByHash(self, tx_hash: str):
+        self.lagging = False
+        return super()._rpc_eth_getTransactionByHash(tx_hash)
+
+
+def make_waiter(simulator: SonicChainSimulator, drop_blocks: int = 3) -> ReceiptWaiter:
+    rpc = SonicRPCClient("http://simulator", transport=simulator)
+    # A network name of its own keeps the published head apart from other tests
+    network = f"test-receipts-{next(_networks)}"
+    return ReceiptWaiter(network, rpc, HeadFollower(network, rpc, interval=0.01), drop_blocks=drop_blocks)
+
+
+def send(simulator: SonicChainSimulator, account, nonce: int) -> str:
+    signed = account.sign_transaction({
+        "to": account.address, "value": 1, "nonce": nonce, "gas": 21000, "gasPrice": 10**9,
+        "chainId": int(simulator._rpc_eth_chainId(), 16),
+    })
+    raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+    return simulator._rpc_eth_sendRawTransaction("0x" + bytes(raw).hex())
+
+
+def make_account(simulator: SonicChainSimulator):
+    account = Account.create()
+    simulator.fund(account.address)
+    return account
+
+
+def test_mined_transactions_resolve_in_shared_batches():
+    async def run():
+        simulator = SonicChainSimulator(blocks=10, txs_per_block=1)
+        waiter = make_waiter(simulator)
+        account = make_account(simulator)
+        hashes = [send(simulator, account, nonce) for nonce in range(5)]
+        waits = [asyncio.ensure_future(waiter.wait(h, timeout=5)) for h in hashes]
+        # The same hash awaited twice shares one waiter
+        waits.append(asyncio.ensure_future(waiter.wait(hashes[0], timeout=5)))
+        await asyncio.sleep(0.05)
+        assert waiter.pending == 5
+        number = simulator.mine()
+        receipts = await asyncio.gather(*waits)
+        assert [r["transactionHash"] for r in receipts] == hashes + hashes[:1]
+        assert {r["blockNumber"] for r in receipts} == {hex(number)}
+        assert waiter.pending == 0
+
+    asyncio.run(run())
+
+
+def test_evicted_transaction_is_reported_dropped():
+    async def run():
+        simulator = SonicChainSimulator(blocks=10, txs_per_block=1)
+        waiter = make_waiter(simulator, drop_blocks=3)
+        account = make_account(simulator)
+        tx_hash = send(simulator, account, 0)
+        waiting = asyncio.ensure_future(waiter.wait(tx_hash, timeout=5))
+        await asyncio.sleep(0.05)
+        # The node forgets it (evicted from the pool) before it is mined
+        simulator._pool.clear()
+        simulator._pending.clear()
+        mining = asyncio.ensure_future(simulator.mine_every(0.01))
+        try:
+            with pytest.raises(TransactionDropped) as dropped:
+                await waiting
+        finally:
+            mining.cancel()
+        assert dropped.value.tx_hash == tx_hash
+        assert simulator.calls["eth_getTransactionByHash"] >= 1
+        assert waiter.pending == 0
+
+    asyncio.run(run())
+
+
+def test_transaction_still_in_the_pool_is_not_dropped():
+    async def run():
+        simulator = SonicChainSimulator(blocks=10, txs_per_block=1)
+        waiter = make_waiter(simulator, drop_blocks=3)
+        account = make_account(simulator)
+        # Nonce 1 with no nonce 0 stays queued however many blocks are mined
+        tx_hash = send(simulator, account, 1)
+        mining = asyncio.ensure_future(simulator.mine_every(0.01))
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await waiter.wait(tx_hash, timeout=0.5)
+        finally:
+            mining.cancel()
+        # Asked whether the node still had it, and kept waiting when it did
+        assert simulator.calls["eth_getTransactionByHash"] >= 1
+        assert waiter.pending == 0
+
+    asyncio.run(run())
+
+
+def test_receipt_missed_by_a_lagging_endpoint_is_found():
+    async def run():
+        simulator = LaggingSimulator(blocks=10, txs_per_block=1)
+        waiter = make_waiter(simulator, drop_blocks=3)
+        account = make_account(simulator)
+        tx_hash = send(simulator, account, 0)
+        waiting = asyncio.ensure_future(waiter.wait(tx_hash, timeout=5))
+        await asyncio.sleep(0.05)
+        number = simulator.mine()
+        mining = asyncio.ensure_future(simulator.mine_every(0.01))
+        try:
+            receipt = await waiting
+        finally:
+            mining.cancel()
+        # Found through the drop check's transaction lookup, not reported as dropped
+        assert receipt["blockNumber"] == hex(number)
+        assert simulator.calls["eth_getTransactionByHash"] == 1
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
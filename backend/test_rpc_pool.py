@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tests for RPC endpoint pooling against simulated nodes
+"""
+
+import asyncio
+import time
+
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.rpc_client import RPCError, SonicRPCClient
+from services.rpc_pool import HedgePolicy, RPCPool
+
+
+class Node:
+    """One simulated endpoint: a shared chain behind its own latency, failures and lag"""
+
+    def __init__(self, simulator: SonicChainSimulator, latency: float = 0.001, lag: int = 0):
+        self.simulator = simulator
+        self.latency = latency
+        self.lag = lag
+        self.failing = False
+        # Latency for the next few requests only, e.g. a GC pause
+        self.stalls = []
+        self.requests = 0
+        self.cancelled = 0
+
+    async def __call__(self, payload):
+        self.requests += 1
+        try:
+            await asyncio.sleep(self.stalls.pop(0) if self.stalls else self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.failing:
+            raise OSError("connection refused")
+        reply = await self.simulator(payload)
+        if isinstance(payload, dict) and payload["method"] == "eth_blockNumber":
+            reply["result"] = hex(int(reply["result"], 16) - self.lag)
+        return reply
+
+
+def make_pool(*nodes: Node, **kwargs) -> RPCPool:
+    pool = RPCPool([f"http://node-{i}" for i in range(len(nodes))], **kwargs)
+    for endpoint, node in zip(pool.endpoints, nodes):
+        endpoint.client.http_post = node
+    return pool
+
+
+def test_faster_endpoint_gets_most_traffic():
+    async def run():
+        simulator = SonicChainSimulator(blocks=50, txs_per_block=1)
+        fast, slow = Node(simulator, 0.001), Node(simulator, 0.02)
+        pool = make_pool(fast, slow)
+        rpc = SonicRPCClient("http://pool", transport=pool)
+        for _ in range(10):
+            await asyncio.gather(*(rpc.call("eth_blockNumber") for _ in range(10)))
+        assert pool.endpoints[0].ewma < pool.endpoints[1].ewma
+        assert fast.requests > 3 * slow.requests
+
+    asyncio.run(run())
+
+
+def test_failing_endpoint_is_ejected_and_reads_fail_over():
+    async def run():
+        simulator = SonicChainSimulator(blocks=50, txs_per_block=1)
+        good, bad = Node(simulator), Node(simulator)
+        bad.failing = True
+        pool = make_pool(good, bad, eject_after=3, eject_seconds=0.05)
+        rpc = SonicRPCClient("http://pool", transport=pool)
+        results = [await rpc.call("eth_blockNumber") for _ in range(20)]
+        assert results == [hex(simulator.head)] * 20
+        assert not pool.endpoints[1].healthy
+        served_while_ejected = bad.requests
+        for _ in range(10):
+            await rpc.call("eth_blockNumber")
+        assert bad.requests == served_while_ejected
+
+        # Back from ejection on probation: one more failure doubles the backoff
+        await asyncio.sleep(0.06)
+        while bad.requests == served_while_ejected:
+            await rpc.call("eth_blockNumber")
+        assert pool.endpoints[1].ejections == 2
+        assert pool.endpoints[1].ejected_until - time.monotonic() > 0.05
+
+    asyncio.run(run())
+
+
+def test_writes_are_not_retried_on_another_endpoint():
+    async def run():
+        simulator = SonicChainSimulator(blocks=50, txs_per_block=1)
+        nodes = [Node(simulator), Node(simulator)]
+        for node in nodes:
+            node.failing = True
+        pool = make_pool(*nodes)
+        rpc = SonicRPCClient("http://pool", transport=pool)
+        try:
+            await rpc.call("eth_sendRawTransaction", ["0x00"])
+        except OSError:
+            pass
+        else:
+            raise AssertionError("the send should have failed")
+        assert sum(node.requests for node in nodes) == 1
+
+    asyncio.run(run())
+
+
+def test_lagging_endpoint_is_ejected_by_health_check():
+    async def run():
+        simulator = SonicChainSimulator(blocks=50, txs_per_block=1)
+        pool = make_pool(Node(simulator), Node(simulator, lag=30), max_block_lag=20)
+        await pool.health_check()
+        assert pool.endpoints[0].healthy and not pool.endpoints[1].healthy
+        assert pool.endpoints[1].head == simulator.head - 30
+
+    asyncio.run(run())
+
+
+def test_hedge_budget_caps_extra_requests():
+    policy = HedgePolicy(enabled=True, budget_pct=5, min_samples=1)
+    hedges = 0
+    for _ in range(1000):
+        policy.delay("eth_getBalance")
+        hedges += policy.acquire()
+    # At most budget_pct of eligible requests (plus the small bucket) are duplicated
+    assert 45 <= hedges <= 50
+    assert policy.denied == 1000 - hedges
+
+
+def test_hedge_delay_tracks_the_latency_percentile():
+    policy = HedgePolicy(enabled=True, percentile=90, min_samples=20, min_delay=0.001)
+    assert policy.delay("eth_getBalance") is None
+    for i in range(100):
+        policy.observe("eth_getBalance", 0.010 if i % 10 else 0.200)
+    assert policy.delay("eth_getBalance") == 0.2
+    for _ in range(32):
+        policy.observe("eth_getBalance", 0.010)
+    assert policy.delay("eth_getBalance") < 0.2
+
+
+def test_slow_read_is_hedged_to_another_endpoint():
+    async def run():
+        simulator = SonicChainSimulator(blocks=50, txs_per_block=1)
+        nodes = [Node(simulator, 0.002), Node(simulator, 0.002)]
+        policy = HedgePolicy(enabled=True, budget_pct=100, min_samples=10, min_delay=0.001)
+        pool = make_pool(*nodes, hedging=policy)
+        rpc = SonicRPCClient("http://pool", transport=pool)
+        address = simulator.sample_address(1)
+        for _ in range(20):
+            await rpc.call("eth_getBalance", [address, "latest"])
+
+        # Whichever endpoint gets the next request stalls on it
+        nodes[0].stalls = nodes[1].stalls = [1.0]
+        started = time.perf_counter()
+        balance = await rpc.call("eth_getBalance", [address, "latest"])
+        assert balance == simulator._rpc_eth_getBalance(address)
+        # Answered by the duplicate, not after the stall; the stalled request was cancelled
+        assert time.perf_counter() - started < 0.5
+        await asyncio.sleep(0)  # let the cancelled request unwind
+        assert policy.won == 1 and sum(node.cancelled for node in nodes) == 1
+
+        # Writes are never duplicated
+        nodes[0].stalls = nodes[1].stalls = [0.05]
+        requests = sum(node.requests for node in nodes)
+        try:
+            await rpc.call("eth_sendRawTransaction", ["0x00"])
+        except RPCError:
+            pass  # the simulator can't decode it; only the request count matters
+        assert sum(node.requests for node in nodes) == requests + 1
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for ERC-20 token metadata lookups against the local RPC simulator
+"""
+
+import asyncio
+import itertools
+
+from benchmarks.rpc_simulator import SonicChainSimulator
+from services.chain_head import HeadFollower
+from services.rpc_client import SonicRPCClient
+from services.token_transfers import HEADER_BATCH, TokenTransferIndexer
+
+_networks = itertools.count()
+
+
+class RevertingSimulator(SonicChainSimulator):
+    """Simulator whose non-token contracts revert, and whose eth_calls can be made to fail"""
+
+    failing = False
+
+    def _handle(self, request):
+        if request.get("method") == "eth_call":
+            if self.failing:
+                self.calls["eth_call"] += 1
+                return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": 429, "message": "rate limited"}}
+            if request["params"][0]["to"].lower() not in self.tokens:
+                self.calls["eth_call"] += 1
+                return {"jsonrpc": "2.0", "id": request.get("id"),
+                        "error": {"code": 3, "message": "execution reverted"}}
+        return super()._handle(request)
+
+
+def make_indexer(simulator: SonicChainSimulator) -> TokenTransferIndexer:
+    rpc = SonicRPCClient("http://simulator", transport=simulator)
+    # A network name of its own keeps cached metadata apart from other tests
+    network = f"test-tokens-{next(_networks)}"
+    return TokenTransferIndexer(network, rpc, HeadFollower(network, rpc))
+
+
+def test_metadata_lookups_stay_under_the_batch_cap():
+    async def run():
+        simulator = RevertingSimulator(blocks=2, txs_per_block=1, max_batch=HEADER_BATCH)
+        indexer = make_indexer(simulator)
+        others = ["0x" + f"{i:040x}" for i in range(1, HEADER_BATCH)]
+        info = await indexer.token_info(simulator.tokens + others)
+        assert simulator.calls["rejected_batch"] == 0
+        assert info[simulator.tokens[0]] == {"decimals": 18, "symbol": "TK0"}
+        # Reverts are definite: remembered as no metadata, not asked again
+        assert info[others[0]] == {"decimals": None, "symbol": None}
+        simulator.reset_counters()
+        await indexer.token_info(simulator.tokens + others)
+        assert simulator.calls["eth_call"] == 0
+
+    asyncio.run(run())
+
+
+def test_transient_failures_are_not_cached():
+    async def run():
+        simulator = RevertingSimulator(blocks=2, txs_per_block=1)
+        indexer = make_indexer(simulator)
+        token = simulator.tokens[0]
+        simulator.failing = True
+        assert (await indexer.token_info([token]))[token] == {"decimals": None, "symbol": None}
+        simulator.failing = False
+        assert (await indexer.token_info([token]))[token] == {"decimals": 18, "symbol": "TK0"}
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")